@@ -1,20 +1,56 @@
-from flask import Flask
-from flask_cors import CORS
+import os
+import sys
+from quart import Quart, jsonify
+from quart_cors import cors
+
+# 嵌入模块使用平铺导入（如 from vector_embedding import ...），需要把所在目录加入模块搜索路径
+EMBEDDING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'embedding')
+if EMBEDDING_DIR not in sys.path:
+    sys.path.insert(0, EMBEDDING_DIR)
 
 def create_app():
-    app = Flask(__name__)
-    CORS(app)  # 允许所有来源的跨域请求，生产环境中应配置更严格的规则
+    app = Quart(__name__)
+    app = cors(app, allow_origin="*")  # 允许所有来源的跨域请求，生产环境中应配置更严格的规则
 
     # 导入并注册蓝图
     from backend.search.routes import search_bp
+    from vector_search_api import SearchServices, embedding_bp
     app.register_blueprint(search_bp, url_prefix='/api') # 所有搜索相关的API都在 /api/ 下
+    app.register_blueprint(embedding_bp, url_prefix='/api') # 搜索、权重、初始化和健康检查
+
+    from backend.search.streaming_service import set_option_encoder
+    services = SearchServices()
+    # AI筛选提示按查询裁剪选项时改用已加载的嵌入模型；每次（重新）加载后绑定新的处理器，
+    # 不再引用旧模型，查询经过查询向量缓存和微批编码器
+    services.load_callbacks.append(lambda vec_processor: set_option_encoder(vec_processor.encode_texts))
+    app.extensions["search_services"] = services
+
+    @app.before_serving
+    async def load_search_services():
+        # 在开始接受请求之前加载嵌入模型、内存索引和缓存并预热，第一个用户请求不再等待模型加载
+        await services.start()
+
+    @app.after_serving
+    async def close_clients():
+        # 关闭进程内共享的LLM客户端连接池、异步MongoDB客户端和搜索线程池
+        from backend.search.llm_client import close_async_llm_client
+        await close_async_llm_client()
+        await services.close()
 
     @app.route('/health')
-    def health():
+    async def health():
         return "Backend is healthy!"
 
+    @app.route('/ready')
+    async def ready():
+        # 就绪探针：模型、索引和缓存加载并预热完成前返回503，负载均衡不会把流量发给未预热的进程
+        status = 200 if services.ready else 503
+        return jsonify({"ready": services.ready, "error": services.error}), status
+
     return app
 
 if __name__ == '__main__':
+    # 开发环境直接运行；生产环境使用ASGI服务器：hypercorn "backend.app:create_app()" --bind 0.0.0.0:5000
+    # 多核部署使用预分叉的多工作进程模式：python -m backend.serve --workers 4
     app = create_app()
-    app.run(debug=True, port=5000) # 注意：debug=True 不应在生产环境中使用 
\ No newline at end of file
+    app.run(debug=True, port=5000) # 注意：debug=True 不应在生产环境中使用
@@ -0,0 +1,116 @@
+"""检查搜索请求是否阻塞事件循环：并发搜索时请求是否交错执行、其他请求是否仍能及时响应
+
+先以单个工作进程启动服务（多个工作进程时请求会分散到不同进程，无法说明单个事件循环的情况）：
+
+    python -m backend.serve --workers 1 --bind 127.0.0.1:5000
+    python -m backend.benchmark_event_loop --concurrency 32 --requests 256
+
+依次测量：
+- 空闲时 /health 的延迟（探测请求，不做任何计算）
+- 串行搜索（并发1）的吞吐量和延迟
+- 并发搜索的吞吐量和延迟，同时持续发送探测请求
+
+处理函数不阻塞事件循环时，并发搜索期间探测请求的延迟接近空闲时，并发吞吐量明显高于串行；
+处理函数在协程中直接执行同步的编码和MongoDB查询时，探测请求要排在正在执行的搜索之后，延迟接近搜索延迟。
+不依赖服务的自动化检查见 backend/tests/test_search_overlap.py。
+每个搜索请求使用不同的查询，避免命中查询向量缓存。
+"""
+import argparse
+import asyncio
+import sys
+import time
+import httpx
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else float("nan")
+
+
+async def probe(client: httpx.AsyncClient, base_url: str, stop: asyncio.Event, interval: float):
+    """持续请求 /health，返回延迟列表"""
+    latencies = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get(f"{base_url}/health")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def run_searches(client: httpx.AsyncClient, base_url: str, params: dict, count: int, concurrency: int, tag: str):
+    """以固定并发发送count个搜索请求，返回 (耗时, 延迟列表, 失败数)"""
+    latencies = []
+    failures = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index, failures
+        while next_index < count:
+            index = next_index
+            next_index += 1
+            start = time.perf_counter()
+            response = await client.get(f"{base_url}/api/search", params={**params, "query": f"{params['query']} {tag}{index}"})
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return time.perf_counter() - start, latencies, failures
+
+
+async def main_async(args):
+    base_url = args.url.rstrip('/')
+    params = {"query": args.query, "top_k": "10", "fields": "program_name,university",
+              "use_vector": str(args.mode == "vector").lower(), "use_llm": str(args.mode == "llm").lower()}
+    limits = httpx.Limits(max_connections=args.concurrency + 4, max_keepalive_connections=args.concurrency + 4)
+    async with httpx.AsyncClient(limits=limits, timeout=120.0) as client:
+        ready = await client.get(f"{base_url}/ready")
+        if ready.status_code != 200:
+            sys.exit(f"服务未就绪: {ready.text}")
+
+        stop = asyncio.Event()
+        idle_task = asyncio.create_task(probe(client, base_url, stop, args.probe_interval))
+        await asyncio.sleep(1.0)
+        stop.set()
+        idle_probe = await idle_task
+
+        serial_seconds, serial_latencies, serial_failures = await run_searches(
+            client, base_url, params, max(1, args.requests // 8), 1, "s")
+
+        stop = asyncio.Event()
+        probe_task = asyncio.create_task(probe(client, base_url, stop, args.probe_interval))
+        seconds, latencies, failures = await run_searches(client, base_url, params, args.requests, args.concurrency, "c")
+        stop.set()
+        loaded_probe = await probe_task
+
+        health = (await client.get(f"{base_url}/api/health")).json()
+
+    serial_qps = len(serial_latencies) / serial_seconds
+    concurrent_qps = len(latencies) / seconds
+    print(f"探测请求（空闲）     p50 {percentile(idle_probe, 0.5):7.1f}ms  p99 {percentile(idle_probe, 0.99):7.1f}ms")
+    print(f"串行搜索             QPS {serial_qps:7.1f}  p50 {percentile(serial_latencies, 0.5):7.1f}ms  "
+          f"p99 {percentile(serial_latencies, 0.99):7.1f}ms  失败 {serial_failures}")
+    print(f"并发搜索（{args.concurrency:>3}）      QPS {concurrent_qps:7.1f}  p50 {percentile(latencies, 0.5):7.1f}ms  "
+          f"p99 {percentile(latencies, 0.99):7.1f}ms  失败 {failures}  相对串行 {concurrent_qps / serial_qps:4.1f}x")
+    print(f"探测请求（并发搜索中） p50 {percentile(loaded_probe, 0.5):7.1f}ms  p99 {percentile(loaded_probe, 0.99):7.1f}ms")
+    encoder = health.get("query_encoder") or {}
+    if encoder:
+        print(f"查询编码平均批大小: {encoder.get('mean_batch_size', 0):.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查搜索请求是否阻塞事件循环")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="服务地址")
+    parser.add_argument("--mode", choices=["vector", "keyword", "llm"], default="vector", help="搜索方式")
+    parser.add_argument("--query", default="business analytics master")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=256, help="并发阶段的搜索请求数量")
+    parser.add_argument("--probe-interval", type=float, default=0.01, help="探测请求的间隔（秒）")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""预分叉多工作进程的内存占用与QPS扩展测试
+
+依次以1/2/4/8个工作进程启动 backend.serve，等待 /ready 后读取每个进程的内存统计，
+再以固定并发对搜索端点压测一段时间：
+
+    python -m backend.benchmark_workers --workers 1,2,4,8 --duration 20 --concurrency 32
+    python -m backend.benchmark_workers --workers 1,2,4,8 --no-preload   # 对比每个进程各自加载模型
+
+内存统计来自 /proc/<pid>/smaps_rollup（仅Linux）：
+- RSS：进程映射的物理内存，共享页会在每个进程中重复计算
+- PSS：共享页按共享进程数平摊后的内存，所有进程的PSS之和是真实的总占用
+- USS：进程独占的内存（Private_Clean + Private_Dirty），即每增加一个工作进程的额外开销
+每个请求使用不同的查询，避免命中查询向量缓存，测得的是编码和打分的真实吞吐量。
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+import httpx
+
+
+def read_memory(pid: int):
+    """读取进程的 (RSS, PSS, USS)，单位MB"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1]) / 1024
+    uss = values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0)
+    return values.get("Rss", 0.0), values.get("Pss", 0.0), uss
+
+
+def child_pids(pid: int):
+    with open(f"/proc/{pid}/task/{pid}/children", 'r') as f:
+        return [int(child) for child in f.read().split()]
+
+
+async def wait_ready(base_url: str, workers: int, timeout: float) -> bool:
+    """等待 /ready 连续返回200（请求会分散到不同的工作进程，多次成功才说明全部就绪）"""
+    deadline = time.monotonic() + timeout
+    successes = 0
+    async with httpx.AsyncClient(timeout=5.0) as client:
+        while time.monotonic() < deadline:
+            try:
+                response = await client.get(f"{base_url}/ready")
+                successes = successes + 1 if response.status_code == 200 else 0
+            except httpx.HTTPError:
+                successes = 0
+            if successes >= workers * 4:
+                return True
+            await asyncio.sleep(0.5)
+    return False
+
+
+async def run_load(url: str, concurrency: int, duration: float, use_vector: bool):
+    """以固定并发持续发送请求，返回 (完成的请求数, 失败数, 延迟列表)"""
+    latencies = []
+    failures = 0
+    counter = 0
+    deadline = time.monotonic() + duration
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal failures, counter
+        while time.monotonic() < deadline:
+            counter += 1
+            params = {"query": f"business analytics master {counter}", "use_vector": str(use_vector).lower(),
+                      "top_k": "10", "fields": "program_name,university"}
+            start = time.perf_counter()
+            try:
+                response = await client.get(url, params=params)
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    failures += 1
+            except httpx.HTTPError:
+                failures += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60.0) as client:
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+    return len(latencies), failures, sorted(latencies)
+
+
+def run_level(args, workers: int):
+    base_url = f"http://127.0.0.1:{args.port}"
+    command = [sys.executable, "-m", "backend.serve", "--workers", str(workers), "--bind", f"127.0.0.1:{args.port}"]
+    if args.no_preload:
+        command.append("--no-preload")
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not asyncio.run(wait_ready(base_url, workers, args.ready_timeout)):
+            print(f"工作进程 {workers}: 在 {args.ready_timeout}s 内未就绪，跳过")
+            return
+
+        pids = [server.pid] + child_pids(server.pid)
+        memory = [read_memory(pid) for pid in pids]
+        parent_rss, parent_pss, parent_uss = memory[0]
+        worker_memory = memory[1:]
+        total_pss = sum(pss for _, pss, _ in memory)
+        total_rss = sum(rss for rss, _, _ in memory)
+        worker_uss = sum(uss for _, _, uss in worker_memory) / max(1, len(worker_memory))
+
+        completed, failures, latencies = asyncio.run(
+            run_load(f"{base_url}/api/search", args.concurrency, args.duration, not args.keyword))
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else float("nan")
+
+        print(f"工作进程 {workers:>2}: QPS {completed / args.duration:8.1f}  失败 {failures:>4}  "
+              f"p50 {percentile(0.5):7.1f}ms p99 {percentile(0.99):7.1f}ms   "
+              f"RSS合计 {total_rss:8.0f}MB  PSS合计 {total_pss:8.0f}MB  "
+              f"父进程USS {parent_uss:6.0f}MB  每个工作进程USS {worker_uss:6.0f}MB")
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="预分叉多工作进程的内存占用与QPS扩展测试")
+    parser.add_argument("--workers", default="1,2,4,8", help="以逗号分隔的工作进程数量")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--concurrency", type=int, default=32, help="压测的并发请求数")
+    parser.add_argument("--duration", type=float, default=20.0, help="每个级别的压测时长（秒）")
+    parser.add_argument("--ready-timeout", type=float, default=300.0, help="等待就绪的最长时间（秒）")
+    parser.add_argument("--keyword", action="store_true", help="压测关键词搜索而不是向量搜索")
+    parser.add_argument("--no-preload", action="store_true", help="每个工作进程各自加载模型（对比内存占用）")
+    args = parser.parse_args()
+
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        sys.exit("内存统计需要Linux的 /proc/<pid>/smaps_rollup")
+
+    for workers in [int(value) for value in args.workers.split(",")]:
+        run_level(args, workers)
+
+
+if __name__ == "__main__":
+    main()
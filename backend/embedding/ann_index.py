@@ -0,0 +1,295 @@
+import os
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+from vector_index import ExactVectorIndex, normalize_rows
+from quantization import Int8VectorIndex, PQVectorIndex
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+# 向量索引类型：exact（精确扫描）、ivf（IVF-Flat）、hnsw（需要安装hnswlib）、
+# int8 / pq（量化编码打分 + 全精度重新打分）
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "exact")
+# 需要mmap嵌入快照作为全精度向量来源的量化索引类型
+QUANTIZED_INDEX_TYPES = ("int8", "pq")
+
+# IVF-Flat参数
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # 聚类中心数量，0表示按 4·sqrt(N) 自动确定
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))  # 查询时探测的聚类数量，越大召回越高、延迟越高
+IVF_TRAIN_SAMPLE = 50000  # 训练聚类中心时最多使用的样本数
+IVF_TRAIN_ITERATIONS = 20
+
+# HNSW参数
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))  # 查询时的候选队列长度，越大召回越高、延迟越高
+
+
+def _spherical_kmeans(data: np.ndarray, nlist: int, iterations: int = IVF_TRAIN_ITERATIONS,
+                      seed: int = 0, chunk_size: int = 8192) -> np.ndarray:
+    """在单位向量上训练球面k-means，返回归一化的聚类中心 (nlist, D)"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _assign(data, centroids, chunk_size)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, data)
+        counts = np.bincount(assignments, minlength=nlist)
+        # 空的聚类重新随机选一个样本作为中心
+        empty = np.flatnonzero(counts == 0)
+        if len(empty) > 0:
+            sums[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+        centroids = normalize_rows(sums).astype(np.float32)
+    return centroids
+
+
+def _assign(data: np.ndarray, centroids: np.ndarray, chunk_size: int = 8192) -> np.ndarray:
+    """分块计算每个向量最近（内积最大）的聚类中心"""
+    assignments = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), chunk_size):
+        assignments[start:start + chunk_size] = np.argmax(data[start:start + chunk_size] @ centroids.T, axis=1)
+    return assignments
+
+
+class IVFFlatIndex:
+    """IVF-Flat近似最近邻索引
+
+    用球面k-means把向量划分为nlist个倒排列表，查询时只扫描与查询最接近的nprobe个列表。
+    候选向量直接使用ExactVectorIndex中的矩阵（可以是mmap快照）计算精确内积，不额外保存向量副本。
+    """
+
+    kind = "ivf"
+
+    def __init__(self, base: ExactVectorIndex, centroids: np.ndarray, list_offsets: np.ndarray,
+                 list_rows: np.ndarray, nprobe: int = IVF_NPROBE):
+        """初始化索引
+
+        Args:
+            base: 提供ID和向量矩阵的精确索引
+            centroids: 聚类中心 (nlist, D)
+            list_offsets: 长度为nlist+1的倒排列表偏移
+            list_rows: 按聚类排序的行号，第c个列表为 list_rows[list_offsets[c]:list_offsets[c+1]]
+            nprobe: 默认探测的聚类数量
+        """
+        self.base = base
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.list_offsets = np.asarray(list_offsets, dtype=np.int64)
+        self.list_rows = np.asarray(list_rows, dtype=np.int64)
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, base: ExactVectorIndex, nlist: int = IVF_NLIST, nprobe: int = IVF_NPROBE,
+              train_sample: int = IVF_TRAIN_SAMPLE, seed: int = 0) -> "IVFFlatIndex":
+        """从精确索引离线构建IVF索引"""
+        count = len(base)
+        if nlist <= 0:
+            nlist = max(1, int(4 * np.sqrt(count)))
+        nlist = min(nlist, count)
+
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(count, min(train_sample, count), replace=False))
+        centroids = _spherical_kmeans(np.asarray(base.matrix[sample_rows]), nlist, seed=seed)
+
+        assignments = _assign(base.matrix, centroids)
+        list_rows = np.argsort(assignments, kind="stable")
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=nlist))])
+        return cls(base, centroids, list_offsets, list_rows, nprobe)
+
+    def __len__(self) -> int:
+        return len(self.base)
+
+    @property
+    def dimension(self) -> int:
+        return self.base.dimension
+
+    @property
+    def indexed_count(self) -> int:
+        """倒排列表中的向量数量"""
+        return len(self.list_rows)
+
+    def positions_of(self, doc_ids) -> np.ndarray:
+        return self.base.positions_of(doc_ids)
+
+    def scores(self, query_vec: np.ndarray, field_weights: Optional[Dict[str, float]] = None,
+               positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """对指定文档打分（如LLM搜索的候选集），直接使用精确索引"""
+        return self.base.scores(query_vec, field_weights, positions)
+
+    def search(self, query_vec: np.ndarray, top_k: int = 5, field_weights: Optional[Dict[str, float]] = None,
+               nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """近似搜索与查询向量最相似的文档
+
+        Args:
+            query_vec: 查询向量
+            top_k: 返回结果数量
+            field_weights: 指定时退回精确索引的查询时加权搜索（IVF只基于整体嵌入构建）
+            nprobe: 本次查询探测的聚类数量，默认使用self.nprobe
+
+        Returns:
+            (文档ID数组, 相似度数组)，按相似度从高到低排序
+        """
+        if field_weights:
+            return self.base.search(query_vec, top_k, field_weights)
+        if len(self) == 0 or top_k <= 0:
+            return np.array([], dtype=object), np.array([], dtype=np.float32)
+
+        query = ExactVectorIndex._normalize_query(query_vec)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        centroid_scores = self.centroids @ query
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        rows = np.concatenate([self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probes])
+        if len(rows) == 0:
+            return np.array([], dtype=object), np.array([], dtype=np.float32)
+
+        scores = self.base.matrix[rows] @ query
+        top = ExactVectorIndex._top_k_indices(scores, top_k)
+        return self.base.ids[rows[top]], scores[top]
+
+    def save(self, path: str) -> None:
+        """保存聚类中心和倒排列表（不包含向量本身）"""
+        np.savez(path, centroids=self.centroids, list_offsets=self.list_offsets, list_rows=self.list_rows)
+
+    @classmethod
+    def load(cls, path: str, base: ExactVectorIndex, nprobe: int = IVF_NPROBE) -> "IVFFlatIndex":
+        with np.load(path) as data:
+            return cls(base, data["centroids"], data["list_offsets"], data["list_rows"], nprobe)
+
+
+class HNSWIndex:
+    """基于hnswlib的HNSW近似最近邻索引（内积空间）"""
+
+    kind = "hnsw"
+
+    def __init__(self, base: ExactVectorIndex, graph: Any, ef_search: int = HNSW_EF_SEARCH):
+        """初始化索引
+
+        Args:
+            base: 提供ID的精确索引，图中节点标签即其行号
+            graph: hnswlib.Index实例
+            ef_search: 默认的查询候选队列长度
+        """
+        self.base = base
+        self.graph = graph
+        self.ef_search = ef_search
+
+    @staticmethod
+    def _require_hnswlib() -> None:
+        if hnswlib is None:
+            raise ImportError("使用HNSW索引需要安装hnswlib: pip install hnswlib")
+
+    @classmethod
+    def build(cls, base: ExactVectorIndex, m: int = HNSW_M, ef_construction: int = HNSW_EF_CONSTRUCTION,
+              ef_search: int = HNSW_EF_SEARCH) -> "HNSWIndex":
+        """从精确索引离线构建HNSW图"""
+        cls._require_hnswlib()
+        graph = hnswlib.Index(space='ip', dim=base.dimension)
+        graph.init_index(max_elements=len(base), ef_construction=ef_construction, M=m)
+        graph.add_items(np.asarray(base.matrix), np.arange(len(base)))
+        return cls(base, graph, ef_search)
+
+    def __len__(self) -> int:
+        return len(self.base)
+
+    @property
+    def dimension(self) -> int:
+        return self.base.dimension
+
+    @property
+    def indexed_count(self) -> int:
+        """图中的节点数量"""
+        return self.graph.get_current_count()
+
+    def positions_of(self, doc_ids) -> np.ndarray:
+        return self.base.positions_of(doc_ids)
+
+    def scores(self, query_vec: np.ndarray, field_weights: Optional[Dict[str, float]] = None,
+               positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """对指定文档打分（如LLM搜索的候选集），直接使用精确索引"""
+        return self.base.scores(query_vec, field_weights, positions)
+
+    def search(self, query_vec: np.ndarray, top_k: int = 5, field_weights: Optional[Dict[str, float]] = None,
+               ef_search: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """近似搜索与查询向量最相似的文档
+
+        Args:
+            query_vec: 查询向量
+            top_k: 返回结果数量
+            field_weights: 指定时退回精确索引的查询时加权搜索（HNSW只基于整体嵌入构建）
+            ef_search: 本次查询的候选队列长度，默认使用self.ef_search
+
+        Returns:
+            (文档ID数组, 相似度数组)，按相似度从高到低排序
+        """
+        if field_weights:
+            return self.base.search(query_vec, top_k, field_weights)
+        if len(self) == 0 or top_k <= 0:
+            return np.array([], dtype=object), np.array([], dtype=np.float32)
+
+        query = ExactVectorIndex._normalize_query(query_vec)
+        k = min(top_k, len(self))
+        self.graph.set_ef(max(ef_search or self.ef_search, k))
+        labels, distances = self.graph.knn_query(query, k=k)
+        # hnswlib的ip距离为 1 - 内积
+        return self.base.ids[labels[0].astype(np.int64)], (1.0 - distances[0]).astype(np.float32)
+
+    def save(self, path: str) -> None:
+        self.graph.save_index(path)
+
+    @classmethod
+    def load(cls, path: str, base: ExactVectorIndex, ef_search: int = HNSW_EF_SEARCH) -> "HNSWIndex":
+        cls._require_hnswlib()
+        graph = hnswlib.Index(space='ip', dim=base.dimension)
+        graph.load_index(path, max_elements=len(base))
+        return cls(base, graph, ef_search)
+
+
+ANN_INDEX_CLASSES = {
+    "ivf": (IVFFlatIndex, "npz"),
+    "hnsw": (HNSWIndex, "bin"),
+    "int8": (Int8VectorIndex, "npz"),
+    "pq": (PQVectorIndex, "npz"),
+}
+
+
+def build_ann_index(kind: str, base: ExactVectorIndex, **params):
+    """按类型构建近似最近邻索引"""
+    if kind not in ANN_INDEX_CLASSES:
+        raise ValueError(f"不支持的向量索引类型: {kind}")
+    print(f"正在构建 {kind} 索引，共 {len(base)} 个向量...")
+    return ANN_INDEX_CLASSES[kind][0].build(base, **params)
+
+
+def ann_index_path(snapshot_dir: str, kind: str, version: str) -> str:
+    """近似索引文件路径，与所基于的嵌入快照版本绑定"""
+    return os.path.join(snapshot_dir, f"ann-{kind}-{version}.{ANN_INDEX_CLASSES[kind][1]}")
+
+
+def save_ann_index(index, snapshot_dir: str, version: str) -> str:
+    """将近似索引保存到快照目录，并删除同类型的旧版本"""
+    path = ann_index_path(snapshot_dir, index.kind, version)
+    index.save(path)
+    for name in os.listdir(snapshot_dir):
+        if name.startswith(f"ann-{index.kind}-") and os.path.join(snapshot_dir, name) != path:
+            try:
+                os.remove(os.path.join(snapshot_dir, name))
+            except OSError:
+                pass
+    print(f"已保存 {index.kind} 索引: {path}")
+    return path
+
+
+def load_ann_index(kind: str, base: ExactVectorIndex, snapshot_dir: str, version: Optional[str]):
+    """加载与快照版本匹配的近似索引，不存在时返回None"""
+    if kind not in ANN_INDEX_CLASSES or version is None:
+        return None
+    path = ann_index_path(snapshot_dir, kind, version)
+    if not os.path.exists(path):
+        return None
+    index = ANN_INDEX_CLASSES[kind][0].load(path, base)
+    if index.indexed_count != len(base):
+        print(f"{kind} 索引与嵌入快照的向量数量不一致，忽略")
+        return None
+    print(f"已加载 {kind} 索引: {path}")
+    return index
@@ -0,0 +1,168 @@
+import asyncio
+import concurrent.futures
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+# 查询编码的微批处理配置
+QUERY_BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", "3")) # 第一条查询到达后最多等待多久凑批（毫秒）
+QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", "32")) # 每批最多的查询数量，达到后立即编码
+
+_STOP = None # 通知编码线程退出
+
+
+class MicroBatchEncoder:
+    """查询编码的微批处理：把短时间内并发到达的单条查询合并为一次批量编码，再把结果分发给各个请求
+
+    每个请求提交一条查询并等待自己的Future；后台编码线程取出第一条查询后，
+    在它到达后的 window_ms 内继续收集查询（或收满 max_batch_size 条），调用一次 encode 完成整批编码。
+    上一批编码期间到达的查询已经超过等待窗口，下一批会立即编码，单个请求增加的延迟不超过窗口长度。
+    window_ms 为0时不等待，只合并已经在排队的查询。
+
+    编码线程在第一次提交时启动；fork之后的子进程会创建自己的队列和编码线程。
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray],
+                 window_ms: float = QUERY_BATCH_WINDOW_MS, max_batch_size: int = QUERY_BATCH_MAX_SIZE):
+        """初始化微批编码器
+
+        Args:
+            encode: 批量编码函数，输入文本列表，返回 (N, D) 的向量矩阵（如 model.encode）
+            window_ms: 凑批的等待窗口（毫秒）
+            max_batch_size: 每批最多的查询数量
+        """
+        self.encode_batch = encode
+        self.window_ms = window_ms
+        self.max_batch_size = max(1, max_batch_size)
+        self._queue: Optional[queue.SimpleQueue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+        # 统计数据
+        self.batches = 0
+        self.items = 0
+        self.unique_items = 0
+        self.errors = 0
+        self.largest_batch = 0
+        self.queue_wait_seconds = 0.0
+        self.max_queue_wait_seconds = 0.0
+        self.encode_seconds = 0.0
+        self.batch_sizes: Dict[int, int] = {}
+
+    def _ensure_worker(self) -> queue.SimpleQueue:
+        """返回当前进程的提交队列，需要时启动编码线程"""
+        pid = os.getpid()
+        with self._lock:
+            if self._thread is None or self._pid != pid:
+                self._queue = queue.SimpleQueue()
+                self._pid = pid
+                self._thread = threading.Thread(target=self._run, args=(self._queue,),
+                                                name="query-batch-encoder", daemon=True)
+                self._thread.start()
+            return self._queue
+
+    def submit(self, text: str) -> concurrent.futures.Future:
+        """提交一条查询，返回其向量的Future"""
+        future = concurrent.futures.Future()
+        self._ensure_worker().put((text, future, time.perf_counter()))
+        return future
+
+    def encode(self, text: str) -> np.ndarray:
+        """编码一条查询（阻塞直到所在的批次完成），用于工作线程中的同步调用"""
+        return self.submit(text).result()
+
+    async def encode_async(self, text: str) -> np.ndarray:
+        """编码一条查询，等待期间不阻塞事件循环"""
+        return await asyncio.wrap_future(self.submit(text))
+
+    def close(self) -> None:
+        """在已提交的查询编码完成后停止编码线程（如重新加载时替换掉的旧编码器）
+
+        之后再提交的查询会启动新的编码线程，不会丢失。
+        """
+        with self._lock:
+            if self._queue is not None and self._pid == os.getpid():
+                self._queue.put(_STOP)
+            self._queue = None
+            self._thread = None
+
+    def _collect(self, pending: queue.SimpleQueue) -> Tuple[List[Tuple[str, concurrent.futures.Future, float]], bool]:
+        """收集一批查询，返回 (批次, 是否收到停止信号)"""
+        first = pending.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = first[2] + self.window_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = pending.get(timeout=remaining) if remaining > 0 else pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self, pending: queue.SimpleQueue) -> None:
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect(pending)
+            # 跳过已取消的请求（如客户端断开）
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if batch:
+                self._encode(batch)
+
+    def _encode(self, batch: List[Tuple[str, concurrent.futures.Future, float]]) -> None:
+        """编码一批查询并把结果分发给等待的请求，同一批中的重复查询只编码一次"""
+        started = time.perf_counter()
+        rows: Dict[str, int] = {}
+        for text, _, _ in batch:
+            rows.setdefault(text, len(rows))
+        try:
+            vectors = np.asarray(self.encode_batch(list(rows)), dtype=np.float32)
+            if vectors.ndim == 1:
+                vectors = vectors.reshape(1, -1)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        finished = time.perf_counter()
+
+        for text, future, _ in batch:
+            future.set_result(vectors[rows[text]])
+
+        waits = [started - submitted for _, _, submitted in batch]
+        with self._lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.unique_items += len(rows)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.queue_wait_seconds += sum(waits)
+            self.max_queue_wait_seconds = max(self.max_queue_wait_seconds, max(waits))
+            self.encode_seconds += finished - started
+            self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """返回微批处理的统计数据"""
+        with self._lock:
+            return {
+                "window_ms": self.window_ms,
+                "max_batch_size": self.max_batch_size,
+                "batches": self.batches,
+                "items": self.items,
+                "unique_items": self.unique_items,
+                "errors": self.errors,
+                "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+                "mean_queue_wait_ms": self.queue_wait_seconds / self.items * 1000 if self.items else 0.0,
+                "max_queue_wait_ms": self.max_queue_wait_seconds * 1000,
+                "mean_encode_ms": self.encode_seconds / self.batches * 1000 if self.batches else 0.0,
+                "batch_sizes": {str(size): count for size, count in sorted(self.batch_sizes.items())}
+            }
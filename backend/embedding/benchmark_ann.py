@@ -0,0 +1,92 @@
+"""近似最近邻索引的召回率与延迟基准测试（对比精确扫描）
+
+用法:
+    python benchmark_ann.py --count 100000 --queries 200 --top-k 10
+    python benchmark_ann.py --snapshot   # 使用 snapshots/ 中的真实嵌入快照
+"""
+import argparse
+import time
+import numpy as np
+from vector_index import ExactVectorIndex, normalize_rows
+from embedding_snapshot import load_snapshot
+from ann_index import IVFFlatIndex, HNSWIndex, hnswlib
+
+
+def synthetic_index(count: int, dimension: int, clusters: int, seed: int = 0) -> ExactVectorIndex:
+    """生成带聚类结构的合成嵌入，近似真实文本嵌入的分布"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, count)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((count, dimension)).astype(np.float32)
+    return ExactVectorIndex(list(range(count)), normalize_rows(vectors))
+
+
+def make_queries(index: ExactVectorIndex, count: int, seed: int = 1) -> np.ndarray:
+    """在库中随机选取向量并加入噪声作为查询"""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(index), count, replace=False)
+    noise = 0.3 * rng.standard_normal((count, index.dimension)).astype(np.float32)
+    return normalize_rows(np.asarray(index.matrix[rows]) + noise)
+
+
+def run(search, queries: np.ndarray, top_k: int):
+    """执行所有查询，返回结果ID和每次查询的耗时（毫秒）"""
+    results = []
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        ids, _ = search(query, top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(set(ids.tolist()))
+    return results, np.array(latencies)
+
+
+def report(name: str, results, latencies: np.ndarray, truth, top_k: int) -> None:
+    recall = np.mean([len(r & t) / top_k for r, t in zip(results, truth)])
+    print(f"{name:<24} recall@{top_k}: {recall:.3f}   平均延迟: {latencies.mean():.3f} ms   "
+          f"p99延迟: {np.percentile(latencies, 99):.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="近似最近邻索引基准测试")
+    parser.add_argument("--snapshot", action="store_true", help="使用嵌入快照而不是合成数据")
+    parser.add_argument("--count", type=int, default=100000, help="合成向量数量")
+    parser.add_argument("--dimension", type=int, default=768, help="合成向量维度")
+    parser.add_argument("--queries", type=int, default=200, help="查询数量")
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.snapshot:
+        index = load_snapshot()
+        if index is None:
+            return
+    else:
+        index = synthetic_index(args.count, args.dimension, clusters=max(1, args.count // 100))
+    queries = make_queries(index, min(args.queries, len(index)))
+    print(f"向量数量: {len(index)}, 维度: {index.dimension}, 查询数量: {len(queries)}")
+
+    truth, latencies = run(index.search, queries, args.top_k)
+    report("exact", truth, latencies, truth, args.top_k)
+
+    start = time.perf_counter()
+    ivf = IVFFlatIndex.build(index)
+    print(f"IVF构建耗时: {time.perf_counter() - start:.1f} 秒, nlist={len(ivf.centroids)}")
+    for nprobe in [1, 2, 4, 8, 16, 32, 64]:
+        if nprobe > len(ivf.centroids):
+            break
+        results, latencies = run(lambda q, k: ivf.search(q, k, nprobe=nprobe), queries, args.top_k)
+        report(f"ivf nprobe={nprobe}", results, latencies, truth, args.top_k)
+
+    if hnswlib is None:
+        print("未安装hnswlib，跳过HNSW测试")
+        return
+    start = time.perf_counter()
+    hnsw = HNSWIndex.build(index)
+    print(f"HNSW构建耗时: {time.perf_counter() - start:.1f} 秒")
+    for ef_search in [16, 32, 64, 128, 256]:
+        results, latencies = run(lambda q, k: hnsw.search(q, k, ef_search=ef_search), queries, args.top_k)
+        report(f"hnsw ef_search={ef_search}", results, latencies, truth, args.top_k)
+
+
+if __name__ == "__main__":
+    main()
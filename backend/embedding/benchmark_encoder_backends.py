@@ -0,0 +1,116 @@
+"""对比PyTorch、ONNX float32和ONNX int8编码器的查询编码延迟、批量吞吐量、内存和一致性
+
+用法:
+    python export_onnx.py                        # 先导出ONNX模型
+    python benchmark_encoder_backends.py --runs 200 --threads 1
+
+每个后端在独立的子进程中测试，加载时间（包括导入PyTorch或ONNX Runtime）和常驻内存互不影响。
+单条查询模拟搜索请求（每次编码一条短查询）；批量吞吐量使用项目名称和简介。
+一致性为各后端与PyTorch float32嵌入的逐条余弦相似度。
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from export_onnx import SAMPLE_QUERIES, cosine_rows, sample_texts
+
+BACKENDS = {
+    "torch": {"backend": "torch"},
+    "onnx-fp32": {"backend": "onnx", "quantized": False},
+    "onnx-int8": {"backend": "onnx", "quantized": True},
+}
+
+
+def current_rss_mb() -> float:
+    with open("/proc/self/status", 'r') as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def run_backend(name: str, runs: int, batch_size: int, threads: int, output_path: str) -> dict:
+    """在当前进程中测试一个后端，嵌入保存到 output_path 供一致性比较"""
+    from encoder_backend import OnnxEncoder, create_encoder, set_encoder_threads
+    from vector_embedding import MODEL_NAME
+
+    start = time.perf_counter()
+    spec = BACKENDS[name]
+    if spec["backend"] == "onnx":
+        encoder = OnnxEncoder(MODEL_NAME, quantized=spec["quantized"])
+    else:
+        encoder = create_encoder(MODEL_NAME, "torch", use_fp16=False)
+    if threads > 0:
+        # 在导入PyTorch之后、创建ONNX会话（第一次编码）之前设置
+        set_encoder_threads(threads)
+    encoder.encode(["warm up"])
+    load_seconds = time.perf_counter() - start
+
+    latencies = []
+    for i in range(runs):
+        query = f"{SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)]} {i}"
+        begin = time.perf_counter()
+        encoder.encode([query])
+        latencies.append(time.perf_counter() - begin)
+    latencies.sort()
+
+    texts = sample_texts()
+    begin = time.perf_counter()
+    embeddings = np.asarray(encoder.encode(texts, batch_size=batch_size), dtype=np.float32)
+    batch_seconds = time.perf_counter() - begin
+    np.save(output_path, embeddings)
+
+    return {
+        "load_seconds": load_seconds,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "batch_texts_per_second": len(texts) / batch_seconds,
+        "rss_mb": current_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="编码器后端延迟、吞吐量与一致性基准测试")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="以逗号分隔的后端")
+    parser.add_argument("--runs", type=int, default=200, help="单条查询编码的次数")
+    parser.add_argument("--batch-size", type=int, default=32, help="批量编码的批大小")
+    parser.add_argument("--threads", type=int, default=0, help="推理线程数，0表示后端默认值")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_backend(args.worker, args.runs, args.batch_size, args.threads, args.output)))
+        return
+
+    results = {}
+    embeddings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.backends.split(","):
+            output_path = os.path.join(tmp, f"{name}.npy")
+            command = [sys.executable, os.path.abspath(__file__), "--worker", name, "--output", output_path,
+                       "--runs", str(args.runs), "--batch-size", str(args.batch_size), "--threads", str(args.threads)]
+            completed = subprocess.run(command, capture_output=True, text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)))
+            if completed.returncode != 0:
+                print(f"{name}: 测试失败\n{completed.stderr.strip()[-2000:]}")
+                continue
+            results[name] = json.loads(completed.stdout.strip().splitlines()[-1])
+            embeddings[name] = np.load(output_path)
+
+    reference = embeddings.get("torch")
+    print(f"{'后端':<10} {'加载':>8} {'单条p50':>9} {'单条p99':>9} {'批量吞吐':>12} {'RSS':>8} {'最小余弦':>8}")
+    for name, result in results.items():
+        parity = "-"
+        if reference is not None and name != "torch":
+            parity = f"{cosine_rows(reference, embeddings[name]).min():.4f}"
+        print(f"{name:<10} {result['load_seconds']:7.1f}s {result['p50_ms']:7.2f}ms {result['p99_ms']:7.2f}ms "
+              f"{result['batch_texts_per_second']:8.1f}条/秒 {result['rss_mb']:6.0f}MB {parity:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""量化索引的内存占用与召回损失报告（对比float32精确扫描）
+
+用法:
+    python benchmark_quantization.py --count 100000 --queries 200 --top-k 10
+    python benchmark_quantization.py --snapshot   # 使用 snapshots/ 中的真实嵌入快照
+"""
+import argparse
+import time
+import numpy as np
+from embedding_snapshot import load_snapshot
+from quantization import Int8VectorIndex, PQVectorIndex
+from benchmark_ann import synthetic_index, make_queries, run, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="量化索引基准测试")
+    parser.add_argument("--snapshot", action="store_true", help="使用嵌入快照而不是合成数据")
+    parser.add_argument("--count", type=int, default=100000, help="合成向量数量")
+    parser.add_argument("--dimension", type=int, default=768, help="合成向量维度")
+    parser.add_argument("--queries", type=int, default=200, help="查询数量")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--subspaces", type=int, default=96, help="PQ子空间数量")
+    args = parser.parse_args()
+
+    if args.snapshot:
+        index = load_snapshot()
+        if index is None:
+            return
+    else:
+        index = synthetic_index(args.count, args.dimension, clusters=max(1, args.count // 100))
+    queries = make_queries(index, min(args.queries, len(index)))
+    print(f"向量数量: {len(index)}, 维度: {index.dimension}, 查询数量: {len(queries)}")
+    print(f"float32 每个向量 {4 * index.dimension} 字节")
+
+    truth, latencies = run(index.search, queries, args.top_k)
+    report("exact float32", truth, latencies, truth, args.top_k)
+
+    for index_class, params in [(Int8VectorIndex, {}), (PQVectorIndex, {"subspaces": args.subspaces})]:
+        start = time.perf_counter()
+        quantized = index_class.build(index, allow_resident=True, **params)
+        print(f"\n{quantized.kind}: 每个向量 {quantized.bytes_per_vector} 字节 "
+              f"（压缩 {4 * index.dimension / quantized.bytes_per_vector:.0f}x），构建耗时 {time.perf_counter() - start:.1f} 秒")
+        # rescore_k=top_k 时只按压缩编码排序，可看出未重新打分时的召回损失
+        for rescore_k in [args.top_k, 50, 200, 500]:
+            quantized.rescore_k = rescore_k
+            results, latencies = run(quantized.search, queries, args.top_k)
+            report(f"{quantized.kind} rescore={rescore_k}", results, latencies, truth, args.top_k)
+
+
+if __name__ == "__main__":
+    main()
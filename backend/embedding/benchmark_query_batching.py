@@ -0,0 +1,79 @@
+"""对比逐条编码查询与微批编码在不同并发下的吞吐量和延迟
+
+用法:
+    python benchmark_query_batching.py --concurrency 1,8,32,64 --windows 0,2,5 --duration 10
+    ENCODER_BACKEND=onnx python benchmark_query_batching.py
+
+每个并发用户是一个线程，循环编码互不相同的查询（不经过查询向量缓存）：
+- direct：每个请求各自调用 model.encode([query])
+- window=N：通过 MicroBatchEncoder 合并编码，等待窗口为N毫秒
+"""
+import argparse
+import threading
+import time
+from batch_encoder import QUERY_BATCH_MAX_SIZE, MicroBatchEncoder
+from encoder_backend import ENCODER_BACKEND, create_encoder
+from export_onnx import SAMPLE_QUERIES
+from vector_embedding import MODEL_NAME
+
+
+def run_level(encode, concurrency: int, duration: float):
+    """以固定数量的并发用户持续编码，返回 (完成数, 排序后的延迟列表)"""
+    latencies = [[] for _ in range(concurrency)]
+    deadline = time.perf_counter() + duration
+
+    def user(index: int):
+        count = 0
+        while time.perf_counter() < deadline:
+            query = f"{SAMPLE_QUERIES[count % len(SAMPLE_QUERIES)]} {index}-{count}"
+            start = time.perf_counter()
+            encode(query)
+            latencies[index].append(time.perf_counter() - start)
+            count += 1
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    merged = sorted(latency for per_user in latencies for latency in per_user)
+    return len(merged), merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询编码微批处理基准测试")
+    parser.add_argument("--backend", default=ENCODER_BACKEND, help="编码器后端（torch或onnx）")
+    parser.add_argument("--concurrency", default="1,8,32,64", help="以逗号分隔的并发用户数")
+    parser.add_argument("--windows", default="0,2,5", help="以逗号分隔的等待窗口（毫秒）")
+    parser.add_argument("--max-batch-size", type=int, default=QUERY_BATCH_MAX_SIZE)
+    parser.add_argument("--duration", type=float, default=10.0, help="每个组合的测试时长（秒）")
+    args = parser.parse_args()
+
+    model = create_encoder(MODEL_NAME, args.backend)
+    model.encode(["warm up"])
+
+    modes = [("direct", None)] + [(f"window={window}ms", float(window)) for window in args.windows.split(",")]
+    for concurrency in [int(value) for value in args.concurrency.split(",")]:
+        for name, window in modes:
+            batcher = None
+            if window is None:
+                encode = lambda text: model.encode([text])[0]
+            else:
+                batcher = MicroBatchEncoder(model.encode, window_ms=window, max_batch_size=args.max_batch_size)
+                encode = batcher.encode
+            completed, latencies = run_level(encode, concurrency, args.duration)
+
+            def percentile(p):
+                return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else float("nan")
+
+            line = (f"并发 {concurrency:>3} {name:<14} QPS {completed / args.duration:8.1f}  "
+                    f"p50 {percentile(0.5):7.1f}ms p99 {percentile(0.99):7.1f}ms")
+            if batcher is not None:
+                stats = batcher.stats()
+                line += f"  平均批大小 {stats['mean_batch_size']:5.1f}  平均排队 {stats['mean_queue_wait_ms']:5.1f}ms"
+                batcher.close()
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import re
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from pymongo.collection import Collection
+
+# 建立倒排索引的文本字段
+BM25_FIELDS = ["program_name", "university", "discipline", "sub_discipline", "tags", "introduction"]
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """将文本切分为小写词项"""
+    return _TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+class BM25Index:
+    """进程内的BM25F倒排索引
+
+    每个字段单独保存倒排列表（文档行号 + 按字段长度归一化后的词频），
+    查询时按字段权重合并词频后再做BM25饱和：
+        tf' = Σ_f w_f · tf_f / (1 - b + b · len_f / avglen_f)
+        score = Σ_t idf(t) · tf' / (k1 + tf')
+    字段权重可以在查询时指定，因此也可作为混合搜索中的稀疏部分或候选召回使用。
+    """
+
+    def __init__(self, ids: List[Any], documents: List[Dict[str, Any]], field_weights: Dict[str, float],
+                 fields: List[str] = BM25_FIELDS, k1: float = BM25_K1, b: float = BM25_B):
+        """构建索引
+
+        Args:
+            ids: 文档ID列表（MongoDB的_id），顺序与documents一致
+            documents: 文档列表，只需要包含fields中的字段
+            field_weights: 默认的字段权重
+            fields: 建立索引的字段
+            k1: BM25词频饱和参数
+            b: BM25长度归一化参数
+        """
+        self.ids = np.array(ids, dtype=object)
+        self.fields = list(fields)
+        self.field_weights = {field: float(field_weights.get(field, 1.0)) for field in self.fields}
+        self.k1 = k1
+        self._positions = {doc_id: i for i, doc_id in enumerate(ids)}
+
+        # 先统计每个字段的词频和长度
+        field_counts = {field: [] for field in self.fields}
+        lengths = np.zeros((len(self.fields), len(documents)), dtype=np.float32)
+        document_frequency = Counter()
+        for row, document in enumerate(documents):
+            seen = set()
+            for f, field in enumerate(self.fields):
+                value = document.get(field)
+                counts = Counter(tokenize(value if isinstance(value, str) else ""))
+                field_counts[field].append(counts)
+                lengths[f, row] = sum(counts.values())
+                seen.update(counts)
+            document_frequency.update(seen)
+
+        average_lengths = lengths.mean(axis=1) if len(documents) else np.ones(len(self.fields))
+        average_lengths[average_lengths == 0] = 1.0
+        norms = 1.0 - b + b * lengths / average_lengths[:, None]
+
+        # 倒排列表：词项 -> 字段 -> (文档行号数组, 归一化词频数组)
+        postings: Dict[str, Dict[str, Tuple[List[int], List[float]]]] = defaultdict(dict)
+        for f, field in enumerate(self.fields):
+            for row, counts in enumerate(field_counts[field]):
+                for term, tf in counts.items():
+                    rows, tfs = postings[term].setdefault(field, ([], []))
+                    rows.append(row)
+                    tfs.append(tf / norms[f, row])
+        self.postings = {
+            term: {
+                field: (np.array(rows, dtype=np.int64), np.array(tfs, dtype=np.float32))
+                for field, (rows, tfs) in by_field.items()
+            }
+            for term, by_field in postings.items()
+        }
+
+        count = len(documents)
+        self.idf = {
+            term: float(np.log(1.0 + (count - df + 0.5) / (df + 0.5)))
+            for term, df in document_frequency.items()
+        }
+
+    @classmethod
+    def from_collection(cls, collection: Collection, field_weights: Dict[str, float],
+                        fields: List[str] = BM25_FIELDS) -> "BM25Index":
+        """从MongoDB集合构建索引（只读取_id和文本字段）"""
+        ids = []
+        documents = []
+        for doc in collection.find({}, {field: 1 for field in fields}):
+            ids.append(doc["_id"])
+            documents.append(doc)
+        return cls(ids, documents, field_weights, fields)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def positions_of(self, doc_ids: List[Any]) -> np.ndarray:
+        """返回文档ID对应的行号，不在索引中的ID返回-1"""
+        return np.array([self._positions.get(doc_id, -1) for doc_id in doc_ids], dtype=np.int64)
+
+    def scores(self, query: str, field_weights: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """计算查询对所有文档的BM25分数
+
+        Args:
+            query: 查询文本
+            field_weights: 可选的查询时字段权重，默认使用构建时的权重
+
+        Returns:
+            与索引行对齐的分数数组，不匹配的文档为0
+        """
+        weights = self.field_weights if field_weights is None else field_weights
+        scores = np.zeros(len(self), dtype=np.float32)
+        for term in set(tokenize(query)):
+            by_field = self.postings.get(term)
+            if not by_field:
+                continue
+            rows = []
+            values = []
+            for field, (field_rows, field_tfs) in by_field.items():
+                weight = float(weights.get(field, 0.0))
+                if weight > 0:
+                    rows.append(field_rows)
+                    values.append(field_tfs * weight)
+            if not rows:
+                continue
+            rows = np.concatenate(rows)
+            unique_rows, inverse = np.unique(rows, return_inverse=True)
+            tf = np.bincount(inverse, weights=np.concatenate(values)).astype(np.float32)
+            scores[unique_rows] += self.idf[term] * tf / (self.k1 + tf)
+        return scores
+
+    def search(self, query: str, top_k: int = 10,
+               field_weights: Optional[Dict[str, float]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """返回BM25分数最高的前top_k个文档
+
+        Returns:
+            (文档ID数组, 分数数组)，按分数从高到低排序，只包含分数大于0的文档
+        """
+        scores = self.scores(query, field_weights)
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) == 0 or top_k <= 0:
+            return np.array([], dtype=object), np.array([], dtype=np.float32)
+        k = min(top_k, len(matched))
+        if k < len(matched):
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = matched[np.argsort(-scores[matched], kind="stable")]
+        return self.ids[top], scores[top]
@@ -0,0 +1,102 @@
+from typing import Any, Dict, Iterable, List, Optional
+from pymongo.collection import Collection
+
+# 只用于打分、不返回给客户端的向量字段
+VECTOR_FIELDS = ["embedding", "field_embeddings"]
+# 增量同步使用的内部字段（见 VectorEmbedding.build_document），对客户端没有意义
+INTERNAL_FIELDS = ["program_key", "content_hash", "document_hash"]
+# 展示阶段不返回的字段（包括它们的子路径，如 field_embeddings.program_name）
+HIDDEN_FIELDS = VECTOR_FIELDS + INTERNAL_FIELDS
+# 返回完整文档时的默认投影：排除向量字段和内部字段
+DISPLAY_PROJECTION = {field: 0 for field in HIDDEN_FIELDS}
+
+
+def parse_fields(value: Optional[str]) -> Optional[List[str]]:
+    """解析请求中以逗号分隔的fields参数
+
+    Returns:
+        字段列表；参数为空时返回None，表示返回除向量和内部字段外的全部字段
+    """
+    if not value:
+        return None
+    fields = _display_fields(field.strip() for field in value.split(','))
+    return fields or None
+
+
+def display_projection(fields: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    """返回展示阶段使用的投影，指定fields时只包含这些字段（_id总是返回）"""
+    fields = _display_fields(fields or [])
+    if not fields:
+        return DISPLAY_PROJECTION
+    return {field: 1 for field in fields}
+
+
+def text_projection(fields: Iterable[str]) -> Dict[str, int]:
+    """返回只包含指定文本字段的投影，用于候选打分阶段"""
+    projection = {field: 1 for field in fields if _is_projectable(field) and not _is_under(field, VECTOR_FIELDS)}
+    return projection or {"_id": 1}
+
+
+def fetch_documents(collection: Collection, doc_ids: Iterable[Any],
+                    fields: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """第二阶段取回：按ID取回最终结果的展示字段，并保持doc_ids的顺序
+
+    Args:
+        collection: MongoDB集合对象
+        doc_ids: 排好序的文档ID
+        fields: 可选的返回字段列表，默认返回除向量和内部字段外的全部字段
+
+    Returns:
+        文档列表，集合中已不存在的ID会被跳过
+    """
+    doc_ids = list(doc_ids)
+    if not doc_ids:
+        return []
+    docs_by_id = {
+        doc['_id']: doc
+        for doc in collection.find({'_id': {'$in': doc_ids}}, display_projection(fields))
+    }
+    return [docs_by_id[doc_id] for doc_id in doc_ids if doc_id in docs_by_id]
+
+
+async def fetch_documents_async(collection, doc_ids: Iterable[Any],
+                                fields: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """fetch_documents 的异步版本，collection 为PyMongo异步API（AsyncMongoClient）的集合
+
+    Args:
+        collection: 异步MongoDB集合对象
+        doc_ids: 排好序的文档ID
+        fields: 可选的返回字段列表，默认返回除向量和内部字段外的全部字段
+
+    Returns:
+        文档列表，集合中已不存在的ID会被跳过
+    """
+    doc_ids = list(doc_ids)
+    if not doc_ids:
+        return []
+    docs_by_id = {
+        doc['_id']: doc
+        async for doc in collection.find({'_id': {'$in': doc_ids}}, display_projection(fields))
+    }
+    return [docs_by_id[doc_id] for doc_id in doc_ids if doc_id in docs_by_id]
+
+
+def _is_projectable(field: str) -> bool:
+    """过滤无法用作MongoDB投影的字段名（空字段名、空路径段或$开头的操作符）"""
+    return bool(field) and not field.startswith('$') and all(field.split('.'))
+
+
+def _is_under(field: str, paths: Iterable[str]) -> bool:
+    """字段是否等于paths中的某个路径或是它的子路径"""
+    return any(field == path or field.startswith(path + '.') for path in paths)
+
+
+def _display_fields(fields: Iterable[str]) -> List[str]:
+    """过滤请求的展示字段：去掉无效字段、隐藏字段及其子路径、重复字段，
+    以及已被父路径包含的子路径（MongoDB不允许投影中同时出现 a 和 a.b）"""
+    fields = [field for field in fields if _is_projectable(field) and not _is_under(field, HIDDEN_FIELDS)]
+    kept: List[str] = []
+    for field in sorted(set(fields), key=lambda field: field.count('.')):
+        if not _is_under(field, kept):
+            kept.append(field)
+    return [field for field in dict.fromkeys(fields) if field in kept]
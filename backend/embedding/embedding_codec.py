@@ -0,0 +1,54 @@
+import os
+import struct
+from typing import Any, List, Union
+import numpy as np
+from bson.binary import Binary
+
+# 嵌入向量在MongoDB中的存储格式：
+# "list" - BSON double数组（兼容Atlas $vectorSearch）
+# "float32" / "float16" - 带类型和维度头的BSON Binary，体积约为double数组的1/2和1/4
+EMBEDDING_STORAGE_DTYPE = os.getenv("EMBEDDING_STORAGE_DTYPE", "list")
+
+STORAGE_DTYPES = {
+    "float32": (1, np.dtype('<f4')),
+    "float16": (2, np.dtype('<f2')),
+}
+_DTYPES_BY_CODE = {code: dtype for code, dtype in STORAGE_DTYPES.values()}
+
+# 头部格式：4字节魔数 + 1字节类型码 + 3字节填充 + 4字节维度 + 4字节填充，共16字节，保证数据区对齐
+_MAGIC = b'PCVE'
+_HEADER = struct.Struct('<4sB3xI4x')
+
+
+def encode_vector(vector: np.ndarray, storage_dtype: str = EMBEDDING_STORAGE_DTYPE) -> Union[List[float], Binary]:
+    """将嵌入向量编码为MongoDB存储格式
+
+    Args:
+        vector: 一维嵌入向量
+        storage_dtype: "list"、"float32"或"float16"
+
+    Returns:
+        Python列表或BSON Binary
+    """
+    if storage_dtype == "list":
+        return np.asarray(vector).tolist()
+    if storage_dtype not in STORAGE_DTYPES:
+        raise ValueError(f"不支持的嵌入存储格式: {storage_dtype}")
+
+    code, dtype = STORAGE_DTYPES[storage_dtype]
+    data = np.ascontiguousarray(vector, dtype=dtype).ravel()
+    return Binary(_HEADER.pack(_MAGIC, code, data.shape[0]) + data.tobytes())
+
+
+def decode_vector(value: Any) -> np.ndarray:
+    """将MongoDB中存储的嵌入向量解码为NumPy数组
+
+    Binary格式直接用np.frombuffer在原始字节上构造只读数组，不复制数据；
+    列表格式按原方式转换。
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        magic, code, dimension = _HEADER.unpack_from(value)
+        if magic != _MAGIC or code not in _DTYPES_BY_CODE:
+            raise ValueError("无法识别的嵌入向量二进制格式")
+        return np.frombuffer(value, dtype=_DTYPES_BY_CODE[code], count=dimension, offset=_HEADER.size)
+    return np.asarray(value, dtype=np.float32)
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+import numpy as np
+from bson import ObjectId
+from pymongo.collection import Collection
+from vector_index import ExactVectorIndex
+
+# 嵌入快照目录：process_sim_programs写入，API启动时以mmap方式加载
+SNAPSHOT_DIR = os.getenv("EMBEDDING_SNAPSHOT_DIR", os.path.join(os.path.dirname(__file__), "snapshots"))
+SNAPSHOT_META_FILE = "snapshot.json"
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+def collection_fingerprint(collection: Collection) -> str:
+    """计算集合中嵌入内容的指纹
+
+    只读取_id和content_hash（不读取嵌入向量），任何文档的新增、删除或重新编码都会改变指纹。
+    """
+    entries = sorted(
+        f"{doc['_id']}:{doc.get('content_hash', '')}"
+        for doc in collection.find({"embedding": {"$exists": True}}, {"content_hash": 1})
+    )
+    return hashlib.sha256("\n".join(entries).encode('utf-8')).hexdigest()
+
+
+def read_snapshot_meta(snapshot_dir: str = SNAPSHOT_DIR) -> Optional[Dict[str, Any]]:
+    """读取快照元数据，不存在或无法解析时返回None"""
+    meta_path = os.path.join(snapshot_dir, SNAPSHOT_META_FILE)
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def write_snapshot(index: ExactVectorIndex, fingerprint: str, model_name: str,
+                   snapshot_dir: str = SNAPSHOT_DIR) -> Dict[str, Any]:
+    """将向量索引写入带版本号的.npy快照
+
+    先写入新版本的矩阵文件，最后原子替换snapshot.json，正在读取旧版本的进程不受影响。
+
+    Args:
+        index: 已加载的向量索引
+        fingerprint: 生成快照时集合的指纹
+        model_name: 生成嵌入的模型名称
+        snapshot_dir: 快照目录
+
+    Returns:
+        快照元数据
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    version = f"{time.strftime('%Y%m%d%H%M%S')}-{fingerprint[:8]}"
+
+    files = {"embeddings": f"embeddings-{version}.npy"}
+    np.save(os.path.join(snapshot_dir, files["embeddings"]), index.matrix)
+    if index.has_field_embeddings:
+        files["field_embeddings"] = f"field_embeddings-{version}.npy"
+        files["field_mask"] = f"field_mask-{version}.npy"
+        np.save(os.path.join(snapshot_dir, files["field_embeddings"]), index.field_matrix)
+        np.save(os.path.join(snapshot_dir, files["field_mask"]), index.field_mask)
+
+    # 第i个ID对应矩阵的第i行
+    meta = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "version": version,
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "model_name": model_name,
+        "fingerprint": fingerprint,
+        "count": len(index),
+        "dimension": index.dimension if len(index) else 0,
+        "field_names": index.field_names,
+        "ids": [str(doc_id) for doc_id in index.ids],
+        "files": files
+    }
+    meta_path = os.path.join(snapshot_dir, SNAPSHOT_META_FILE)
+    tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, meta_path)
+
+    _remove_old_versions(snapshot_dir, set(files.values()))
+    print(f"已写入嵌入快照 {version}，共 {len(index)} 个向量")
+    return meta
+
+
+def load_snapshot(snapshot_dir: str = SNAPSHOT_DIR, fingerprint: Optional[str] = None,
+                  model_name: Optional[str] = None) -> Optional[ExactVectorIndex]:
+    """以mmap方式加载嵌入快照
+
+    矩阵通过np.load(mmap_mode='r')映射，同一主机上的多个工作进程通过操作系统页缓存共享内存。
+
+    Args:
+        snapshot_dir: 快照目录
+        fingerprint: 期望的集合指纹，不一致时视为过期
+        model_name: 期望的模型名称，不一致时视为过期
+
+    Returns:
+        向量索引；快照不存在、格式不兼容或已过期时返回None
+    """
+    meta = read_snapshot_meta(snapshot_dir)
+    if meta is None:
+        print("未找到嵌入快照")
+        return None
+    if meta.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        print(f"嵌入快照格式版本不兼容: {meta.get('format_version')}")
+        return None
+    if fingerprint is not None and meta.get("fingerprint") != fingerprint:
+        print(f"嵌入快照 {meta.get('version')} 已过期，集合内容已变化")
+        return None
+    if model_name is not None and meta.get("model_name") != model_name:
+        print(f"嵌入快照模型 {meta.get('model_name')} 与当前模型 {model_name} 不一致")
+        return None
+
+    files = meta["files"]
+    try:
+        matrix = np.load(os.path.join(snapshot_dir, files["embeddings"]), mmap_mode='r')
+        field_matrix = field_mask = None
+        if "field_embeddings" in files:
+            field_matrix = np.load(os.path.join(snapshot_dir, files["field_embeddings"]), mmap_mode='r')
+            field_mask = np.load(os.path.join(snapshot_dir, files["field_mask"]))
+    except OSError as e:
+        print(f"加载嵌入快照文件出错: {e}")
+        return None
+
+    ids = [_parse_id(doc_id) for doc_id in meta["ids"]]
+    if len(ids) == 0:
+        matrix = np.zeros((0, 0), dtype=np.float32)
+        field_matrix = field_mask = None
+    index = ExactVectorIndex(ids, matrix, field_matrix, field_mask, meta.get("field_names"), normalized=True)
+    index.snapshot_version = meta["version"]
+    print(f"已加载嵌入快照 {meta['version']}，共 {len(index)} 个向量")
+    return index
+
+
+def _parse_id(doc_id: str) -> Any:
+    """将快照中保存的字符串ID还原为MongoDB的ObjectId"""
+    return ObjectId(doc_id) if ObjectId.is_valid(doc_id) else doc_id
+
+
+def _remove_old_versions(snapshot_dir: str, keep: set) -> None:
+    """删除不再被snapshot.json引用的旧版本矩阵文件
+
+    已经mmap旧文件的进程在Linux上仍可继续访问，文件在最后一个映射关闭后才真正释放。
+    """
+    for name in os.listdir(snapshot_dir):
+        if name.endswith(".npy") and name not in keep:
+            try:
+                os.remove(os.path.join(snapshot_dir, name))
+            except OSError:
+                pass
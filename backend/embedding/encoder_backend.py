@@ -0,0 +1,169 @@
+import json
+import os
+import sys
+from typing import List, Optional
+import numpy as np
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:
+    Tokenizer = None
+
+# 编码器后端：torch（FlagEmbedding的FlagModel）或 onnx（ONNX Runtime + 快速分词器，不导入PyTorch）
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+# export_onnx.py 导出的模型目录，包含 model.onnx、model_int8.onnx、tokenizer.json 和 export_meta.json
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(os.path.dirname(__file__), "onnx"))
+ONNX_QUANTIZED = os.getenv("ONNX_QUANTIZED", "true").lower() == "true" # 使用int8动态量化的模型
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+EXPORT_META_FILE = "export_meta.json" # 记录导出时使用的模型名称，加载时检查与配置的模型一致
+ENCODE_MAX_LENGTH = 512 # 与FlagModel默认的最大序列长度一致
+ENCODE_BATCH_SIZE = 256
+
+# 工作进程的推理线程数，0表示使用后端默认值；预分叉模式下由 set_encoder_threads 设置
+_encoder_threads = int(os.getenv("ENCODER_THREADS", "0"))
+
+
+def set_encoder_threads(threads: int) -> None:
+    """设置当前进程的推理线程数：已导入PyTorch时设置其线程数，之后创建的ONNX会话也使用该值"""
+    global _encoder_threads
+    _encoder_threads = threads
+    torch = sys.modules.get("torch")
+    if torch is not None and threads > 0:
+        torch.set_num_threads(threads)
+
+
+def read_export_meta(model_dir: str) -> dict:
+    """读取导出目录的元数据，不存在时返回空字典"""
+    path = os.path.join(model_dir, EXPORT_META_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def encoder_key(model_name: str, backend: str = ENCODER_BACKEND, use_fp16: bool = True,
+                quantized: bool = ONNX_QUANTIZED) -> str:
+    """编码器的标识：模型名称、后端和精度，同一模型的不同后端或量化方式生成的向量略有差异，
+    查询向量缓存和语义权重缓存以它区分"""
+    if backend == "onnx":
+        return f"{model_name}:onnx:{'int8' if quantized else 'fp32'}"
+    return f"{model_name}:{backend}:{'fp16' if use_fp16 else 'fp32'}"
+
+
+class OnnxEncoder:
+    """用ONNX Runtime运行导出的BGE模型，encode 的输出与 FlagModel.encode 一致（CLS池化 + L2归一化）
+
+    推理会话在第一次编码时才创建：ONNX Runtime的线程池不能跨fork使用，
+    预分叉的父进程只构建分词器，会话由每个工作进程预热时各自创建。
+    """
+
+    def __init__(self, model_name: str, model_dir: str = ONNX_MODEL_DIR, quantized: bool = ONNX_QUANTIZED,
+                 max_length: int = ENCODE_MAX_LENGTH, threads: Optional[int] = None):
+        """加载分词器
+
+        Args:
+            model_name: BGE模型名称，必须与导出目录中记录的模型一致
+            model_dir: export_onnx.py 导出的模型目录
+            quantized: 是否使用int8动态量化的模型
+            max_length: 最大序列长度，超出部分截断
+            threads: 推理线程数，默认使用 set_encoder_threads 设置的值
+        """
+        if onnxruntime is None or Tokenizer is None:
+            raise ImportError("使用ONNX编码器需要安装onnxruntime和tokenizers: pip install onnxruntime tokenizers")
+        self.model_path = os.path.join(model_dir, ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE)
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(f"ONNX模型不存在: {self.model_path}，请先运行 python export_onnx.py")
+        exported_model = read_export_meta(model_dir).get("model_name")
+        if exported_model != model_name:
+            raise ValueError(f"ONNX模型目录 {model_dir} 导出自 {exported_model or '未知模型'}，与配置的模型 {model_name} 不一致，"
+                             f"请运行 python export_onnx.py --model {model_name} 重新导出")
+        self.model_name = model_name
+        self.quantized = quantized
+        self.threads = threads
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.no_padding()
+        self._pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+        self._session = None
+        self._input_names: List[str] = []
+
+    @property
+    def session(self):
+        if self._session is None:
+            options = onnxruntime.SessionOptions()
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            threads = self.threads if self.threads is not None else _encoder_threads
+            if threads > 0:
+                options.intra_op_num_threads = threads
+            self._session = onnxruntime.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+            self._input_names = [model_input.name for model_input in self._session.get_inputs()]
+        return self._session
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        length = max(len(encoding.ids) for encoding in encodings)
+        input_ids = np.full((len(texts), length), self._pad_id, dtype=np.int64)
+        attention_mask = np.zeros((len(texts), length), dtype=np.int64)
+        token_type_ids = np.zeros((len(texts), length), dtype=np.int64)
+        for i, encoding in enumerate(encodings):
+            size = len(encoding.ids)
+            input_ids[i, :size] = encoding.ids
+            attention_mask[i, :size] = 1
+            token_type_ids[i, :size] = encoding.type_ids
+
+        session = self.session
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": token_type_ids}
+        hidden = session.run(None, {name: inputs[name] for name in self._input_names})[0]
+        cls = hidden[:, 0].astype(np.float32)
+        norms = np.linalg.norm(cls, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return cls / norms
+
+    def encode(self, sentences, batch_size: int = ENCODE_BATCH_SIZE, **kwargs) -> np.ndarray:
+        """编码文本，返回 (N, D) 的归一化float32矩阵；传入单个字符串时返回 (D,) 向量
+
+        按文本长度排序后分批，减少同一批内的填充长度，结果按输入顺序返回。
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        embeddings = None
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            batch = self._encode_batch([texts[i] for i in rows])
+            if embeddings is None:
+                embeddings = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+            embeddings[rows] = batch
+        return embeddings[0] if single else embeddings
+
+
+def create_encoder(model_name: str, backend: str = ENCODER_BACKEND, use_fp16: bool = True):
+    """创建编码器：torch 后端返回FlagModel，onnx 后端返回OnnxEncoder（不导入PyTorch）
+
+    Args:
+        model_name: BGE模型名称
+        backend: torch 或 onnx
+        use_fp16: torch后端是否使用半精度推理（仅GPU上有加速）
+    """
+    if backend == "onnx":
+        return OnnxEncoder(model_name)
+    if backend != "torch":
+        raise ValueError(f"未知的编码器后端: {backend}")
+
+    from FlagEmbedding import FlagModel
+    return FlagModel(
+        model_name,
+        query_instruction_for_retrieval="Represent this text for retrieval:",
+        use_fp16=use_fp16
+    )
@@ -0,0 +1,143 @@
+"""导出BGE模型的ONNX计算图（可选int8动态量化），并检查与PyTorch嵌入的一致性
+
+用法:
+    python export_onnx.py                  # 导出 model.onnx 和 model_int8.onnx，然后做一致性检查
+    python export_onnx.py --no-quantize    # 只导出float32模型
+    python export_onnx.py --check-only     # 只对已导出的模型做一致性检查
+
+导出和一致性检查需要 torch、transformers、onnx 和 onnxruntime；
+服务时（ENCODER_BACKEND=onnx）只需要 onnxruntime 和 tokenizers。
+一致性检查对项目名称、简介和示例查询编码，任何一条文本与 FlagModel 嵌入的余弦相似度低于阈值时以非0状态退出。
+"""
+import argparse
+import json
+import os
+import sys
+from typing import List
+import numpy as np
+from encoder_backend import EXPORT_META_FILE, ONNX_INT8_MODEL_FILE, ONNX_MODEL_DIR, ONNX_MODEL_FILE, OnnxEncoder
+from vector_embedding import MODEL_NAME
+
+PARITY_THRESHOLD = 0.99 # 与PyTorch嵌入的最低余弦相似度
+ONNX_OPSET = 14
+
+SAMPLE_QUERIES = [
+    "business analytics master",
+    "悉尼大学商科本科项目",
+    "part-time computer science degree in Singapore",
+    "人工智能全日制硕士",
+    "psychology bachelor with honours",
+    "cheap nursing diploma",
+]
+
+
+def sample_texts(limit: int = 200) -> List[str]:
+    """一致性检查和延迟测试使用的文本：示例查询、项目名称和项目简介（长文本覆盖截断）"""
+    file_path = os.path.join(os.path.dirname(__file__), "SIM_programs.json")
+    with open(file_path, 'r', encoding='utf-8') as f:
+        programs = json.load(f)
+    texts = list(SAMPLE_QUERIES)
+    for program in programs:
+        texts.append(program.get('program_name') or '')
+        if program.get('introduction'):
+            texts.append(program['introduction'])
+    return [text for text in texts if text][:limit]
+
+
+def cosine_rows(reference: np.ndarray, candidate: np.ndarray) -> np.ndarray:
+    """逐行余弦相似度"""
+    reference = np.asarray(reference, dtype=np.float32)
+    candidate = np.asarray(candidate, dtype=np.float32)
+    numerator = np.sum(reference * candidate, axis=1)
+    denominator = np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    return numerator / np.maximum(denominator, 1e-12)
+
+
+def export(model_name: str, output_dir: str, opset: int = ONNX_OPSET) -> str:
+    """用torch.onnx导出模型（批大小和序列长度为动态维度），保存快速分词器的tokenizer.json，
+    并在 export_meta.json 中记录模型名称（OnnxEncoder 加载时检查）"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    tokenizer.save_pretrained(output_dir)
+
+    dummy = tokenizer(["export sample", "a longer export sample sentence"], padding=True, return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+    path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(dummy[name] for name in input_names),
+            path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+    with open(os.path.join(output_dir, EXPORT_META_FILE), 'w', encoding='utf-8') as f:
+        json.dump({"model_name": model_name, "opset": opset}, f, ensure_ascii=False, indent=2)
+    print(f"已导出ONNX模型: {path}")
+    return path
+
+
+def quantize(output_dir: str) -> str:
+    """对导出的模型做int8动态量化（权重离线量化为int8，激活在推理时动态量化）"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    source = os.path.join(output_dir, ONNX_MODEL_FILE)
+    target = os.path.join(output_dir, ONNX_INT8_MODEL_FILE)
+    quantize_dynamic(source, target, weight_type=QuantType.QInt8, per_channel=True)
+    print(f"已导出int8量化模型: {target} "
+          f"({os.path.getsize(source) / 2 ** 20:.0f}MB -> {os.path.getsize(target) / 2 ** 20:.0f}MB)")
+    return target
+
+
+def check_parity(model_name: str, output_dir: str, quantized_variants: List[bool],
+                 threshold: float = PARITY_THRESHOLD) -> bool:
+    """比较ONNX模型与FlagModel（float32）的嵌入，返回是否全部达到阈值"""
+    from encoder_backend import create_encoder
+
+    texts = sample_texts()
+    reference = np.asarray(create_encoder(model_name, "torch", use_fp16=False).encode(texts), dtype=np.float32)
+    passed = True
+    for quantized in quantized_variants:
+        encoder = OnnxEncoder(model_name, output_dir, quantized=quantized)
+        similarities = cosine_rows(reference, encoder.encode(texts))
+        worst = int(np.argmin(similarities))
+        ok = similarities[worst] >= threshold
+        passed = passed and ok
+        print(f"{'int8' if quantized else 'float32'} 一致性: 最小余弦 {similarities[worst]:.4f} "
+              f"平均 {similarities.mean():.4f} ({len(texts)}条文本) {'通过' if ok else '未通过'}"
+              + ("" if ok else f"，最差文本: {texts[worst][:60]!r}"))
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出BGE模型的ONNX计算图并检查一致性")
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--output-dir", default=ONNX_MODEL_DIR)
+    parser.add_argument("--opset", type=int, default=ONNX_OPSET)
+    parser.add_argument("--no-quantize", action="store_true", help="不导出int8量化模型")
+    parser.add_argument("--check-only", action="store_true", help="只对已导出的模型做一致性检查")
+    parser.add_argument("--threshold", type=float, default=PARITY_THRESHOLD)
+    args = parser.parse_args()
+
+    if not args.check_only:
+        export(args.model, args.output_dir, args.opset)
+        if not args.no_quantize:
+            quantize(args.output_dir)
+
+    variants = [False]
+    if os.path.exists(os.path.join(args.output_dir, ONNX_INT8_MODEL_FILE)) and not args.no_quantize:
+        variants.append(True)
+    if not check_parity(args.model, args.output_dir, variants, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
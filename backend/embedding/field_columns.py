@@ -0,0 +1,135 @@
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+import numpy as np
+from pymongo.collection import Collection
+
+# LLM动态权重可能涉及的文本字段
+TEXT_COLUMN_FIELDS = [
+    "program_name", "discipline", "sub_discipline", "university", "academic_level",
+    "programme_type", "introduction", "tags", "fee_range", "admission_requirements"
+]
+FIELD_MATCH_CACHE_SIZE = 256  # 缓存的(字段, 词项)匹配位图数量
+
+_SEPARATOR = "\x00"  # 拼接列时的文档分隔符，不会出现在查询词项中
+
+
+class FieldTextColumns:
+    """按字段列式存储的小写文本，用于向量化计算字段匹配加分
+
+    每个字段的所有文档拼接为一个字符串（以\\x00分隔），子串匹配在整列上用str.find完成，
+    每个匹配的文档只查找一次，结果是与行号对齐的布尔位图，常用词项的位图会被缓存。
+    """
+
+    def __init__(self, ids: List[Any], documents: List[Dict[str, Any]],
+                 fields: Iterable[str] = TEXT_COLUMN_FIELDS, cache_size: int = FIELD_MATCH_CACHE_SIZE):
+        """构建列存储
+
+        Args:
+            ids: 文档ID列表，顺序与documents一致
+            documents: 文档列表，只需要包含fields中的字段
+            fields: 需要存储的字段
+            cache_size: 缓存的匹配位图数量，0表示不缓存
+        """
+        self.ids = np.array(ids, dtype=object)
+        self._positions = {doc_id: i for i, doc_id in enumerate(ids)}
+        self.cache_size = cache_size
+        self._match_cache: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 字段 -> (拼接后的小写文本, 每个文档的起始偏移)
+        self._columns = {}
+        for field in fields:
+            # 与逐文档打分一致：字段值为空时不参与匹配，其他类型按str()转换
+            values = [str(doc[field]).lower() if doc.get(field) else "" for doc in documents]
+            values = [value.replace(_SEPARATOR, " ") for value in values]
+            starts = []
+            offset = 0
+            for value in values:
+                starts.append(offset)
+                offset += len(value) + 1
+            self._columns[field] = (_SEPARATOR.join(values), starts)
+
+    @classmethod
+    def from_collection(cls, collection: Collection, fields: Iterable[str] = TEXT_COLUMN_FIELDS) -> "FieldTextColumns":
+        """从MongoDB集合构建列存储（只读取_id和文本字段）"""
+        fields = list(fields)
+        ids = []
+        documents = []
+        for doc in collection.find({}, {field: 1 for field in fields}):
+            ids.append(doc["_id"])
+            documents.append(doc)
+        return cls(ids, documents, fields)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self._columns)
+
+    def positions_of(self, doc_ids: List[Any]) -> np.ndarray:
+        """返回文档ID对应的行号，不在列存储中的ID返回-1"""
+        return np.array([self._positions.get(doc_id, -1) for doc_id in doc_ids], dtype=np.int64)
+
+    def contains(self, field: str, term: str) -> np.ndarray:
+        """返回字段值中包含term子串的文档位图（与行号对齐）"""
+        key = (field, term)
+        with self._lock:
+            mask = self._match_cache.get(key)
+            if mask is not None:
+                self._match_cache.move_to_end(key)
+                return mask
+
+        mask = np.zeros(len(self), dtype=bool)
+        if field in self._columns and term and _SEPARATOR not in term:
+            text, starts = self._columns[field]
+            count = len(starts)
+            position = text.find(term)
+            while position >= 0:
+                row = bisect_right(starts, position) - 1
+                mask[row] = True
+                # 跳到下一个文档继续查找，每个文档最多匹配一次
+                if row + 1 >= count:
+                    break
+                position = text.find(term, starts[row + 1])
+        mask.setflags(write=False)
+
+        if self.cache_size > 0:
+            with self._lock:
+                self._match_cache[key] = mask
+                while len(self._match_cache) > self.cache_size:
+                    self._match_cache.popitem(last=False)
+        return mask
+
+    def match_bonus(self, query: str, weights: Dict[str, float],
+                    positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """计算字段匹配加分
+
+        字段值包含完整查询时加 0.3·w，否则包含任一查询词时加 0.15·w。
+
+        Args:
+            query: 用户查询
+            weights: 字段权重
+            positions: 可选的行号，只返回这些文档的加分
+
+        Returns:
+            与positions（或全部行）对齐的加分数组
+        """
+        query_lower = query.lower()
+        terms = query_lower.split()
+        size = len(self) if positions is None else len(positions)
+        bonus = np.zeros(size, dtype=np.float32)
+        for field, weight in weights.items():
+            if field not in self._columns:
+                continue
+            full = self.contains(field, query_lower)
+            partial = np.zeros(len(self), dtype=bool)
+            for term in terms:
+                partial |= self.contains(field, term)
+            if positions is not None:
+                full = full[positions]
+                partial = partial[positions]
+            bonus += np.where(full, 0.3 * weight, np.where(partial, 0.15 * weight, 0.0)).astype(np.float32)
+        return bonus
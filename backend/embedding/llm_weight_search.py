@@ -1,5 +1,6 @@
 import json
 import os
+import re
 import sys
 import asyncio
 from typing import Dict, List, Any, Optional, Union
@@ -7,6 +8,15 @@ import numpy as np
 from pymongo import MongoClient
 from openai import OpenAI
 from dotenv import load_dotenv
+from query_cache import QueryEmbeddingCache, shared_query_cache
+from weight_cache import LLMWeightCache, shared_weight_cache
+from single_flight import SingleFlight
+from batch_encoder import MicroBatchEncoder
+from embedding_codec import decode_vector
+from document_projection import VECTOR_FIELDS, fetch_documents, fetch_documents_async, text_projection
+from search_executor import run_in_executor
+from field_columns import FieldTextColumns
+from vector_index import ExactVectorIndex, normalize_rows
 
 # 加载环境变量
 load_dotenv()
@@ -15,12 +25,17 @@ load_dotenv()
 DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY")
 DASHSCOPE_BASE_URL = os.getenv("DASHSCOPE_BASE_URL")
 LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "qwen-plus")  # 默认使用qwen-plus但优先使用环境变量
-MAX_CACHE_SIZE = 100  # 权重缓存大小
+LLM_CANDIDATE_LIMIT = int(os.getenv("LLM_CANDIDATE_LIMIT", "500"))  # 第二阶段打分的候选文档上限
+PREFILTER_MIN_WEIGHT = 2.0  # 只在权重不低于该值的字段上做关键词预过滤
 
 class LLMDynamicWeightSearch:
     """基于LLM的动态权重搜索系统"""
     
-    def __init__(self, vector_model, mongodb_collection, api_key=DASHSCOPE_API_KEY, model=LLM_MODEL_NAME):
+    def __init__(self, vector_model, mongodb_collection, api_key=DASHSCOPE_API_KEY, model=LLM_MODEL_NAME,
+                 vector_index=None, query_cache: Optional[QueryEmbeddingCache] = None,
+                 keyword_index=None, candidate_limit: int = LLM_CANDIDATE_LIMIT,
+                 text_columns: Optional[FieldTextColumns] = None, weight_cache: Optional[LLMWeightCache] = None,
+                 query_encoder: Optional[MicroBatchEncoder] = None, async_collection=None, executor=None):
         """初始化LLM动态权重搜索系统
         
         Args:
@@ -28,9 +43,26 @@ class LLMDynamicWeightSearch:
             mongodb_collection: MongoDB集合对象
             api_key: LLM API密钥
             model: 使用的LLM模型名称
+            vector_index: 可选的向量索引（精确、近似或量化索引），包含字段嵌入时动态权重会作用于向量相似度
+            query_cache: 查询向量缓存，默认使用所有搜索方式共享的缓存
+            keyword_index: 可选的BM25倒排索引，用于第一阶段的候选召回
+            candidate_limit: 第一阶段最多召回的候选文档数量
+            text_columns: 可选的小写字段文本列存储，用于向量化计算字段匹配加分
+            weight_cache: 持久化的LLM权重缓存，默认使用所有工作进程共享的SQLite缓存
+            query_encoder: 可选的微批查询编码器，与其他搜索请求的查询合并编码
+            async_collection: 可选的异步MongoDB集合（PyMongo异步API），没有时在线程池中使用同步集合
+            executor: 索引检索和候选打分使用的线程池，默认使用事件循环的默认线程池
         """
         self.vector_model = vector_model
         self.collection = mongodb_collection
+        self.vector_index = vector_index
+        self.query_cache = query_cache if query_cache is not None else shared_query_cache
+        self.keyword_index = keyword_index
+        self.candidate_limit = candidate_limit
+        self.text_columns = text_columns
+        self.query_encoder = query_encoder
+        self.async_collection = async_collection
+        self.executor = executor
         
         # 初始化API客户端
         self.client = OpenAI(
@@ -40,7 +72,9 @@ class LLMDynamicWeightSearch:
         self.model = model
         
         # 权重缓存
-        self.weight_cache = {}
+        self.weight_cache = weight_cache if weight_cache is not None else shared_weight_cache
+        # 相同查询的并发LLM请求只发送一次
+        self.weight_requests = SingleFlight()
         
     async def get_dynamic_weights(self, query: str) -> Dict[str, float]:
         """使用LLM分析查询并生成字段权重
@@ -51,12 +85,26 @@ class LLMDynamicWeightSearch:
         Returns:
             字段权重字典，如 {"program_name": 3.0, "discipline": 2.5, ...}
         """
-        # 检查缓存
-        cache_key = query.lower().strip()
-        if cache_key in self.weight_cache:
-            print(f"使用缓存的权重配置: {cache_key}")
-            return self.weight_cache[cache_key]
-            
+        # 检查缓存（精确匹配，其次是语义相近的已缓存查询）
+        query_vec = await self._encode_query(query)
+        embedding_model = self.query_cache.model_name
+        # 语义层需要与已缓存的查询向量比较，和SQLite读取一起放在线程池中
+        cached_weights = await run_in_executor(self.executor, self.weight_cache.get,
+                                               query, self.model, query_vec, embedding_model)
+        if cached_weights is not None:
+            print(f"使用缓存的权重配置: {query}")
+            return cached_weights
+        
+        # 同一查询的并发请求等待同一次LLM调用
+        request_key = f"{self.model}:{QueryEmbeddingCache.normalize_query(query)}"
+        weights = await self.weight_requests.do(
+            request_key, lambda: self._request_dynamic_weights(query, query_vec, embedding_model)
+        )
+        return dict(weights)
+    
+    async def _request_dynamic_weights(self, query: str, query_vec: Optional[np.ndarray],
+                                       embedding_model: Optional[str]) -> Dict[str, float]:
+        """调用LLM生成字段权重并写入缓存，失败时返回默认权重"""
         try:
             # 准备LLM提示
             prompt = f"""
@@ -106,10 +154,8 @@ class LLMDynamicWeightSearch:
                 normalized_weights = {k: min(max(float(v), 1.0), 5.0) for k, v in weights.items()}
                 
                 # 更新缓存
-                if len(self.weight_cache) >= MAX_CACHE_SIZE:
-                    # 如果缓存已满，删除一个随机条目
-                    self.weight_cache.pop(next(iter(self.weight_cache)))
-                self.weight_cache[cache_key] = normalized_weights
+                await asyncio.to_thread(self.weight_cache.put, query, self.model, normalized_weights,
+                                        query_vec, embedding_model)
                 
                 print(f"LLM生成的权重: {normalized_weights}")
                 return normalized_weights
@@ -123,6 +169,14 @@ class LLMDynamicWeightSearch:
             print(f"获取动态权重时出错: {e}")
             return self._get_default_weights()
             
+    async def _encode_query(self, query: str) -> Optional[np.ndarray]:
+        """生成查询向量（优先使用查询向量缓存），没有向量模型时返回None"""
+        if self.vector_model is None:
+            return None
+        if self.query_encoder is not None:
+            return await self.query_cache.get_or_encode_async(query, self.query_encoder.encode_async)
+        return self.query_cache.get_or_encode(query, lambda text: self.vector_model.encode([text])[0])
+    
     def _get_default_weights(self) -> Dict[str, float]:
         """获取默认权重配置"""
         return {
@@ -135,12 +189,178 @@ class LLMDynamicWeightSearch:
             "introduction": 1.0
         }
         
-    async def search(self, query: str, top_k: int = 10) -> List[Dict[str, Any]]:
+    def _candidate_ids(self, query: str, weights: Dict[str, float], query_vec: np.ndarray) -> Optional[List[Any]]:
+        """从进程内索引召回候选文档ID
+        
+        优先使用BM25倒排索引（只在高权重字段上匹配），没有匹配时退回向量索引的前candidate_limit个结果。
+        
+        Returns:
+            候选文档ID列表；两个索引都不可用时返回None
+        """
+        if self.keyword_index is not None and len(self.keyword_index) > 0:
+            prefilter_weights = {field: weight for field, weight in weights.items() if weight >= PREFILTER_MIN_WEIGHT}
+            ids, _ = self.keyword_index.search(query, self.candidate_limit, prefilter_weights or None)
+            if len(ids) > 0:
+                return ids.tolist()
+            print(f"倒排索引中未找到匹配'{query}'的候选文档，改用向量召回")
+        
+        if self.vector_index is not None and len(self.vector_index) > 0:
+            ids, _ = self.vector_index.search(query_vec, self.candidate_limit)
+            return ids.tolist()
+        return None
+    
+    def _scoring_projection(self, weights: Dict[str, float]) -> Dict[str, int]:
+        """打分阶段从MongoDB取回候选文档时的投影：_id、权重字段的文本和嵌入向量"""
+        projection = text_projection(weights)
+        projection["embedding"] = 1
+        return projection
+    
+    @staticmethod
+    def _prefilter_query(query: str, weights: Dict[str, float]) -> Dict[str, Any]:
+        """候选文档的正则预过滤条件：高权重字段包含任一查询词"""
+        query_terms = [term for term in query.split() if len(term) > 2]
+        filter_conditions = [
+            {field: {"$regex": re.escape(term), "$options": "i"}}
+            for field, weight in weights.items() if weight >= PREFILTER_MIN_WEIGHT
+            for term in query_terms
+        ]
+        return {"$or": filter_conditions} if filter_conditions else {}
+    
+    def _retrieve_candidates(self, query: str, weights: Dict[str, float], query_vec: np.ndarray) -> List[Dict[str, Any]]:
+        """没有进程内索引时的第一阶段：用正则预过滤检索不超过candidate_limit个候选文档"""
+        projection = self._scoring_projection(weights)
+        candidates = list(self.collection.find(self._prefilter_query(query, weights), projection).limit(self.candidate_limit))
+        if not candidates:
+            print(f"未找到匹配'{query}'的候选文档")
+            candidates = list(self.collection.find({}, projection).limit(self.candidate_limit))
+        return candidates
+    
+    async def _find_async(self, filter_query: Dict[str, Any], projection: Dict[str, int],
+                          limit: int = 0) -> List[Dict[str, Any]]:
+        """读取文档：有异步集合时使用异步驱动，否则在线程池中使用同步集合（limit为0表示不限制）"""
+        if self.async_collection is not None:
+            return await self.async_collection.find(filter_query, projection).limit(limit).to_list()
+        return await run_in_executor(
+            self.executor, lambda: list(self.collection.find(filter_query, projection).limit(limit))
+        )
+    
+    async def _retrieve_candidates_async(self, query: str, weights: Dict[str, float]) -> List[Dict[str, Any]]:
+        """_retrieve_candidates 的异步版本"""
+        projection = self._scoring_projection(weights)
+        candidates = await self._find_async(self._prefilter_query(query, weights), projection, self.candidate_limit)
+        if not candidates:
+            print(f"未找到匹配'{query}'的候选文档")
+            candidates = await self._find_async({}, projection, self.candidate_limit)
+        return candidates
+    
+    def score_candidates(self, query: str, query_vec: np.ndarray, weights: Dict[str, float],
+                         candidate_ids: List[Any], documents: Optional[List[Dict[str, Any]]] = None) -> np.ndarray:
+        """对候选文档批量打分：向量相似度 + 字段匹配加分
+        
+        向量相似度由内存索引的一次矩阵乘法得到，字段加分由列存储的匹配位图按字段向量化计算。
+        不在内存索引或列存储中的候选（如索引加载后新增的文档）从MongoDB取回后同样批量计算。
+        
+        Args:
+            query: 用户查询
+            query_vec: 查询向量
+            weights: 字段权重
+            candidate_ids: 候选文档ID
+            documents: 可选的已取回的候选文档（与candidate_ids对齐），提供时不再访问MongoDB
+            
+        Returns:
+            与candidate_ids对齐的分数数组
+        """
+        scores, vector_done, text_done = self._score_indexed(query, query_vec, weights, candidate_ids, documents)
+        remaining = np.flatnonzero(~(vector_done & text_done))
+        if len(remaining) == 0:
+            return scores
+        if documents is None:
+            missing_ids = [candidate_ids[i] for i in remaining]
+            fetched = self.collection.find({"_id": {"$in": missing_ids}}, self._scoring_projection(weights))
+            documents_by_row = self._rows_by_id(candidate_ids, remaining, fetched)
+        else:
+            documents_by_row = {i: documents[i] for i in remaining}
+        self._score_documents(query, query_vec, weights, candidate_ids, scores, vector_done, text_done, documents_by_row)
+        return scores
+    
+    async def _score_candidates_async(self, query: str, query_vec: np.ndarray, weights: Dict[str, float],
+                                      candidate_ids: List[Any],
+                                      documents: Optional[List[Dict[str, Any]]] = None) -> np.ndarray:
+        """score_candidates 的异步版本：打分在线程池中运行，缺少的候选文档通过异步驱动读取"""
+        scores, vector_done, text_done = await run_in_executor(
+            self.executor, self._score_indexed, query, query_vec, weights, candidate_ids, documents
+        )
+        remaining = np.flatnonzero(~(vector_done & text_done))
+        if len(remaining) == 0:
+            return scores
+        if documents is None:
+            missing_ids = [candidate_ids[i] for i in remaining]
+            fetched = await self._find_async({"_id": {"$in": missing_ids}}, self._scoring_projection(weights))
+            documents_by_row = self._rows_by_id(candidate_ids, remaining, fetched)
+        else:
+            documents_by_row = {i: documents[i] for i in remaining}
+        await run_in_executor(self.executor, self._score_documents, query, query_vec, weights, candidate_ids,
+                              scores, vector_done, text_done, documents_by_row)
+        return scores
+    
+    @staticmethod
+    def _rows_by_id(candidate_ids: List[Any], rows, fetched) -> Dict[int, Dict[str, Any]]:
+        """把取回的文档按ID对应到候选行，集合中已不存在的候选对应空文档"""
+        docs_by_id = {doc["_id"]: doc for doc in fetched}
+        return {i: docs_by_id.get(candidate_ids[i], {}) for i in rows}
+    
+    def _score_indexed(self, query: str, query_vec: np.ndarray, weights: Dict[str, float], candidate_ids: List[Any],
+                       documents: Optional[List[Dict[str, Any]]] = None):
+        """用内存索引和列存储为候选打分，返回 (分数, 已计算向量分数的行, 已计算字段加分的行)"""
+        count = len(candidate_ids)
+        scores = np.zeros(count, dtype=np.float32)
+        
+        # 基础向量相似度分数
+        # 索引中包含字段嵌入时，向量分数按动态权重组合各字段的相似度 Σ w_f·(q·e_f) / Σ w_f
+        vector_done = np.zeros(count, dtype=bool)
+        if documents is None and self.vector_index is not None and len(self.vector_index) > 0:
+            positions = self.vector_index.positions_of(candidate_ids)
+            vector_done = positions >= 0
+            if vector_done.any():
+                scores[vector_done] = self.vector_index.scores(query_vec, weights, positions[vector_done])
+        
+        # 字段匹配加分
+        text_done = np.zeros(count, dtype=bool)
+        if documents is None and self.text_columns is not None and len(self.text_columns) > 0:
+            positions = self.text_columns.positions_of(candidate_ids)
+            text_done = positions >= 0
+            if text_done.any():
+                scores[text_done] += self.text_columns.match_bonus(query, weights, positions[text_done])
+        return scores, vector_done, text_done
+    
+    def _score_documents(self, query: str, query_vec: np.ndarray, weights: Dict[str, float], candidate_ids: List[Any],
+                         scores: np.ndarray, vector_done: np.ndarray, text_done: np.ndarray,
+                         documents_by_row: Dict[int, Dict[str, Any]]) -> None:
+        """其余候选（不在内存索引或列存储中）用从MongoDB取回的字段同样按列批量打分，结果累加到scores"""
+        remaining = list(documents_by_row)
+        vector_rows = [i for i in remaining if not vector_done[i] and "embedding" in documents_by_row[i]]
+        if vector_rows:
+            matrix = normalize_rows(np.stack([
+                decode_vector(documents_by_row[i]["embedding"]).astype(np.float32) for i in vector_rows
+            ]))
+            scores[vector_rows] += matrix @ ExactVectorIndex._normalize_query(query_vec)
+        
+        text_rows = [i for i in remaining if not text_done[i]]
+        if text_rows:
+            columns = FieldTextColumns(
+                [candidate_ids[i] for i in text_rows], [documents_by_row[i] for i in text_rows],
+                [field for field in weights if field not in VECTOR_FIELDS], cache_size=0
+            )
+            scores[text_rows] += columns.match_bonus(query, weights)
+        return scores
+    
+    async def search(self, query: str, top_k: int = 10, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         """执行基于LLM动态权重的搜索
         
         Args:
             query: 用户搜索查询
             top_k: 返回结果数量
+            fields: 可选的返回字段列表，默认返回除向量和内部字段外的全部字段
             
         Returns:
             搜索结果列表及元数据
@@ -151,76 +371,43 @@ class LLMDynamicWeightSearch:
         # 获取动态权重
         weights = await self.get_dynamic_weights(query)
         
-        # 生成查询向量
-        query_vec = self.vector_model.encode([query])[0]
-        
-        # 第一阶段：基于关键词快速过滤潜在相关文档
-        query_terms = [term for term in query.split() if len(term) > 2]
-        filter_conditions = []
-        
-        # 为每个字段和查询词生成匹配条件
-        for field, weight in weights.items():
-            if weight >= 2.0:  # 只对权重较高的字段应用预过滤
-                for term in query_terms:
-                    filter_conditions.append({field: {"$regex": term, "$options": "i"}})
+        # 生成查询向量（优先使用查询向量缓存）
+        query_vec = await self._encode_query(query)
         
-        # 如果有过滤条件，则应用它们
-        filter_query = {"$or": filter_conditions} if filter_conditions else {}
-        
-        # 检索候选文档
-        candidates = list(self.collection.find(filter_query))
-        if not candidates:
-            print(f"未找到匹配'{query}'的候选文档")
-            # 如果没有找到匹配项，尝试不使用过滤器
-            candidates = list(self.collection.find({}))
-            if not candidates:
-                return []
+        # 第一阶段：基于倒排索引召回有限数量的候选文档
+        # 索引检索和打分在搜索线程池中运行，MongoDB通过异步驱动读取，事件循环不被阻塞
+        documents = None
+        candidate_ids = await run_in_executor(self.executor, self._candidate_ids, query, weights, query_vec)
+        if candidate_ids is None:
+            documents = await self._retrieve_candidates_async(query, weights)
+            candidate_ids = [doc["_id"] for doc in documents]
+        if not candidate_ids:
+            return []
         
         # 第二阶段：应用动态权重和向量相似度
-        results = []
-        for doc in candidates:
-            score = 0.0
-            
-            # 基础向量相似度分数
-            if "embedding" in doc:
-                doc_vec = np.array(doc["embedding"])
-                similarity = np.dot(query_vec, doc_vec) / (np.linalg.norm(query_vec) * np.linalg.norm(doc_vec))
-                score += similarity
-            
-            # 应用字段权重增加分数
-            for field, weight in weights.items():
-                if field in doc and doc[field]:
-                    # 字段匹配加分
-                    field_value = str(doc[field]).lower()
-                    query_lower = query.lower()
-                    
-                    # 完全匹配得高分
-                    if query_lower in field_value:
-                        score += 0.3 * weight
-                    # 部分匹配得中等分数
-                    elif any(term in field_value for term in query_lower.split()):
-                        score += 0.15 * weight
-            
-            # 创建结果副本，移除嵌入向量减小大小
-            result_doc = doc.copy()
-            if "embedding" in result_doc:
-                del result_doc["embedding"]
-            
+        scores = await self._score_candidates_async(query, query_vec, weights, candidate_ids, documents)
+        top = ExactVectorIndex._top_k_indices(scores, top_k)
+        
+        # 只为前K个结果取回展示字段
+        sorted_results = []
+        top_ids = [candidate_ids[i] for i in top]
+        scores_by_id = {doc_id: float(scores[i]) for doc_id, i in zip(top_ids, top)}
+        if self.async_collection is not None:
+            result_docs = await fetch_documents_async(self.async_collection, top_ids, fields)
+        else:
+            result_docs = await run_in_executor(self.executor, fetch_documents, self.collection, top_ids, fields)
+        for result_doc in result_docs:
+            score = scores_by_id[result_doc["_id"]]
             # 确保_id是字符串
-            if "_id" in result_doc:
-                result_doc["_id"] = str(result_doc["_id"])
-                
-            results.append({
+            result_doc["_id"] = str(result_doc["_id"])
+            sorted_results.append({
                 "document": result_doc,
-                "score": float(score),
+                "score": score,
                 "match_info": {
                     "weights_used": weights,
                     "query": query
                 }
             })
         
-        # 按分数排序并返回前K个结果
-        sorted_results = sorted(results, key=lambda x: x["score"], reverse=True)[:top_k]
-        
-        print(f"LLM权重搜索找到 {len(sorted_results)} 个结果(共 {len(candidates)} 个候选项)")
-        return sorted_results 
\ No newline at end of file
+        print(f"LLM权重搜索找到 {len(sorted_results)} 个结果(共 {len(candidate_ids)} 个候选项)")
+        return sorted_results 
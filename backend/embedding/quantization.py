@@ -0,0 +1,268 @@
+import os
+from typing import Dict, Optional, Tuple
+import numpy as np
+from vector_index import ExactVectorIndex
+
+# 压缩打分后用全精度向量重新打分的候选数量
+QUANTIZED_RESCORE_K = int(os.getenv("QUANTIZED_RESCORE_K", "200"))
+# 乘积量化的子空间数量（向量维度必须能被整除），每个子空间用1字节编码
+PQ_SUBSPACES = int(os.getenv("PQ_SUBSPACES", "96"))
+PQ_TRAIN_SAMPLE = 50000
+PQ_TRAIN_ITERATIONS = 20
+SCORE_CHUNK_SIZE = 16384  # 压缩打分时每块解码的行数，限制临时内存
+
+
+def _kmeans(data: np.ndarray, k: int, iterations: int = PQ_TRAIN_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """欧氏距离k-means，返回聚类中心 (k, d)"""
+    rng = np.random.default_rng(seed)
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        distances = (centroids ** 2).sum(axis=1)[None, :] - 2 * data @ centroids.T
+        assignments = np.argmin(distances, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, data)
+        counts = np.bincount(assignments, minlength=k)
+        nonempty = counts > 0
+        centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+        # 空的聚类重新随机选一个样本作为中心
+        empty = np.flatnonzero(~nonempty)
+        if len(empty) > 0:
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+    return centroids.astype(np.float32)
+
+
+class ScalarQuantizer:
+    """逐维度的int8标量量化
+
+    每个维度按数据的最小/最大值线性映射到[-128, 127]，
+    内积可直接在编码上计算：q·x ≈ q·center + (q*scale)·codes。
+    """
+
+    method = "int8"
+
+    def __init__(self, minimum: np.ndarray, scale: np.ndarray):
+        self.minimum = np.asarray(minimum, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.center = self.minimum + 128.0 * self.scale
+
+    @classmethod
+    def fit(cls, data: np.ndarray) -> "ScalarQuantizer":
+        minimum = data.min(axis=0)
+        scale = (data.max(axis=0) - minimum) / 255.0
+        scale[scale == 0] = 1.0
+        return cls(minimum, scale)
+
+    def encode(self, data: np.ndarray) -> np.ndarray:
+        codes = np.empty(data.shape, dtype=np.int8)
+        for start in range(0, len(data), SCORE_CHUNK_SIZE):
+            chunk = np.asarray(data[start:start + SCORE_CHUNK_SIZE], dtype=np.float32)
+            chunk_codes = np.rint((chunk - self.minimum) / self.scale) - 128
+            codes[start:start + len(chunk)] = np.clip(chunk_codes, -128, 127)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return self.center + codes.astype(np.float32) * self.scale
+
+    def score(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """在编码上计算与查询向量的近似内积"""
+        scaled_query = query * self.scale
+        bias = float(query @ self.center)
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_CHUNK_SIZE):
+            chunk = codes[start:start + SCORE_CHUNK_SIZE].astype(np.float32)
+            scores[start:start + SCORE_CHUNK_SIZE] = chunk @ scaled_query + bias
+        return scores
+
+    def bytes_per_vector(self, dimension: int) -> int:
+        return dimension
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"minimum": self.minimum, "scale": self.scale}
+
+    @classmethod
+    def from_state(cls, state) -> "ScalarQuantizer":
+        return cls(state["minimum"], state["scale"])
+
+
+class ProductQuantizer:
+    """乘积量化（PQ）
+
+    把向量切分为M个子空间，每个子空间用256个中心的码本编码为1字节。
+    查询时先计算查询各子向量与码本的内积表，再按编码查表求和（ADC）。
+    """
+
+    method = "pq"
+
+    def __init__(self, codebooks: np.ndarray):
+        """codebooks: 形状为 (M, 256, D/M) 的码本"""
+        self.codebooks = np.asarray(codebooks, dtype=np.float32)
+        self.subspaces, _, self.sub_dimension = self.codebooks.shape
+
+    @classmethod
+    def fit(cls, data: np.ndarray, subspaces: int = PQ_SUBSPACES, train_sample: int = PQ_TRAIN_SAMPLE,
+            seed: int = 0) -> "ProductQuantizer":
+        dimension = data.shape[1]
+        if dimension % subspaces != 0:
+            raise ValueError(f"向量维度 {dimension} 不能被子空间数量 {subspaces} 整除")
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(data[np.sort(rng.choice(len(data), min(train_sample, len(data)), replace=False))])
+        sub_dimension = dimension // subspaces
+        codebooks = np.zeros((subspaces, 256, sub_dimension), dtype=np.float32)
+        for m in range(subspaces):
+            centroids = _kmeans(sample[:, m * sub_dimension:(m + 1) * sub_dimension], 256, seed=seed + m)
+            codebooks[m, :len(centroids)] = centroids
+        return cls(codebooks)
+
+    def encode(self, data: np.ndarray) -> np.ndarray:
+        codes = np.empty((len(data), self.subspaces), dtype=np.uint8)
+        for start in range(0, len(data), SCORE_CHUNK_SIZE):
+            chunk = np.asarray(data[start:start + SCORE_CHUNK_SIZE], dtype=np.float32)
+            for m in range(self.subspaces):
+                sub = chunk[:, m * self.sub_dimension:(m + 1) * self.sub_dimension]
+                codebook = self.codebooks[m]
+                distances = (codebook ** 2).sum(axis=1)[None, :] - 2 * sub @ codebook.T
+                codes[start:start + len(chunk), m] = np.argmin(distances, axis=1)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return self.codebooks[np.arange(self.subspaces), codes].reshape(len(codes), -1)
+
+    def score(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """用查表法在编码上计算与查询向量的近似内积"""
+        tables = np.einsum('mkd,md->mk', self.codebooks, query.reshape(self.subspaces, self.sub_dimension))
+        subspace_index = np.arange(self.subspaces)
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_CHUNK_SIZE):
+            chunk = codes[start:start + SCORE_CHUNK_SIZE]
+            scores[start:start + len(chunk)] = tables[subspace_index, chunk].sum(axis=1)
+        return scores
+
+    def bytes_per_vector(self, dimension: int) -> int:
+        return self.subspaces
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"codebooks": self.codebooks}
+
+    @classmethod
+    def from_state(cls, state) -> "ProductQuantizer":
+        return cls(state["codebooks"])
+
+
+class QuantizedVectorIndex:
+    """压缩向量索引：在量化编码上打分，再用全精度向量对前rescore_k个候选重新打分
+
+    全精度向量来自base（mmap加载的嵌入快照），只有被重新打分的少量行会被读入内存，
+    常驻内存的只有压缩编码。base是常驻内存的float32矩阵时，编码是额外的内存而不是替代，
+    且压缩打分比精确扫描更慢，因此默认拒绝这种组合。
+    """
+
+    kind = ""
+    quantizer_class = None
+
+    def __init__(self, base: ExactVectorIndex, quantizer, codes: np.ndarray, rescore_k: int = QUANTIZED_RESCORE_K):
+        """初始化索引
+
+        Args:
+            base: 提供ID和全精度向量的精确索引
+            quantizer: ScalarQuantizer或ProductQuantizer
+            codes: 所有向量的量化编码
+            rescore_k: 用全精度向量重新打分的候选数量
+        """
+        self.base = base
+        self.quantizer = quantizer
+        self.codes = codes
+        self.rescore_k = rescore_k
+
+    @classmethod
+    def build(cls, base: ExactVectorIndex, rescore_k: int = QUANTIZED_RESCORE_K, allow_resident: bool = False,
+              **params) -> "QuantizedVectorIndex":
+        """从精确索引离线训练量化器并编码所有向量
+
+        Args:
+            base: 精确索引，需要以mmap方式加载嵌入快照
+            rescore_k: 用全精度向量重新打分的候选数量
+            allow_resident: 允许base为常驻内存的矩阵（用于基准测试比较召回）
+        """
+        if not base.memory_mapped and not allow_resident:
+            raise ValueError(f"{cls.kind} 索引需要mmap加载的嵌入快照作为全精度向量来源，"
+                             "常驻内存的float32矩阵之外再保存压缩编码只会增加内存占用")
+        quantizer = cls.quantizer_class.fit(np.asarray(base.matrix), **params)
+        return cls(base, quantizer, quantizer.encode(base.matrix), rescore_k)
+
+    def __len__(self) -> int:
+        return len(self.base)
+
+    @property
+    def dimension(self) -> int:
+        return self.base.dimension
+
+    @property
+    def indexed_count(self) -> int:
+        return len(self.codes)
+
+    @property
+    def bytes_per_vector(self) -> int:
+        """每个向量常驻内存的编码字节数（不含共享的量化参数）"""
+        return self.quantizer.bytes_per_vector(self.dimension)
+
+    def positions_of(self, doc_ids) -> np.ndarray:
+        return self.base.positions_of(doc_ids)
+
+    def scores(self, query_vec: np.ndarray, field_weights: Optional[Dict[str, float]] = None,
+               positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """计算查询向量与文档的相似度
+
+        字段加权打分直接使用全精度字段嵌入（通常只针对有限的候选集）；
+        否则先在压缩编码上打分，再对其中前rescore_k个用全精度向量重新打分。
+        """
+        if self.base._field_weight_vector(field_weights) is not None:
+            return self.base.scores(query_vec, field_weights, positions)
+
+        query = ExactVectorIndex._normalize_query(query_vec)
+        codes = self.codes if positions is None else self.codes[positions]
+        scores = self.quantizer.score(codes, query)
+
+        rescore = ExactVectorIndex._top_k_indices(scores, self.rescore_k)
+        rows = rescore if positions is None else np.asarray(positions)[rescore]
+        scores[rescore] = self.base.scores(query, None, rows)
+        return scores
+
+    def search(self, query_vec: np.ndarray, top_k: int = 5,
+               field_weights: Optional[Dict[str, float]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """在压缩编码上检索候选，用全精度向量重新打分后返回前top_k个结果
+
+        Returns:
+            (文档ID数组, 相似度数组)，按相似度从高到低排序
+        """
+        if field_weights:
+            return self.base.search(query_vec, top_k, field_weights)
+        if len(self) == 0 or top_k <= 0:
+            return np.array([], dtype=object), np.array([], dtype=np.float32)
+
+        query = ExactVectorIndex._normalize_query(query_vec)
+        approximate = self.quantizer.score(self.codes, query)
+        candidates = ExactVectorIndex._top_k_indices(approximate, max(top_k, self.rescore_k))
+        exact = self.base.scores(query, None, candidates)
+        top = ExactVectorIndex._top_k_indices(exact, top_k)
+        return self.base.ids[candidates[top]], exact[top]
+
+    def save(self, path: str) -> None:
+        np.savez(path, codes=self.codes, **self.quantizer.state())
+
+    @classmethod
+    def load(cls, path: str, base: ExactVectorIndex, rescore_k: int = QUANTIZED_RESCORE_K) -> "QuantizedVectorIndex":
+        with np.load(path) as data:
+            return cls(base, cls.quantizer_class.from_state(data), data["codes"], rescore_k)
+
+
+class Int8VectorIndex(QuantizedVectorIndex):
+    """int8标量量化索引，每个768维向量占768字节（float32的1/4）"""
+    kind = "int8"
+    quantizer_class = ScalarQuantizer
+
+
+class PQVectorIndex(QuantizedVectorIndex):
+    """乘积量化索引，每个向量占PQ_SUBSPACES字节（默认96字节，float32的1/32）"""
+    kind = "pq"
+    quantizer_class = ProductQuantizer
@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Any, Optional, Tuple
+import numpy as np
+
+# 查询向量缓存配置
+QUERY_CACHE_SIZE = 1024  # 最多缓存的查询数量
+QUERY_CACHE_TTL = None  # 缓存有效期（秒），None表示不过期
+
+
+class QueryEmbeddingCache:
+    """查询向量的LRU缓存（可选TTL）
+
+    以规范化后的查询文本为键缓存float32查询向量，供所有搜索方式共享。
+    缓存与模型名称绑定，模型变化时自动清空。
+    """
+
+    def __init__(self, max_size: int = QUERY_CACHE_SIZE, ttl: Optional[float] = QUERY_CACHE_TTL):
+        """初始化缓存
+
+        Args:
+            max_size: 最多缓存的查询数量
+            ttl: 缓存有效期（秒），None表示不过期
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.model_name: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """规范化查询文本：小写并合并多余空白"""
+        return ' '.join(query.lower().split())
+
+    def bind_model(self, model_name: str) -> None:
+        """绑定生成向量的编码器，标识（模型名称、后端和精度，见 encoder_key）变化时清空缓存"""
+        with self._lock:
+            if self.model_name != model_name:
+                if self.model_name is not None:
+                    print(f"模型从 {self.model_name} 变为 {model_name}，清空查询向量缓存")
+                self._entries.clear()
+                self.model_name = model_name
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        """获取缓存的查询向量，未命中或已过期时返回None"""
+        key = self.normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector, created_at = entry
+                if self.ttl is None or time.monotonic() - created_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, query: str, vector: np.ndarray) -> np.ndarray:
+        """缓存查询向量，返回缓存中保存的只读float32向量"""
+        key = self.normalize_query(query)
+        vector = np.array(vector, dtype=np.float32).ravel()
+        vector.setflags(write=False)  # 缓存的向量被多个请求共享，禁止原地修改
+        with self._lock:
+            self._entries[key] = (vector, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return vector
+
+    def get_or_encode(self, query: str, encode: Callable[[str], np.ndarray]) -> np.ndarray:
+        """获取查询向量，未命中时调用encode生成并缓存
+
+        Args:
+            query: 查询文本
+            encode: 为单个查询生成向量的函数
+
+        Returns:
+            float32查询向量
+        """
+        vector = self.get(query)
+        if vector is None:
+            vector = self.put(query, encode(query))
+        return vector
+
+    async def get_or_encode_async(self, query: str, encode: Callable[[str], Awaitable[np.ndarray]]) -> np.ndarray:
+        """get_or_encode 的异步版本，未命中时等待encode生成向量
+
+        Args:
+            query: 查询文本
+            encode: 为单个查询生成向量的协程函数
+
+        Returns:
+            float32查询向量
+        """
+        vector = self.get(query)
+        if vector is None:
+            vector = self.put(query, await encode(query))
+        return vector
+
+    def clear(self) -> None:
+        """清空缓存和统计数据"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "model_name": self.model_name
+            }
+
+
+# 所有搜索方式共享的查询向量缓存
+shared_query_cache = QueryEmbeddingCache()
@@ -0,0 +1,24 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+# 搜索请求中CPU密集的步骤（索引检索、候选打分）使用的线程数；NumPy的矩阵运算会释放GIL，多个请求可以并行
+SEARCH_EXECUTOR_WORKERS = int(os.getenv("SEARCH_EXECUTOR_WORKERS", "4"))
+
+
+def create_search_executor(workers: int = SEARCH_EXECUTOR_WORKERS) -> ThreadPoolExecutor:
+    """创建有界的搜索线程池（在工作进程中创建，线程不能跨fork继承）"""
+    return ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="search-cpu")
+
+
+async def run_in_executor(executor: Optional[ThreadPoolExecutor], func: Callable[..., Any], *args, **kwargs) -> Any:
+    """在线程池中运行同步函数，等待期间事件循环继续处理其他请求
+
+    Args:
+        executor: 搜索线程池，None表示使用事件循环的默认线程池
+        func: 同步函数
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
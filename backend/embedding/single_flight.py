@@ -0,0 +1,76 @@
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class SingleFlight:
+    """合并相同键的并发请求：同一时刻只有一个调用真正执行，其余调用等待它的结果
+
+    上游调用在一个不属于任何调用者的任务中运行，每个调用者通过asyncio.shield等待：
+    某个调用者（包括第一个发起调用的请求）断开连接被取消时，只取消它自己的等待，
+    上游调用继续执行，其他调用者照常得到结果。
+    结果同时写入线程安全的concurrent.futures.Future，其他线程的事件循环中的调用者（如 asyncio.run）等待它。
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, Tuple[asyncio.Task, concurrent.futures.Future]] = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """执行func并返回结果；已有相同键的调用在进行中时，直接等待那次调用的结果
+
+        Args:
+            key: 请求键，如规范化后的查询文本
+            func: 返回协程的函数，只有第一个调用者会执行
+
+        Returns:
+            func的结果（异常同样会传递给所有等待者，调用者自身被取消时只有它收到CancelledError）
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                future = concurrent.futures.Future()
+                task = loop.create_task(self._run(key, func, future))
+                # 所有调用者都已取消时，任务的异常没有人读取，在这里取出以免事件循环报告未处理的异常
+                task.add_done_callback(lambda done: done.cancelled() or done.exception())
+                call = (task, future)
+                self._calls[key] = call
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        task, future = call
+        if task.get_loop() is loop:
+            return await asyncio.shield(task)
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    async def _run(self, key: str, func: Callable[[], Awaitable[Any]], future: concurrent.futures.Future) -> Any:
+        """执行上游调用，并把结果或异常写入供其他事件循环等待的Future"""
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            if not future.done():
+                future.cancel()
+            raise
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+            raise
+        else:
+            if not future.done():
+                future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is not None and call[1] is future:
+                    del self._calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        """返回执行和合并的请求数量"""
+        with self._lock:
+            return {"in_flight": len(self._calls), "executed": self.executed, "coalesced": self.coalesced}
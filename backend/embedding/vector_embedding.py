@@ -1,12 +1,28 @@
+import hashlib
 import json
 import os
 import sys
-from typing import List, Dict, Any, Optional, Union
+import time
+from typing import List, Dict, Any, Optional, Union, Tuple
 import numpy as np
-from pymongo import MongoClient
+from pymongo import MongoClient, ReplaceOne, UpdateOne
 from pymongo.collection import Collection
 from pymongo.database import Database
-from FlagEmbedding import FlagModel
+try:
+    from pymongo import AsyncMongoClient
+except ImportError:
+    AsyncMongoClient = None # PyMongo 4.13之前没有异步API，搜索请求改为在线程池中使用同步客户端
+from encoder_backend import ENCODER_BACKEND, create_encoder, encoder_key
+from batch_encoder import MicroBatchEncoder
+from vector_index import ExactVectorIndex, normalize_rows
+from query_cache import QueryEmbeddingCache, shared_query_cache
+from embedding_codec import EMBEDDING_STORAGE_DTYPE, encode_vector
+from embedding_snapshot import SNAPSHOT_DIR, collection_fingerprint, read_snapshot_meta, load_snapshot, write_snapshot
+from ann_index import QUANTIZED_INDEX_TYPES, VECTOR_INDEX_TYPE, build_ann_index, load_ann_index, save_ann_index
+from bm25_index import BM25Index
+from document_projection import display_projection, fetch_documents, fetch_documents_async
+from field_columns import FieldTextColumns
+from search_executor import run_in_executor
 
 # 配置常量
 MODEL_NAME = 'BAAI/bge-base-en-v1.5'
@@ -14,6 +30,11 @@ MONGODB_URI = "mongodb://localhost:27017/"
 DB_NAME = "sim_programs"
 COLLECTION_NAME = "programs"
 
+# 批量编码配置
+ENCODE_BATCH_SIZE = 256  # 每次前向计算的批大小
+EMBEDDING_CHUNK_SIZE = 2048  # 每次处理的项目数，限制 (N, F, D) 张量的内存占用
+WRITE_BATCH_SIZE = 500  # 每次bulk_write提交的操作数
+
 # 默认字段权重配置
 DEFAULT_FIELD_WEIGHTS = {
     "program_name": 3.0,
@@ -26,23 +47,182 @@ DEFAULT_FIELD_WEIGHTS = {
     "introduction": 1.0
 }
 
+# 单独存储字段嵌入的字段，顺序即 (N, F, D) 字段嵌入张量中F维的顺序
+EMBEDDING_FIELDS = list(DEFAULT_FIELD_WEIGHTS.keys())
+
+def program_key(program: Dict[str, Any]) -> str:
+    """生成项目的唯一键
+    
+    同一个data_id的项目可能同时出现在多个学科/子学科下（数据内容不同），
+    因此用data_id加学科和子学科作为增量更新的键。
+    """
+    return f"{program.get('data_id')}|{program.get('discipline', '')}|{program.get('sub_discipline', '')}"
+
+def compute_content_hash(program: Dict[str, Any], field_weights: Dict[str, float], model_name: str,
+                         storage_dtype: str = EMBEDDING_STORAGE_DTYPE) -> str:
+    """计算影响存储嵌入的内容哈希：参与编码的字段文本、字段权重配置、模型名称和存储格式"""
+    fields = EMBEDDING_FIELDS + [field for field in field_weights if field not in EMBEDDING_FIELDS]
+    payload = {
+        "fields": {field: program.get(field) for field in fields},
+        "weights": field_weights,
+        "model": model_name,
+        "storage": storage_dtype
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+def connect_async_collection():
+    """创建异步MongoDB客户端，返回 (client, collection)；PyMongo不支持异步API时返回 (None, None)
+
+    异步客户端绑定使用它的事件循环，需要在工作进程的事件循环中创建。
+    """
+    if AsyncMongoClient is None:
+        return None, None
+    client = AsyncMongoClient(MONGODB_URI)
+    return client, client[DB_NAME][COLLECTION_NAME]
+
+def compute_document_hash(program: Dict[str, Any]) -> str:
+    """计算整个项目数据的哈希，用于发现不影响嵌入的字段变化（如学费、申请日期）"""
+    return hashlib.sha256(json.dumps(program, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
 class VectorEmbedding:
-    def __init__(self, model_name: str = MODEL_NAME, use_fp16: bool = True):
-        """初始化BGE模型和MongoDB连接"""
-        print("正在加载BGE模型...")
-        self.model = FlagModel(
-            model_name,
-            query_instruction_for_retrieval="Represent this text for retrieval:",
-            use_fp16=use_fp16
-        )
+    def __init__(self, model_name: str = MODEL_NAME, use_fp16: bool = True,
+                 query_cache: Optional[QueryEmbeddingCache] = None,
+                 storage_dtype: str = EMBEDDING_STORAGE_DTYPE,
+                 index_type: str = VECTOR_INDEX_TYPE,
+                 encoder_backend: str = ENCODER_BACKEND):
+        """初始化BGE模型和MongoDB连接
+        
+        Args:
+            model_name: BGE模型名称
+            use_fp16: 是否使用半精度推理
+            query_cache: 查询向量缓存，默认使用所有搜索方式共享的缓存
+            storage_dtype: 嵌入向量在MongoDB中的存储格式（"list"、"float32"或"float16"）
+            index_type: 向量索引类型（"exact"、"ivf"或"hnsw"）
+            encoder_backend: 编码器后端（"torch"或"onnx"）
+        """
+        print(f"正在加载BGE模型（{encoder_backend}后端）...")
+        self.model = create_encoder(model_name, encoder_backend, use_fp16)
+        self.encoder_backend = encoder_backend
         print(f"BGE模型 {model_name} 加载完成")
+        self.model_name = model_name
+        # 并发请求的查询在几毫秒的窗口内合并为一次批量编码
+        self.query_encoder = MicroBatchEncoder(self.model.encode)
+        
+        # 查询向量缓存，模型、编码器后端或量化方式变化时自动失效
+        self.query_cache = query_cache if query_cache is not None else shared_query_cache
+        self.query_cache.bind_model(encoder_key(model_name, encoder_backend, use_fp16))
         
         # 初始化MongoDB连接
+        self.connect()
+        # 搜索请求使用的异步集合和CPU线程池，由服务在工作进程的事件循环中设置（见 SearchServices）
+        self.async_collection = None
+        self.executor = None
+        
+        # 常驻内存的向量索引，在服务启动时通过load_vector_index加载
+        self.vector_index: Optional[ExactVectorIndex] = None
+        # 可选的近似最近邻索引（IVF/HNSW），基于vector_index构建
+        self.index_type = index_type
+        self.ann_index = None
+        # 关键词搜索使用的BM25倒排索引，在服务启动时通过load_keyword_index加载
+        self.keyword_index: Optional[BM25Index] = None
+        # LLM动态权重搜索计算字段匹配加分使用的小写文本列存储
+        self.text_columns: Optional[FieldTextColumns] = None
+        # 嵌入向量的存储格式
+        self.storage_dtype = storage_dtype
+        # 非Atlas实例上$vectorSearch会失败，失败一次后不再尝试；二进制格式的嵌入不支持$vectorSearch
+        self.atlas_search_available = storage_dtype == "list"
+    
+    def connect(self) -> None:
+        """创建MongoDB连接
+
+        MongoClient不能跨fork使用：预分叉的工作进程继承父进程加载的模型和索引后，需要调用此方法重新连接。
+        """
         self.client = MongoClient(MONGODB_URI)
         self.db = self.client[DB_NAME]
         self.collection = self.db[COLLECTION_NAME]
         print(f"已连接到MongoDB: {MONGODB_URI}, 数据库: {DB_NAME}, 集合: {COLLECTION_NAME}")
     
+    def load_vector_index(self, use_snapshot: bool = True, snapshot_dir: str = SNAPSHOT_DIR) -> ExactVectorIndex:
+        """加载常驻内存的精确向量索引
+        
+        优先以mmap方式加载嵌入快照；快照不存在或已过期（集合指纹或模型不一致）时，
+        从MongoDB加载所有嵌入向量。
+        
+        Args:
+            use_snapshot: 是否尝试使用嵌入快照
+            snapshot_dir: 快照目录
+        """
+        print("正在加载向量索引...")
+        self.vector_index = None
+        if use_snapshot:
+            self.vector_index = load_snapshot(snapshot_dir, collection_fingerprint(self.collection), self.model_name)
+            if self.vector_index is None:
+                print("从MongoDB加载向量索引，运行 python vector_embedding.py 可重新生成快照")
+        if self.vector_index is None:
+            self.vector_index = ExactVectorIndex.from_collection(self.collection, EMBEDDING_FIELDS)
+        if len(self.vector_index) > 0:
+            print(f"向量索引加载完成，共 {len(self.vector_index)} 个向量，维度: {self.vector_index.dimension}")
+        else:
+            print("向量索引为空，集合中没有嵌入向量")
+        
+        # 加载与快照版本匹配的近似索引，不存在时在进程内构建
+        self.ann_index = None
+        if self.index_type != "exact" and len(self.vector_index) > 0:
+            self.ann_index = load_ann_index(self.index_type, self.vector_index, snapshot_dir,
+                                            self.vector_index.snapshot_version)
+            if self.ann_index is None and self.index_type in QUANTIZED_INDEX_TYPES and not self.vector_index.memory_mapped:
+                # 量化索引只在全精度向量来自mmap快照时节省内存，否则编码是常驻矩阵之外的额外占用
+                print(f"{self.index_type} 索引需要嵌入快照（运行 python vector_embedding.py 生成），"
+                      "当前向量从MongoDB加载并常驻内存，改用精确索引")
+            elif self.ann_index is None:
+                self.ann_index = build_ann_index(self.index_type, self.vector_index)
+        return self.vector_index
+    
+    def load_keyword_index(self) -> BM25Index:
+        """从MongoDB读取文本字段，构建BM25倒排索引（字段权重取自DEFAULT_FIELD_WEIGHTS）"""
+        start_time = time.perf_counter()
+        self.keyword_index = BM25Index.from_collection(self.collection, DEFAULT_FIELD_WEIGHTS)
+        print(f"BM25索引构建完成，共 {len(self.keyword_index)} 个文档，"
+              f"{len(self.keyword_index.postings)} 个词项，耗时 {time.perf_counter() - start_time:.2f} 秒")
+        return self.keyword_index
+    
+    def load_text_columns(self) -> FieldTextColumns:
+        """从MongoDB读取文本字段，构建按字段存储的小写文本列"""
+        start_time = time.perf_counter()
+        self.text_columns = FieldTextColumns.from_collection(self.collection)
+        print(f"字段文本列构建完成，共 {len(self.text_columns)} 个文档，耗时 {time.perf_counter() - start_time:.2f} 秒")
+        return self.text_columns
+    
+    def load_indexes(self) -> None:
+        """加载查询所需的全部内存索引（向量索引、BM25索引和字段文本列）"""
+        self.load_vector_index()
+        self.load_keyword_index()
+        self.load_text_columns()
+    
+    @property
+    def search_index(self):
+        """查询使用的索引：配置了近似/量化索引时使用它，否则使用精确索引"""
+        return self.ann_index if self.ann_index is not None else self.vector_index
+    
+    def write_embedding_snapshot(self, snapshot_dir: str = SNAPSHOT_DIR) -> None:
+        """从MongoDB加载当前嵌入并写入mmap快照，快照已是最新时跳过
+        
+        配置了近似索引类型时，同时构建并保存与快照版本绑定的近似索引。
+        """
+        fingerprint = collection_fingerprint(self.collection)
+        meta = read_snapshot_meta(snapshot_dir)
+        if meta and meta.get("fingerprint") == fingerprint and meta.get("model_name") == self.model_name:
+            print(f"嵌入快照 {meta['version']} 已是最新")
+            index = load_snapshot(snapshot_dir)
+        else:
+            index = ExactVectorIndex.from_collection(self.collection, EMBEDDING_FIELDS)
+            index.snapshot_version = write_snapshot(index, fingerprint, self.model_name, snapshot_dir)["version"]
+        
+        # 离线构建近似索引并与快照版本一起保存
+        if self.index_type != "exact" and index is not None and len(index) > 0:
+            if load_ann_index(self.index_type, index, snapshot_dir, index.snapshot_version) is None:
+                save_ann_index(build_ann_index(self.index_type, index), snapshot_dir, index.snapshot_version)
+    
     def prepare_text_from_program(self, program: Dict[str, Any]) -> str:
         """从项目数据中准备用于生成嵌入的文本"""
         # 组合项目名称、学科、子学科、简介等信息
@@ -59,6 +239,20 @@ class VectorEmbedding:
         # 过滤掉空字符串并用空格连接
         return ' '.join(filter(None, text_parts))
     
+    def encode_query(self, query: str) -> np.ndarray:
+        """生成查询向量，优先使用查询向量缓存；未命中时与其他并发查询合并编码"""
+        return self.query_cache.get_or_encode(query, self.query_encoder.encode)
+
+    async def encode_query_async(self, query: str) -> np.ndarray:
+        """生成查询向量的异步版本，等待批量编码期间不阻塞事件循环"""
+        return await self.query_cache.get_or_encode_async(query, self.query_encoder.encode_async)
+    
+    def encode_texts(self, texts: List[str]) -> np.ndarray:
+        """批量编码文本（如AI筛选的选项列表）；单条文本按查询处理，经过查询向量缓存和微批编码器"""
+        if len(texts) == 1:
+            return self.encode_query(texts[0]).reshape(1, -1)
+        return np.asarray(self.model.encode(texts), dtype=np.float32)
+    
     def generate_embeddings(self, texts: List[str]) -> np.ndarray:
         """为文本列表生成嵌入向量"""
         print(f"为 {len(texts)} 条文本生成嵌入向量...")
@@ -76,82 +270,292 @@ class VectorEmbedding:
         Returns:
             加权嵌入向量
         """
-        # 使用默认权重或传入的权重
-        weights = field_weights or DEFAULT_FIELD_WEIGHTS
+        return self.generate_weighted_embeddings([program], field_weights, verbose=False)[0]
+    
+    def generate_field_embeddings(self, programs: List[Dict[str, Any]], fields: List[str],
+                                  batch_size: int = ENCODE_BATCH_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+        """按字段批量生成每个项目各字段的单位嵌入向量
+        
+        同一字段下所有项目的文本会被收集起来，以大批量调用一次model.encode，
+        而不是对每个项目的每个字段单独调用。
+        
+        Args:
+            programs: 项目数据列表
+            fields: 需要编码的字段列表
+            batch_size: 每次前向计算的批大小
+            
+        Returns:
+            (字段嵌入张量, 字段掩码)，形状分别为 (N, F, D) 和 (N, F)；
+            字段为空的位置向量为零、掩码为False
+        """
+        field_embeddings = None
+        mask = np.zeros((len(programs), len(fields)), dtype=bool)
         
-        # 为每个字段单独生成嵌入
-        field_embeddings = {}
-        total_weight = 0.0
-        
-        for field, weight in weights.items():
-            if field in program and program[field] and isinstance(program[field], str):
-                # 提取字段文本
-                field_text = str(program[field]).strip()
-                if field_text:  # 确保不是空文本
-                    # 为字段生成嵌入并乘以权重
-                    field_embedding = self.model.encode([field_text])[0] * weight
-                    field_embeddings[field] = field_embedding
-                    total_weight += weight
-        
-        # 如果没有生成任何有效的字段嵌入，则使用整体文本
-        if not field_embeddings or total_weight == 0:
-            return self.model.encode([self.prepare_text_from_program(program)])[0]
-        
-        # 计算加权平均
-        weighted_embedding = np.zeros_like(next(iter(field_embeddings.values())))
-        for embedding in field_embeddings.values():
-            weighted_embedding += embedding
-        
-        weighted_embedding = weighted_embedding / total_weight
-        
-        # 归一化向量
-        norm = np.linalg.norm(weighted_embedding)
-        if norm > 0:
-            weighted_embedding = weighted_embedding / norm
+        for f, field in enumerate(fields):
+            rows = []
+            texts = []
+            for i, program in enumerate(programs):
+                value = program.get(field)
+                if value and isinstance(value, str) and value.strip():
+                    rows.append(i)
+                    texts.append(value.strip())
+            if not texts:
+                continue
             
-        return weighted_embedding
+            vectors = np.asarray(self.model.encode(texts, batch_size=batch_size), dtype=np.float32)
+            if field_embeddings is None:
+                field_embeddings = np.zeros((len(programs), len(fields), vectors.shape[1]), dtype=np.float32)
+            field_embeddings[rows, f] = vectors
+            mask[rows, f] = True
+        
+        if field_embeddings is None:
+            field_embeddings = np.zeros((len(programs), len(fields), 0), dtype=np.float32)
+        return field_embeddings, mask
     
-    def generate_weighted_embeddings(self, programs: List[Dict[str, Any]], field_weights: Dict[str, float] = None) -> np.ndarray:
+    def generate_weighted_embeddings(self, programs: List[Dict[str, Any]], field_weights: Dict[str, float] = None,
+                                     batch_size: int = ENCODE_BATCH_SIZE, verbose: bool = True) -> np.ndarray:
         """为多个项目生成加权嵌入向量
         
         Args:
             programs: 项目数据列表
             field_weights: 字段权重配置
+            batch_size: 每次前向计算的批大小
+            verbose: 是否打印进度和吞吐量
             
         Returns:
             加权嵌入向量数组
         """
-        print(f"为 {len(programs)} 个项目生成加权嵌入向量...")
-        embeddings = []
+        embeddings, _, _ = self.generate_program_embeddings(programs, field_weights, batch_size, verbose)
+        return embeddings
+    
+    def generate_program_embeddings(self, programs: List[Dict[str, Any]], field_weights: Dict[str, float] = None,
+                                    batch_size: int = ENCODE_BATCH_SIZE,
+                                    verbose: bool = True) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """为多个项目生成加权嵌入向量以及各字段的单位嵌入向量
         
-        for i, program in enumerate(programs):
-            if i % 100 == 0 and i > 0:
-                print(f"已处理 {i}/{len(programs)} 个项目")
-                
-            embedding = self.generate_weighted_embedding(program, field_weights)
-            embeddings.append(embedding)
+        按块处理项目：每块内按字段批量编码得到 (N, F, D) 张量，
+        再用向量化的NumPy运算完成加权求和与归一化。
+        
+        Args:
+            programs: 项目数据列表
+            field_weights: 字段权重配置
+            batch_size: 每次前向计算的批大小
+            verbose: 是否打印进度和吞吐量
             
-        print(f"加权嵌入向量生成完成")
-        return np.array(embeddings)
+        Returns:
+            (加权嵌入向量数组 (N, D), EMBEDDING_FIELDS各字段的嵌入张量 (N, F, D), 字段掩码 (N, F))
+        """
+        weights = field_weights or DEFAULT_FIELD_WEIGHTS
+        # 先编码EMBEDDING_FIELDS中的字段，再编码权重配置中额外指定的字段
+        fields = EMBEDDING_FIELDS + [field for field in weights if field not in EMBEDDING_FIELDS]
+        weight_vec = np.array([weights.get(field, 0.0) for field in fields], dtype=np.float32)
+        num_stored = len(EMBEDDING_FIELDS)
+        
+        if verbose:
+            print(f"为 {len(programs)} 个项目生成加权嵌入向量...")
+        start_time = time.perf_counter()
+        
+        chunks = []
+        field_chunks = []
+        mask_chunks = []
+        for start in range(0, len(programs), EMBEDDING_CHUNK_SIZE):
+            chunk = programs[start:start + EMBEDDING_CHUNK_SIZE]
+            field_embeddings, mask = self.generate_field_embeddings(chunk, fields, batch_size)
+            
+            # 加权平均：只统计非空字段的权重
+            effective_weights = mask * weight_vec
+            total_weights = effective_weights.sum(axis=1)
+            
+            # 没有任何有效字段的项目，使用整体文本生成嵌入
+            fallback_rows = np.flatnonzero(total_weights <= 0)
+            fallback_vectors = None
+            if len(fallback_rows) > 0:
+                fallback_texts = [self.prepare_text_from_program(chunk[i]) for i in fallback_rows]
+                fallback_vectors = np.asarray(self.model.encode(fallback_texts, batch_size=batch_size), dtype=np.float32)
+            
+            dimension = field_embeddings.shape[2] or fallback_vectors.shape[1]
+            weighted = np.zeros((len(chunk), dimension), dtype=np.float32)
+            valid_rows = total_weights > 0
+            if valid_rows.any():
+                weighted[valid_rows] = np.einsum(
+                    'nf,nfd->nd', effective_weights[valid_rows], field_embeddings[valid_rows]
+                ) / total_weights[valid_rows, None]
+            if fallback_vectors is not None:
+                weighted[fallback_rows] = fallback_vectors
+            
+            chunks.append(normalize_rows(weighted))
+            if field_embeddings.shape[2] == 0:
+                field_embeddings = np.zeros((len(chunk), len(fields), dimension), dtype=np.float32)
+            field_chunks.append(field_embeddings[:, :num_stored])
+            mask_chunks.append(mask[:, :num_stored])
+            if verbose and start + len(chunk) < len(programs):
+                print(f"已处理 {start + len(chunk)}/{len(programs)} 个项目")
+        
+        if chunks:
+            embeddings = np.concatenate(chunks)
+            all_field_embeddings = np.concatenate(field_chunks)
+            all_masks = np.concatenate(mask_chunks)
+        else:
+            embeddings = np.zeros((0, 0), dtype=np.float32)
+            all_field_embeddings = np.zeros((0, num_stored, 0), dtype=np.float32)
+            all_masks = np.zeros((0, num_stored), dtype=bool)
+        
+        if verbose:
+            elapsed = time.perf_counter() - start_time
+            throughput = len(programs) / elapsed if elapsed > 0 else float('inf')
+            print(f"加权嵌入向量生成完成，耗时 {elapsed:.2f} 秒，吞吐量 {throughput:.1f} 个项目/秒")
+        return embeddings, all_field_embeddings, all_masks
     
-    def store_embeddings_to_mongodb(self, programs: List[Dict[str, Any]], embeddings: np.ndarray) -> None:
-        """将嵌入向量存储到MongoDB"""
-        print("正在将嵌入向量存储到MongoDB...")
-        # 先清空集合
-        self.collection.delete_many({})
+    def build_document(self, program: Dict[str, Any], embedding: np.ndarray,
+                       field_embeddings: Optional[np.ndarray] = None,
+                       field_mask: Optional[np.ndarray] = None,
+                       content_hash: Optional[str] = None) -> Dict[str, Any]:
+        """构建存入MongoDB的项目文档（项目数据 + 嵌入向量 + 增量更新所需的键和哈希）"""
+        document = program.copy()
+        document.pop('_id', None)
+        document['program_key'] = program_key(program)
+        document['document_hash'] = compute_document_hash(program)
+        if content_hash is not None:
+            document['content_hash'] = content_hash
+        # 按配置的存储格式编码嵌入向量（double数组或紧凑的二进制）
+        document['embedding'] = encode_vector(embedding, self.storage_dtype)
+        if field_embeddings is not None:
+            # 每个字段的单位嵌入单独存储，查询时可按动态权重组合
+            document['field_embeddings'] = {
+                field: encode_vector(field_embeddings[f], self.storage_dtype)
+                for f, field in enumerate(EMBEDDING_FIELDS)
+                if field_mask is None or field_mask[f]
+            }
+        return document
+    
+    def store_embeddings_to_mongodb(self, programs: List[Dict[str, Any]], embeddings: np.ndarray,
+                                    field_embeddings: Optional[np.ndarray] = None,
+                                    field_mask: Optional[np.ndarray] = None,
+                                    content_hashes: Optional[List[str]] = None) -> int:
+        """将嵌入向量存储到MongoDB
         
-        # 批量插入所有程序和其对应的嵌入向量
-        documents = []
+        按program_key逐个upsert，不会清空集合，已存在文档的_id保持不变。
+        
+        Args:
+            programs: 项目数据列表
+            embeddings: 加权嵌入向量数组 (N, D)
+            field_embeddings: 可选，EMBEDDING_FIELDS各字段的嵌入张量 (N, F, D)
+            field_mask: 可选，字段掩码 (N, F)，为False的字段不存储
+            content_hashes: 可选，每个项目的内容哈希
+            
+        Returns:
+            写入的文档数量
+        """
+        print("正在将嵌入向量存储到MongoDB...")
+        operations = []
         for i, program in enumerate(programs):
-            program_copy = program.copy()
-            # 将numpy数组转换为Python列表以便JSON序列化
-            program_copy['embedding'] = embeddings[i].tolist()
-            documents.append(program_copy)
+            document = self.build_document(
+                program,
+                embeddings[i],
+                field_embeddings[i] if field_embeddings is not None else None,
+                field_mask[i] if field_mask is not None else None,
+                content_hashes[i] if content_hashes is not None else None
+            )
+            operations.append(ReplaceOne({'program_key': document['program_key']}, document, upsert=True))
+        
+        self._bulk_write(operations)
+        print(f"成功存储 {len(operations)} 个文档到MongoDB")
+        
+        # 集合内容已变化，内存中的索引需要重新加载
+        self.vector_index = None
+        self.ann_index = None
+        self.keyword_index = None
+        self.text_columns = None
+        return len(operations)
+    
+    def sync_programs_to_mongodb(self, programs: List[Dict[str, Any]], field_weights: Dict[str, float] = None,
+                                 force: bool = False) -> Dict[str, int]:
+        """增量同步项目数据和嵌入向量到MongoDB
+        
+        根据内容哈希判断哪些项目需要重新编码：
+        - 新增或嵌入相关内容变化的项目：重新编码并upsert
+        - 只有其他字段变化的项目：只更新项目数据，保留原有嵌入
+        - 已不存在的项目：从集合中删除
+        
+        Args:
+            programs: 项目数据列表
+            field_weights: 字段权重配置
+            force: 为True时忽略哈希，重新编码所有项目
+            
+        Returns:
+            各类变更的数量统计
+        """
+        weights = field_weights or DEFAULT_FIELD_WEIGHTS
+        
+        # 同一个键出现多次时，以最后一次出现的数据为准
+        programs_by_key = {}
+        for program in programs:
+            programs_by_key[program_key(program)] = program
+        if len(programs_by_key) < len(programs):
+            print(f"警告: 发现 {len(programs) - len(programs_by_key)} 个重复的项目键，只保留最后一个")
+        
+        # 只读取键和哈希，不读取嵌入向量
+        existing = {
+            doc['program_key']: doc
+            for doc in self.collection.find(
+                {'program_key': {'$exists': True}},
+                {'program_key': 1, 'content_hash': 1, 'document_hash': 1}
+            )
+        }
+        
+        to_encode = []
+        content_hashes = []
+        field_updates = []
+        for key, program in programs_by_key.items():
+            content_hash = compute_content_hash(program, weights, self.model_name, self.storage_dtype)
+            stored = existing.get(key)
+            if force or stored is None or stored.get('content_hash') != content_hash:
+                to_encode.append(program)
+                content_hashes.append(content_hash)
+            elif stored.get('document_hash') != compute_document_hash(program):
+                update = {k: v for k, v in program.items() if k != '_id'}
+                update['document_hash'] = compute_document_hash(program)
+                field_updates.append(UpdateOne({'program_key': key}, {'$set': update}))
         
-        # 批量插入文档
-        if documents:
-            self.collection.insert_many(documents)
-        print(f"成功存储 {len(documents)} 个文档到MongoDB")
+        print(f"需要重新编码 {len(to_encode)} 个项目，只更新数据 {len(field_updates)} 个项目，"
+              f"未变化 {len(programs_by_key) - len(to_encode) - len(field_updates)} 个项目")
+        
+        if to_encode:
+            embeddings, field_embeddings, field_mask = self.generate_program_embeddings(to_encode, weights)
+            self.store_embeddings_to_mongodb(to_encode, embeddings, field_embeddings, field_mask, content_hashes)
+        
+        if field_updates:
+            self._bulk_write(field_updates)
+        
+        # 删除已不存在的项目（包括旧版本没有program_key的文档）
+        deleted = self.collection.delete_many({'program_key': {'$nin': list(programs_by_key.keys())}}).deleted_count
+        if deleted:
+            print(f"删除了 {deleted} 个已不存在的项目")
+        
+        if to_encode or field_updates or deleted:
+            self.vector_index = None
+            self.ann_index = None
+            self.keyword_index = None
+            self.text_columns = None
+        
+        return {
+            "encoded": len(to_encode),
+            "updated": len(field_updates),
+            "deleted": deleted,
+            "unchanged": len(programs_by_key) - len(to_encode) - len(field_updates)
+        }
+    
+    def create_program_key_index(self) -> None:
+        """为program_key创建唯一索引，加速增量更新时的upsert"""
+        try:
+            self.collection.create_index("program_key", unique=True)
+        except Exception as e:
+            print(f"创建program_key索引时出错: {e}")
+    
+    def _bulk_write(self, operations: List[Any]) -> None:
+        """分批提交bulk_write操作"""
+        for start in range(0, len(operations), WRITE_BATCH_SIZE):
+            self.collection.bulk_write(operations[start:start + WRITE_BATCH_SIZE], ordered=False)
     
     def create_vector_index(self) -> None:
         """在MongoDB中创建向量索引（仅适用于MongoDB Atlas）"""
@@ -174,55 +578,140 @@ class VectorEmbedding:
             print(f"创建索引时出错: {e}")
             print("如需完整向量搜索功能，请使用MongoDB Atlas并配置向量索引")
     
-    def query_similar_documents(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
-        """使用向量相似度搜索相关文档"""
+    def query_similar_documents(self, query: str, top_k: int = 5,
+                                field_weights: Optional[Dict[str, float]] = None,
+                                fields: Optional[List[str]] = None,
+                                query_vector: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """使用向量相似度搜索相关文档
+        
+        Args:
+            query: 查询文本
+            top_k: 返回结果数量
+            field_weights: 可选的查询时字段权重，指定时按各字段嵌入的加权相似度排序
+            fields: 可选的返回字段列表，默认返回除向量和内部字段外的全部字段
+            query_vector: 已经生成的查询向量（如 encode_query_async 的结果），默认由查询文本生成
+            
+        Returns:
+            相关文档列表（不包含嵌入向量）
+        """
         print(f"搜索与查询相似的文档: {query}")
-        query_vec = self.model.encode([query])[0]
+        query_vec = query_vector if query_vector is not None else self.encode_query(query)
         
         # 使用Atlas向量搜索（假设已创建适当的索引）
-        try:
-            pipeline = [
-                {
-                    "$vectorSearch": {
-                        "index": "vector_index",
-                        "path": "embedding",
-                        "queryVector": query_vec.tolist(),
-                        "numCandidates": top_k * 10,
-                        "limit": top_k
-                    }
-                }
-            ]
-            results = list(self.collection.aggregate(pipeline))
-            if results:
-                print(f"找到 {len(results)} 个相关文档")
-                return results
-        except Exception as e:
-            print(f"向量搜索出错，尝试使用替代方法: {e}")
+        if self.atlas_search_available and not field_weights:
+            try:
+                results = list(self.collection.aggregate(self._vector_search_pipeline(query_vec, top_k, fields)))
+                if results:
+                    print(f"找到 {len(results)} 个相关文档")
+                    return results
+            except Exception as e:
+                print(f"向量搜索出错，改用内存向量索引: {e}")
+                self.atlas_search_available = False
+        
+        # 替代方法：使用常驻内存的向量索引（适用于没有配置Atlas向量搜索的情况）
+        # 配置了近似索引时优先使用，查询时加权搜索由近似索引退回精确索引完成
+        if self.vector_index is None:
+            self.load_vector_index()
         
-        # 替代方法：手动计算相似度（适用于没有配置Atlas向量搜索的情况）
-        all_docs = list(self.collection.find({}))
-        if not all_docs:
+        top_ids, _ = self.search_index.search(query_vec, top_k, field_weights)
+        if len(top_ids) == 0:
             print("集合中没有文档")
             return []
         
-        # 从所有文档中提取嵌入向量
-        doc_vecs = [np.array(doc['embedding']) for doc in all_docs]
+        # 只取回前k个文档的展示字段，并按相似度顺序排列
+        results = fetch_documents(self.collection, top_ids, fields)
+        print(f"通过内存向量索引找到 {len(results)} 个相关文档")
+        return results
+
+    def keyword_search(self, query: str, top_k: int = 10,
+                       fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """使用BM25倒排索引进行关键词搜索，返回按相关度排序的文档（只包含展示字段）"""
+        if self.keyword_index is None:
+            self.load_keyword_index()
         
-        # 计算余弦相似度
-        similarities = [np.dot(query_vec, doc_vec) / (np.linalg.norm(query_vec) * np.linalg.norm(doc_vec)) 
-                     for doc_vec in doc_vecs]
+        top_ids, _ = self.keyword_index.search(query, top_k)
+        if len(top_ids) == 0:
+            return []
         
-        # 按相似度排序并获取前k个
-        top_indices = np.argsort(similarities)[::-1][:top_k]
-        results = [all_docs[i] for i in top_indices]
-        print(f"通过手动相似度计算找到 {len(results)} 个相关文档")
-        return results
+        return fetch_documents(self.collection, top_ids, fields)
 
-def process_sim_programs(field_weights: Dict[str, float] = None):
-    """处理SIM程序数据，生成并存储嵌入向量
+    @staticmethod
+    def _vector_search_pipeline(query_vec: np.ndarray, top_k: int,
+                                fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Atlas $vectorSearch 聚合管道"""
+        return [
+            {
+                "$vectorSearch": {
+                    "index": "vector_index",
+                    "path": "embedding",
+                    "queryVector": query_vec.tolist(),
+                    "numCandidates": top_k * 10,
+                    "limit": top_k
+                }
+            },
+            {"$project": display_projection(fields)}
+        ]
+
+    async def _fetch_documents_async(self, doc_ids, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """取回展示字段：有异步集合时使用异步驱动，否则在线程池中使用同步客户端"""
+        if self.async_collection is not None:
+            return await fetch_documents_async(self.async_collection, doc_ids, fields)
+        return await run_in_executor(self.executor, fetch_documents, self.collection, doc_ids, fields)
+
+    async def _aggregate_async(self, pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """执行聚合管道：有异步集合时使用异步驱动，否则在线程池中使用同步客户端"""
+        if self.async_collection is not None:
+            cursor = await self.async_collection.aggregate(pipeline)
+            return await cursor.to_list()
+        return await run_in_executor(self.executor, lambda: list(self.collection.aggregate(pipeline)))
+
+    async def query_similar_documents_async(self, query: str, top_k: int = 5,
+                                            fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """query_similar_documents 的异步版本，用于事件循环中的搜索请求
+
+        查询向量由微批编码器生成，索引检索在搜索线程池中运行，MongoDB通过异步驱动读取，
+        整个过程不阻塞事件循环。
+        """
+        query_vec = await self.encode_query_async(query)
+
+        if self.atlas_search_available:
+            try:
+                results = await self._aggregate_async(self._vector_search_pipeline(query_vec, top_k, fields))
+                if results:
+                    return results
+            except Exception as e:
+                print(f"向量搜索出错，改用内存向量索引: {e}")
+                self.atlas_search_available = False
+
+        # 与同步版本一样，索引尚未加载时先加载（在线程池中运行）
+        if self.vector_index is None:
+            await run_in_executor(self.executor, self.load_vector_index)
+        top_ids, _ = await run_in_executor(self.executor, self.search_index.search, query_vec, top_k)
+        if len(top_ids) == 0:
+            return []
+        return await self._fetch_documents_async(top_ids, fields)
+
+    async def keyword_search_async(self, query: str, top_k: int = 10,
+                                   fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """keyword_search 的异步版本：BM25检索在搜索线程池中运行，MongoDB通过异步驱动读取"""
+        if self.keyword_index is None:
+            await run_in_executor(self.executor, self.load_keyword_index)
+        top_ids, _ = await run_in_executor(self.executor, self.keyword_index.search, query, top_k)
+        if len(top_ids) == 0:
+            return []
+        return await self._fetch_documents_async(top_ids, fields)
+
+def process_sim_programs(field_weights: Dict[str, float] = None, force: bool = False) -> Dict[str, int]:
+    """处理SIM程序数据，增量生成并存储嵌入向量
+    
+    只有新增或内容变化的项目会重新编码，集合在更新过程中不会被清空。
     
     Args:
         field_weights: 可选的字段权重配置，默认使用DEFAULT_FIELD_WEIGHTS
+        force: 为True时重新编码所有项目
+        
+    Returns:
+        各类变更的数量统计
     """
     # 读取SIM程序数据
     file_path = os.path.join(os.path.dirname(__file__), "SIM_programs.json")
@@ -238,16 +727,18 @@ def process_sim_programs(field_weights: Dict[str, float] = None):
     # 初始化向量嵌入处理器
     vec_processor = VectorEmbedding()
     
-    # 生成加权嵌入向量
-    embeddings = vec_processor.generate_weighted_embeddings(programs, weights)
-    
-    # 存储到MongoDB
-    vec_processor.store_embeddings_to_mongodb(programs, embeddings)
+    # 增量生成嵌入向量并同步到MongoDB
+    stats = vec_processor.sync_programs_to_mongodb(programs, weights, force=force)
     
-    # 创建向量索引
+    # 创建索引
+    vec_processor.create_program_key_index()
     vec_processor.create_vector_index()
     
-    print("处理完成")
+    # 写入嵌入快照，API启动时以mmap方式加载
+    vec_processor.write_embedding_snapshot()
+    
+    print(f"处理完成: {stats}")
+    return stats
 
 if __name__ == "__main__":
-    process_sim_programs() 
\ No newline at end of file
+    process_sim_programs(force='--force' in sys.argv) 
\ No newline at end of file
@@ -0,0 +1,208 @@
+from typing import List, Any, Tuple, Dict, Optional
+import numpy as np
+from pymongo.collection import Collection
+from embedding_codec import decode_vector
+
+# 候选行数超过索引的该比例时，先对整个矩阵打分再取出候选行，避免按行拷贝大块向量
+FULL_SCAN_FRACTION = 0.25
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """将矩阵按行归一化为单位向量（零向量保持为零）"""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class ExactVectorIndex:
+    """常驻内存的精确向量索引
+
+    启动时从MongoDB一次性加载所有嵌入向量，保存为预先归一化的连续float32矩阵和对应的文档ID数组。
+    每次查询只需一次矩阵-向量乘法，再用argpartition取前k个结果，
+    避免每次查询都从MongoDB拉取全部嵌入向量并逐个计算余弦相似度。
+
+    如果提供了各字段的单位嵌入 (N, F, D)，还可以在查询时按任意字段权重计算
+    Σ w_f·(q·e_f) / Σ w_f，使动态权重直接作用于向量分数而无需重新生成嵌入。
+    """
+
+    def __init__(self, ids: List[Any], matrix: np.ndarray,
+                 field_matrix: Optional[np.ndarray] = None,
+                 field_mask: Optional[np.ndarray] = None,
+                 field_names: Optional[List[str]] = None,
+                 normalized: bool = False):
+        """初始化索引
+
+        Args:
+            ids: 文档ID列表（MongoDB的_id），顺序与矩阵的行一致
+            matrix: 形状为 (N, D) 的嵌入向量矩阵
+            field_matrix: 可选，形状为 (N, F, D) 的字段嵌入张量
+            field_mask: 可选，形状为 (N, F) 的字段掩码，缺省时视所有字段均存在
+            field_names: 字段名列表，顺序与field_matrix的F维一致
+            normalized: 矩阵是否已经是按行归一化的连续float32数组（如mmap加载的快照），
+                为True时直接使用，不做拷贝
+        """
+        self.ids = np.array(ids, dtype=object)
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if matrix.ndim != 2 or matrix.shape[0] != len(self.ids):
+            raise ValueError(f"嵌入矩阵形状 {matrix.shape} 与ID数量 {len(self.ids)} 不匹配")
+        self.matrix = matrix if normalized else np.ascontiguousarray(normalize_rows(matrix), dtype=np.float32)
+        self._positions = {doc_id: i for i, doc_id in enumerate(ids)}
+        # 从嵌入快照加载时记录快照版本，近似索引与之绑定
+        self.snapshot_version: Optional[str] = None
+
+        self.field_names = list(field_names or [])
+        self.field_matrix = None
+        self.field_mask = None
+        if field_matrix is not None:
+            field_matrix = np.asarray(field_matrix, dtype=np.float32)
+            if field_matrix.shape[:2] != (len(self.ids), len(self.field_names)):
+                raise ValueError(f"字段嵌入张量形状 {field_matrix.shape} 与ID数量或字段数量不匹配")
+            self.field_matrix = field_matrix if normalized else np.ascontiguousarray(normalize_rows(field_matrix), dtype=np.float32)
+            if field_mask is None:
+                field_mask = np.ones(field_matrix.shape[:2], dtype=bool)
+            self.field_mask = np.asarray(field_mask, dtype=bool)
+
+    @property
+    def memory_mapped(self) -> bool:
+        """向量矩阵是否来自嵌入快照（服务时以mmap方式映射），而不是从MongoDB加载后常驻内存"""
+        return self.snapshot_version is not None
+
+    @classmethod
+    def from_collection(cls, collection: Collection, field_names: Optional[List[str]] = None) -> "ExactVectorIndex":
+        """从MongoDB集合中加载嵌入向量并构建索引（只读取_id和嵌入字段）
+
+        Args:
+            collection: MongoDB集合对象
+            field_names: 需要加载的字段嵌入名称，为None时不加载字段嵌入
+        """
+        ids = []
+        vectors = []
+        field_docs = []
+        projection = {"embedding": 1}
+        if field_names:
+            projection["field_embeddings"] = 1
+        for doc in collection.find({"embedding": {"$exists": True}}, projection):
+            ids.append(doc["_id"])
+            vectors.append(doc["embedding"])
+            field_docs.append(doc.get("field_embeddings") or {})
+
+        if not vectors:
+            return cls([], np.zeros((0, 0), dtype=np.float32))
+        # 列表和二进制格式的嵌入都先解码为NumPy数组，再一次性拷贝进连续矩阵
+        matrix = np.array([decode_vector(vector) for vector in vectors], dtype=np.float32)
+
+        # 旧数据没有字段嵌入时，不启用查询时动态权重
+        if not field_names or not any(field_docs):
+            return cls(ids, matrix)
+
+        field_matrix = np.zeros((len(ids), len(field_names), matrix.shape[1]), dtype=np.float32)
+        field_mask = np.zeros((len(ids), len(field_names)), dtype=bool)
+        for i, fields in enumerate(field_docs):
+            for f, field in enumerate(field_names):
+                if field in fields:
+                    field_matrix[i, f] = decode_vector(fields[field])
+                    field_mask[i, f] = True
+        return cls(ids, matrix, field_matrix, field_mask, field_names)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dimension(self) -> int:
+        return self.matrix.shape[1]
+
+    @property
+    def has_field_embeddings(self) -> bool:
+        return self.field_matrix is not None
+
+    def positions_of(self, doc_ids: List[Any]) -> np.ndarray:
+        """返回文档ID对应的行号，不在索引中的ID返回-1"""
+        return np.array([self._positions.get(doc_id, -1) for doc_id in doc_ids], dtype=np.int64)
+
+    def scores(self, query_vec: np.ndarray, field_weights: Optional[Dict[str, float]] = None,
+               positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """计算查询向量与索引中文档的相似度
+
+        Args:
+            query_vec: 查询向量
+            field_weights: 可选的字段权重，指定且索引包含字段嵌入时，
+                返回各字段余弦相似度的加权平均 Σ w_f·(q·e_f) / Σ w_f（只统计文档中存在的字段）
+            positions: 可选，只计算这些行的分数
+
+        Returns:
+            相似度数组，顺序与positions（或索引中的行）一致
+        """
+        query = self._normalize_query(query_vec)
+        full_scan = positions is None or len(positions) > FULL_SCAN_FRACTION * len(self)
+        if full_scan:
+            scores = self.matrix @ query
+            if positions is not None:
+                scores = scores[positions]
+        else:
+            scores = self.matrix[positions] @ query
+
+        weight_vec = self._field_weight_vector(field_weights)
+        if weight_vec is None:
+            return scores
+
+        field_mask = self.field_mask if positions is None else self.field_mask[positions]
+        effective_weights = field_mask * weight_vec
+        total_weights = effective_weights.sum(axis=1)
+
+        if full_scan:
+            field_scores = np.einsum('nfd,d->nf', self.field_matrix, query)
+            if positions is not None:
+                field_scores = field_scores[positions]
+        else:
+            field_scores = np.einsum('nfd,d->nf', self.field_matrix[positions], query)
+        weighted = (field_scores * effective_weights).sum(axis=1)
+        # 没有任何加权字段的文档，保留整体嵌入的相似度
+        valid_rows = total_weights > 0
+        scores[valid_rows] = weighted[valid_rows] / total_weights[valid_rows]
+        return scores
+
+    def search(self, query_vec: np.ndarray, top_k: int = 5,
+               field_weights: Optional[Dict[str, float]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """搜索与查询向量最相似的文档
+
+        Args:
+            query_vec: 查询向量
+            top_k: 返回结果数量
+            field_weights: 可选的查询时字段权重
+
+        Returns:
+            (文档ID数组, 相似度数组)，按相似度从高到低排序
+        """
+        if len(self) == 0 or top_k <= 0:
+            return np.array([], dtype=object), np.array([], dtype=np.float32)
+
+        scores = self.scores(query_vec, field_weights)
+        top_indices = self._top_k_indices(scores, top_k)
+        return self.ids[top_indices], scores[top_indices]
+
+    def _field_weight_vector(self, field_weights: Optional[Dict[str, float]]) -> Optional[np.ndarray]:
+        """将字段权重字典转换为与field_names对齐的权重向量，不适用时返回None"""
+        if not field_weights or self.field_matrix is None:
+            return None
+        weight_vec = np.array([float(field_weights.get(field, 0.0)) for field in self.field_names], dtype=np.float32)
+        if not weight_vec.any():
+            return None
+        return weight_vec
+
+    @staticmethod
+    def _normalize_query(query_vec: np.ndarray) -> np.ndarray:
+        query = np.asarray(query_vec, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+        return query
+
+    @staticmethod
+    def _top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+        """用argpartition选出前k个分数的下标，并按分数降序排列"""
+        k = min(top_k, len(scores))
+        if k < len(scores):
+            candidates = np.argpartition(-scores, k - 1)[:k]
+        else:
+            candidates = np.arange(len(scores))
+        return candidates[np.argsort(-scores[candidates], kind="stable")]
@@ -1,11 +1,15 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-import json
-import os
+from quart import Blueprint, current_app, request, jsonify
 import asyncio
+import os
+import signal
+from typing import Callable, List, Optional
 from dotenv import load_dotenv
-from vector_embedding import VectorEmbedding, DEFAULT_FIELD_WEIGHTS
+from vector_embedding import VectorEmbedding, DEFAULT_FIELD_WEIGHTS, connect_async_collection
 from llm_weight_search import LLMDynamicWeightSearch
+from query_cache import shared_query_cache
+from weight_cache import shared_weight_cache
+from document_projection import parse_fields
+from search_executor import create_search_executor
 
 # 加载环境变量
 load_dotenv()
@@ -15,43 +19,148 @@ DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY")
 DASHSCOPE_BASE_URL = os.getenv("DASHSCOPE_BASE_URL")
 LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "qwen-plus")
 
-app = Flask(__name__)
-CORS(app)  # 启用跨域资源共享，以便前端可以访问API
+WARMUP_QUERY = "warmup" # 启动预热时编码的查询文本
+
+embedding_bp = Blueprint('embedding_bp', __name__)
+
+
+class SearchServices:
+    """进程内共享的搜索服务：嵌入模型、内存索引和LLM搜索器
+
+    在服务开始接受请求之前加载并预热，加载完成前ready为False，
+    搜索相关的端点返回503，/ready 探针也返回503。
+
+    搜索请求不在事件循环上执行阻塞调用：查询编码由微批编码器的线程完成，
+    索引检索和打分在有界的搜索线程池中运行，MongoDB通过异步驱动读取。
+    线程池和异步客户端在工作进程的事件循环中创建（start），不会跨fork继承。
+    """
+
+    def __init__(self):
+        self.vec_processor = None
+        self.llm_searcher = None
+        self.ready = False
+        self.error = None
+        self._preloaded = None
+        self.executor = None
+        self.async_client = None
+        self.async_collection = None
+        # 每次加载（包括 /api/init 重新加载）完成后以新的处理器调用，依赖模型的组件在这里重新绑定
+        self.load_callbacks: List[Callable[[VectorEmbedding], None]] = []
+        # 预分叉模式下父进程的pid（由 backend.serve 设置）：/api/init 通过SIGHUP让父进程重新加载所有工作进程
+        self.reload_parent: Optional[int] = None
+
+    def preload(self) -> None:
+        """只加载嵌入模型和只读的内存索引，不执行编码（供预分叉的父进程在fork之前调用）
+
+        工作进程以写时复制的方式继承这些对象；父进程的MongoDB连接在fork之前关闭，
+        每个工作进程在load中重新连接并各自预热。
+        """
+        vec_processor = VectorEmbedding()
+        vec_processor.load_indexes()
+        vec_processor.client.close()
+        self._preloaded = vec_processor
+
+    def load(self) -> None:
+        """加载嵌入模型和全部内存索引，并预热模型和向量索引（阻塞调用，应在线程中运行）
+
+        已经preload时直接使用继承的模型和索引；重新加载时先构建新的处理器再整体替换，
+        加载期间旧的处理器继续服务请求。
+        """
+        previous, vec_processor, self._preloaded = self.vec_processor, self._preloaded, None
+        if vec_processor is not None:
+            vec_processor.connect()
+        else:
+            vec_processor = VectorEmbedding()
+            vec_processor.load_indexes()
+        vec_processor.async_collection = self.async_collection
+        vec_processor.executor = self.executor
+
+        # 第一次编码会初始化模型的计算图和内存，预热后第一个用户请求不再承担这部分延迟；
+        # 通过微批编码器预热，同时在当前进程中启动其编码线程
+        warmup_vector = vec_processor.query_encoder.encode(WARMUP_QUERY)
+        if vec_processor.search_index is not None and len(vec_processor.search_index) > 0:
+            vec_processor.search_index.search(warmup_vector, 1)
+
+        llm_searcher = LLMDynamicWeightSearch(
+            vector_model=vec_processor.model,
+            mongodb_collection=vec_processor.collection,
+            api_key=DASHSCOPE_API_KEY,
+            vector_index=vec_processor.search_index,
+            keyword_index=vec_processor.keyword_index,
+            text_columns=vec_processor.text_columns,
+            query_cache=vec_processor.query_cache,
+            query_encoder=vec_processor.query_encoder,
+            async_collection=self.async_collection,
+            executor=self.executor
+        )
+
+        self.vec_processor = vec_processor
+        self.llm_searcher = llm_searcher
+        self.error = None
+        self.ready = True
+        for callback in self.load_callbacks:
+            try:
+                callback(vec_processor)
+            except Exception as e:
+                print(f"Error in search services load callback: {e}")
+        if previous is not None:
+            # 旧处理器的编码线程处理完已提交的查询后退出
+            previous.query_encoder.close()
+
+    async def start(self) -> None:
+        """创建搜索线程池和异步MongoDB客户端，在后台线程中加载服务，失败时记录错误并保持未就绪状态"""
+        self.executor = create_search_executor()
+        self.async_client, self.async_collection = connect_async_collection()
+        if self.async_client is None:
+            print("PyMongo async API unavailable, running MongoDB reads in the search executor.")
+        try:
+            await asyncio.to_thread(self.load)
+            print("Search services loaded and warmed up.")
+        except Exception as e:
+            self.error = str(e)
+            print(f"Error loading search services: {e}")
+
+    async def close(self) -> None:
+        """关闭异步MongoDB客户端和搜索线程池"""
+        if self.async_client is not None:
+            await self.async_client.close()
+            self.async_client = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+
+def get_services() -> SearchServices:
+    return current_app.extensions["search_services"]
+
 
-# 初始化向量嵌入处理器
-vec_processor = None
-llm_searcher = None
+def not_ready_response(services: SearchServices):
+    return jsonify({"error": "搜索服务正在加载，请稍后重试", "detail": services.error}), 503
 
-@app.route('/api/search', methods=['GET'])
+
+@embedding_bp.route('/search', methods=['GET'])
 async def search():
     """处理搜索请求"""
-    global vec_processor, llm_searcher
-    
-    # 懒加载向量处理器
-    if vec_processor is None:
-        vec_processor = VectorEmbedding()
-    
+    services = get_services()
+    if not services.ready:
+        return not_ready_response(services)
+    vec_processor = services.vec_processor
+
     query = request.args.get('query', '')
     use_vector = request.args.get('use_vector', 'false').lower() == 'true'
     use_llm = request.args.get('use_llm', 'false').lower() == 'true'
     top_k = int(request.args.get('top_k', '10'))
-    
+    # 可选的返回字段，如 fields=program_name,university 用于列表视图
+    fields = parse_fields(request.args.get('fields'))
+
     if not query:
         return jsonify({"error": "查询不能为空"}), 400
-    
+
     try:
         # LLM动态权重搜索
         if use_llm:
-            # 懒加载LLM搜索器
-            if llm_searcher is None:
-                llm_searcher = LLMDynamicWeightSearch(
-                    vector_model=vec_processor.model,
-                    mongodb_collection=vec_processor.collection,
-                    api_key=DASHSCOPE_API_KEY
-                )
-                
-            results = await llm_searcher.search(query, top_k)
-            
+            results = await services.llm_searcher.search(query, top_k, fields)
+
             return jsonify({
                 "results": [item["document"] for item in results],
                 "weights": results[0]["match_info"]["weights_used"] if results else {},
@@ -59,107 +168,105 @@ async def search():
                 "query": query,
                 "count": len(results)
             })
-                
+
         # 向量搜索
         elif use_vector:
-            # 使用向量搜索
-            results = vec_processor.query_similar_documents(query, top_k)
-            # 移除嵌入向量以减少响应大小
+            # 使用向量搜索：查询向量与其他并发请求合并编码，索引检索在线程池中运行，文档由异步驱动读取
+            results = await vec_processor.query_similar_documents_async(query, top_k, fields=fields)
             for doc in results:
-                if 'embedding' in doc:
-                    del doc['embedding']
                 if '_id' in doc:
                     doc['_id'] = str(doc['_id'])  # 转换ObjectId为字符串
-            
+
             return jsonify({
                 "results": results,
                 "search_type": "vector",
                 "query": query,
                 "count": len(results)
             })
-        # 常规关键词搜索    
+        # 常规关键词搜索
         else:
-            # 使用常规关键词搜索 - 在MongoDB中执行文本搜索
-            # 这里我们简单使用正则表达式进行文本匹配
-            regex_query = {
-                "$or": [
-                    {"program_name": {"$regex": query, "$options": "i"}},
-                    {"university": {"$regex": query, "$options": "i"}},
-                    {"discipline": {"$regex": query, "$options": "i"}},
-                    {"sub_discipline": {"$regex": query, "$options": "i"}},
-                    {"introduction": {"$regex": query, "$options": "i"}}
-                ]
-            }
-            
-            results = list(vec_processor.collection.find(regex_query).limit(top_k))
-            # 移除嵌入向量以减少响应大小
+            # 使用进程内的BM25倒排索引进行关键词搜索，结果按相关度排序
+            results = await vec_processor.keyword_search_async(query, top_k, fields)
             for doc in results:
-                if 'embedding' in doc:
-                    del doc['embedding']
                 if '_id' in doc:
                     doc['_id'] = str(doc['_id'])  # 转换ObjectId为字符串
-            
+
             return jsonify({
                 "results": results,
                 "search_type": "keyword",
                 "query": query,
                 "count": len(results)
             })
-    
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/health', methods=['GET'])
-def health_check():
+@embedding_bp.route('/health', methods=['GET'])
+async def health_check():
     """健康检查端点"""
-    return jsonify({"status": "ok", "message": "向量搜索API服务正常运行"})
+    services = get_services()
+    return jsonify({
+        "status": "ok",
+        "message": "向量搜索API服务正常运行",
+        "ready": services.ready,
+        "query_cache": shared_query_cache.stats(),
+        "weight_cache": shared_weight_cache.stats(),
+        "weight_requests": services.llm_searcher.weight_requests.stats() if services.llm_searcher is not None else None,
+        "query_encoder": services.vec_processor.query_encoder.stats() if services.vec_processor is not None else None
+    })
 
-@app.route('/api/init', methods=['POST'])
+@embedding_bp.route('/init', methods=['POST'])
 async def init_data():
-    """初始化数据端点 - 从SIM_programs.json重新加载数据并生成嵌入"""
-    global vec_processor, llm_searcher
-    
+    """初始化数据端点 - 从SIM_programs.json重新加载数据并生成嵌入
+
+    同步数据后重新加载模型和索引：单进程时在当前进程中重新加载；
+    预分叉模式下向父进程发送SIGHUP，由父进程启动新一代工作进程替换所有旧的工作进程。
+    """
+    services = get_services()
+    if not services.ready:
+        return not_ready_response(services)
+
     try:
-        # 使用默认权重初始化数据
+        # 使用默认权重增量同步数据，force=true时重新编码所有项目
         from vector_embedding import process_sim_programs
-        process_sim_programs()
-        
-        # 重新加载向量处理器
-        vec_processor = VectorEmbedding()
-        llm_searcher = None  # 重置LLM搜索器，会在下次查询时重新初始化
-        
+        force = request.args.get('force', 'false').lower() == 'true'
+        # 编码和写入MongoDB耗时较长，在线程中运行，不阻塞事件循环上的其他请求
+        stats = await asyncio.to_thread(process_sim_programs, force=force)
+
+        if services.reload_parent is not None:
+            # 只重新加载当前进程会让其他工作进程继续使用旧的索引，改为由父进程重新加载所有工作进程
+            os.kill(services.reload_parent, signal.SIGHUP)
+            reload = "all_workers"
+        else:
+            # 重新加载向量处理器、内存索引和LLM搜索器，完成前旧的实例继续服务
+            await asyncio.to_thread(services.load)
+            reload = "process"
+
         return jsonify({
-            "status": "success", 
-            "message": "数据初始化完成，已重新生成嵌入向量并存储到MongoDB",
-            "weights_used": DEFAULT_FIELD_WEIGHTS
+            "status": "success",
+            "message": "数据初始化完成，已增量更新嵌入向量并存储到MongoDB",
+            "weights_used": DEFAULT_FIELD_WEIGHTS,
+            "changes": stats,
+            "reload": reload
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-        
-@app.route('/api/weights', methods=['GET'])
+
+@embedding_bp.route('/weights', methods=['GET'])
 async def get_weights_for_query():
     """获取查询的动态权重配置"""
-    global vec_processor, llm_searcher
-    
+    services = get_services()
+    if not services.ready:
+        return not_ready_response(services)
+
     query = request.args.get('query', '')
     if not query:
         return jsonify({"error": "查询不能为空"}), 400
-    
+
     try:
-        # 懒加载LLM搜索器
-        if llm_searcher is None:
-            if vec_processor is None:
-                vec_processor = VectorEmbedding()
-                
-            llm_searcher = LLMDynamicWeightSearch(
-                vector_model=vec_processor.model,
-                mongodb_collection=vec_processor.collection,
-                api_key=DASHSCOPE_API_KEY
-            )
-            
         # 获取动态权重配置
-        weights = await llm_searcher.get_dynamic_weights(query)
-        
+        weights = await services.llm_searcher.get_dynamic_weights(query)
+
         return jsonify({
             "query": query,
             "weights": weights,
@@ -167,23 +274,3 @@ async def get_weights_for_query():
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-
-# 让Flask异步处理请求
-def run_async(debug=True):
-    """使Flask应用支持异步处理请求"""
-    import asyncio
-    from hypercorn.asyncio import serve
-    from hypercorn.config import Config
-    
-    config = Config()
-    config.bind = ["0.0.0.0:5000"]
-    config.debug = debug
-    
-    asyncio.run(serve(app, config))
-
-if __name__ == '__main__':
-    # 初始化向量嵌入处理器
-    vec_processor = VectorEmbedding()
-    
-    # 使用异步方式运行Flask应用
-    run_async(debug=True) 
\ No newline at end of file
@@ -0,0 +1,259 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+from query_cache import QueryEmbeddingCache
+
+# LLM权重缓存配置：SQLite文件在同一主机的所有工作进程间共享，重启后仍然有效
+WEIGHT_CACHE_PATH = os.getenv("WEIGHT_CACHE_PATH", os.path.join(os.path.dirname(__file__), "cache", "weight_cache.sqlite3"))
+WEIGHT_CACHE_SIZE = int(os.getenv("WEIGHT_CACHE_SIZE", "10000"))  # 最多缓存的查询数量
+WEIGHT_CACHE_TTL = float(os.getenv("WEIGHT_CACHE_TTL", str(7 * 24 * 3600)))  # 缓存有效期（秒），0表示不过期
+# 语义缓存：查询向量与已缓存查询的余弦相似度不低于该阈值时复用其权重，设为1以上可关闭
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+# 命中时只在内存中记录最近使用时间，每隔该秒数（以及写入新条目时）批量写回，读路径不再逐次写数据库
+WEIGHT_CACHE_TOUCH_INTERVAL = float(os.getenv("WEIGHT_CACHE_TOUCH_INTERVAL", "30"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS weights (
+    key TEXT NOT NULL,
+    llm_model TEXT NOT NULL,
+    weights TEXT NOT NULL,
+    embedding BLOB,
+    embedding_model TEXT,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (key, llm_model)
+)
+"""
+
+
+class LLMWeightCache:
+    """LLM字段权重的持久化LRU/TTL缓存，带语义匹配层
+
+    - 精确层：以规范化后的查询文本和LLM模型为键，存储在SQLite中，多个工作进程共享且重启后保留
+    - 语义层：精确层未命中时，与同一嵌入模型下已缓存查询的向量比较，相似度不低于阈值时复用其权重
+    命中统计按进程计数。命中后的最近使用时间先记录在内存中，定期或在put时批量写回，
+    语义层的向量矩阵只在条目增删（条目数或最新的created_at变化）时重新加载，其他进程的命中不会使它失效。
+    """
+
+    def __init__(self, path: str = WEIGHT_CACHE_PATH, max_size: int = WEIGHT_CACHE_SIZE,
+                 ttl: Optional[float] = WEIGHT_CACHE_TTL, similarity_threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 touch_interval: float = WEIGHT_CACHE_TOUCH_INTERVAL):
+        """初始化缓存（数据库在第一次使用时才打开）
+
+        Args:
+            path: SQLite数据库文件路径
+            max_size: 最多缓存的查询数量，超出时淘汰最久未使用的条目
+            ttl: 缓存有效期（秒），None或0表示不过期
+            similarity_threshold: 语义层复用权重所需的最低余弦相似度
+            touch_interval: 批量写回最近使用时间的间隔（秒）
+        """
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl or None
+        self.similarity_threshold = similarity_threshold
+        self.touch_interval = touch_interval
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        # 语义层的内存副本：(嵌入模型, LLM模型) -> (条目键数组, 归一化向量矩阵)，条目增删时重新加载
+        self._semantic_entries: Dict[Tuple[str, str], Tuple[list, np.ndarray]] = {}
+        self._entries_signature: Optional[tuple] = None
+        # 尚未写回的最近使用时间：(键, LLM模型) -> 时间戳
+        self._touched: Dict[Tuple[str, str], float] = {}
+        self._last_touch_flush = time.monotonic()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(_SCHEMA)
+            connection.execute("CREATE INDEX IF NOT EXISTS weights_last_used ON weights (last_used)")
+            connection.execute("CREATE INDEX IF NOT EXISTS weights_created_at ON weights (created_at)")
+            self._connection = connection
+        return self._connection
+
+    def _expiry_cutoff(self) -> float:
+        return time.time() - self.ttl if self.ttl else float("-inf")
+
+    def get(self, query: str, llm_model: str, query_vec: Optional[np.ndarray] = None,
+            embedding_model: Optional[str] = None) -> Optional[Dict[str, float]]:
+        """查找缓存的权重
+
+        Args:
+            query: 用户查询
+            llm_model: 生成权重的LLM模型
+            query_vec: 可选的查询向量，提供时精确层未命中后查找语义层
+            embedding_model: 生成查询向量的模型名称
+
+        Returns:
+            权重字典，未命中时返回None
+        """
+        key = QueryEmbeddingCache.normalize_query(query)
+        with self._lock:
+            try:
+                connection = self._connect()
+                row = connection.execute(
+                    "SELECT weights FROM weights WHERE key = ? AND llm_model = ? AND created_at >= ?",
+                    (key, llm_model, self._expiry_cutoff())
+                ).fetchone()
+                if row is None and query_vec is not None and embedding_model is not None:
+                    matched = self._semantic_lookup(connection, query_vec, llm_model, embedding_model)
+                    if matched is not None:
+                        key, row = matched
+                        self.semantic_hits += 1
+                        print(f"语义缓存命中: '{query}' 复用 '{key}' 的权重配置")
+                elif row is not None:
+                    self.exact_hits += 1
+                if row is None:
+                    self.misses += 1
+                    return None
+                self._touched[(key, llm_model)] = time.time()
+                if time.monotonic() - self._last_touch_flush >= self.touch_interval:
+                    self._flush_touches(connection)
+                return json.loads(row[0])
+            except sqlite3.Error as e:
+                print(f"读取权重缓存出错: {e}")
+                self.misses += 1
+                return None
+
+    def _flush_touches(self, connection: sqlite3.Connection) -> None:
+        """把内存中记录的最近使用时间在一个事务中写回数据库"""
+        self._last_touch_flush = time.monotonic()
+        if not self._touched:
+            return
+        touched = [(last_used, key, llm_model) for (key, llm_model), last_used in self._touched.items()]
+        self._touched.clear()
+        connection.execute("BEGIN")
+        try:
+            connection.executemany("UPDATE weights SET last_used = MAX(last_used, ?) WHERE key = ? AND llm_model = ?",
+                                   touched)
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _semantic_lookup(self, connection: sqlite3.Connection, query_vec: np.ndarray, llm_model: str,
+                         embedding_model: str) -> Optional[Tuple[str, tuple]]:
+        """在语义层中查找最相似的已缓存查询，返回 (键, 数据行)"""
+        keys, matrix = self._load_semantic_entries(connection, llm_model, embedding_model)
+        if len(keys) == 0:
+            return None
+        query = np.asarray(query_vec, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if norm == 0 or matrix.shape[1] != len(query):
+            return None
+        similarities = matrix @ (query / norm)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+        row = connection.execute(
+            "SELECT weights FROM weights WHERE key = ? AND llm_model = ? AND created_at >= ?",
+            (keys[best], llm_model, self._expiry_cutoff())
+        ).fetchone()
+        return (keys[best], row) if row is not None else None
+
+    def _load_semantic_entries(self, connection: sqlite3.Connection, llm_model: str,
+                               embedding_model: str) -> Tuple[list, np.ndarray]:
+        """返回语义层的向量矩阵，其他进程或本进程增删条目后重新从数据库加载
+
+        写回最近使用时间不改变条目数和created_at，不会触发重新加载
+        （PRAGMA data_version 在任何写入后都会变化，不能用来判断）。
+        """
+        signature = connection.execute("SELECT COUNT(*), MAX(created_at) FROM weights").fetchone()
+        if signature != self._entries_signature:
+            self._semantic_entries.clear()
+            self._entries_signature = signature
+        cache_key = (embedding_model, llm_model)
+        if cache_key not in self._semantic_entries:
+            keys = []
+            vectors = []
+            for key, blob in connection.execute(
+                "SELECT key, embedding FROM weights WHERE llm_model = ? AND embedding_model = ? "
+                "AND embedding IS NOT NULL AND created_at >= ?",
+                (llm_model, embedding_model, self._expiry_cutoff())
+            ):
+                keys.append(key)
+                vectors.append(np.frombuffer(blob, dtype=np.float32))
+            matrix = np.stack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+            self._semantic_entries[cache_key] = (keys, matrix)
+        return self._semantic_entries[cache_key]
+
+    def put(self, query: str, llm_model: str, weights: Dict[str, float], query_vec: Optional[np.ndarray] = None,
+            embedding_model: Optional[str] = None) -> None:
+        """缓存LLM生成的权重，并淘汰过期和超出容量的条目"""
+        key = QueryEmbeddingCache.normalize_query(query)
+        embedding = None
+        if query_vec is not None and embedding_model is not None:
+            vector = np.asarray(query_vec, dtype=np.float32).ravel()
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                embedding = (vector / norm).tobytes()
+        now = time.time()
+        with self._lock:
+            try:
+                connection = self._connect()
+                # 先写回命中记录的最近使用时间，淘汰时按最新的使用顺序
+                self._flush_touches(connection)
+                connection.execute(
+                    "INSERT OR REPLACE INTO weights VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, llm_model, json.dumps(weights), embedding, embedding_model, now, now)
+                )
+                connection.execute("DELETE FROM weights WHERE created_at < ?", (self._expiry_cutoff(),))
+                connection.execute(
+                    "DELETE FROM weights WHERE rowid IN "
+                    "(SELECT rowid FROM weights ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_size,)
+                )
+                self._semantic_entries.clear()
+            except sqlite3.Error as e:
+                print(f"写入权重缓存出错: {e}")
+
+    def clear(self) -> None:
+        """清空缓存和统计数据"""
+        with self._lock:
+            try:
+                self._connect().execute("DELETE FROM weights")
+            except sqlite3.Error as e:
+                print(f"清空权重缓存出错: {e}")
+            self._semantic_entries.clear()
+            self._touched.clear()
+            self.exact_hits = 0
+            self.semantic_hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            try:
+                return self._connect().execute("SELECT COUNT(*) FROM weights").fetchone()[0]
+            except sqlite3.Error:
+                return 0
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存命中统计（本进程）"""
+        size = len(self)
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            total = hits + self.misses
+            return {
+                "path": self.path,
+                "size": size,
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "similarity_threshold": self.similarity_threshold,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0
+            }
+
+
+# 所有LLM搜索器共享的权重缓存
+shared_weight_cache = LLMWeightCache()
@@ -0,0 +1,121 @@
+"""AI流式搜索端点的并发流容量测试
+
+为避免真实LLM的费用和限流，可先启动一个兼容OpenAI流式接口的模拟LLM服务，
+再让后端的DASHSCOPE_BASE_URL指向它：
+
+    python -m backend.search.benchmark_streams mock-llm --port 8001 --tokens 200 --interval 0.02
+    DASHSCOPE_BASE_URL=http://localhost:8001 DASHSCOPE_API_KEY=mock python -m backend.app
+    python -m backend.search.benchmark_streams run --url http://localhost:5000/api/ai_stream_search \\
+        --concurrency 50,100,200,400
+
+每个连接使用不同的查询，避免被相同查询的合并机制（StreamCoalescer）合并为一个上游流。
+对改造前（Flask WSGI + 同步客户端）和改造后（Quart ASGI + AsyncOpenAI）的版本分别运行即可对比。
+"""
+import argparse
+import asyncio
+import json
+import time
+import httpx
+
+STREAM_END = "<<STREAM_END>>"
+MARKER = "<END_OF_THOUGHTS>"
+
+
+def create_mock_llm_app(tokens: int, interval: float):
+    """创建模拟LLM服务：POST /chat/completions 以OpenAI格式流式返回思考文本、标记和筛选JSON"""
+    from quart import Quart, Response
+
+    app = Quart(__name__)
+
+    def chunk(content):
+        payload = {
+            "id": "mock", "object": "chat.completion.chunk", "created": 0, "model": "mock",
+            "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}]
+        }
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    @app.route('/chat/completions', methods=['POST'])
+    async def chat_completions():
+        async def generate():
+            for i in range(tokens):
+                await asyncio.sleep(interval)
+                yield chunk(f"思考{i} " if i % 10 else "\n")
+            yield chunk(MARKER)
+            yield chunk(json.dumps({"filters": {"discipline": ["Business"]}}))
+            yield "data: [DONE]\n\n"
+
+        response = Response(generate(), mimetype='text/event-stream')
+        response.timeout = None
+        return response
+
+    return app
+
+
+async def open_stream(client: httpx.AsyncClient, url: str, query: str):
+    """打开一个SSE连接并读取到结束信号，返回 (是否完整, 首个事件耗时, 总耗时)"""
+    start = time.perf_counter()
+    first_event = None
+    try:
+        async with client.stream("GET", url, params={"query": query}) as response:
+            if response.status_code != 200:
+                return False, None, time.perf_counter() - start
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                if first_event is None:
+                    first_event = time.perf_counter() - start
+                if line[len("data: "):].strip() == STREAM_END:
+                    return True, first_event, time.perf_counter() - start
+    except httpx.HTTPError:
+        pass
+    return False, first_event, time.perf_counter() - start
+
+
+async def run_level(url: str, concurrency: int, timeout: float):
+    """同时打开concurrency个流，统计完成数量和延迟"""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(timeout)) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(*[
+            open_stream(client, url, f"benchmark query {concurrency}-{i}") for i in range(concurrency)
+        ])
+        elapsed = time.perf_counter() - start
+
+    completed = [r for r in results if r[0]]
+    first_events = sorted(r[1] for r in completed)
+    durations = sorted(r[2] for r in completed)
+
+    def percentile(values, p):
+        return values[min(len(values) - 1, int(len(values) * p))] if values else float("nan")
+
+    print(f"并发 {concurrency:>5}: 完成 {len(completed):>5}/{concurrency:<5} "
+          f"首个事件 p50 {percentile(first_events, 0.5):6.2f}s p99 {percentile(first_events, 0.99):6.2f}s   "
+          f"总耗时 p50 {percentile(durations, 0.5):6.2f}s p99 {percentile(durations, 0.99):6.2f}s   "
+          f"墙钟 {elapsed:6.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI流式搜索并发流容量测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    mock_parser = subparsers.add_parser("mock-llm", help="启动模拟LLM服务")
+    mock_parser.add_argument("--port", type=int, default=8001)
+    mock_parser.add_argument("--tokens", type=int, default=200, help="每个响应的思考片段数量")
+    mock_parser.add_argument("--interval", type=float, default=0.02, help="片段之间的间隔（秒）")
+
+    run_parser = subparsers.add_parser("run", help="对流式端点进行并发测试")
+    run_parser.add_argument("--url", default="http://localhost:5000/api/ai_stream_search")
+    run_parser.add_argument("--concurrency", default="10,50,100,200,400", help="以逗号分隔的并发流数量")
+    run_parser.add_argument("--timeout", type=float, default=120.0, help="单个流的超时时间（秒）")
+    args = parser.parse_args()
+
+    if args.command == "mock-llm":
+        create_mock_llm_app(args.tokens, args.interval).run(host="0.0.0.0", port=args.port)
+        return
+
+    for concurrency in [int(value) for value in args.concurrency.split(",")]:
+        asyncio.run(run_level(args.url, concurrency, args.timeout))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# 假设SIM_programs.json在backend目录下
+PROGRAM_DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'SIM_programs.json')
+
+# 建立位图索引的筛选字段，fee_range按国际学生总学费的下限分桶（与前端的费用范围一致）
+FACET_FIELDS = ['discipline', 'sub_discipline', 'university', 'academic_level', 'programme_type']
+FEE_RANGES = ["0-100000", "100000-150000", "150000-200000", "200000-999999999"]
+TEXT_SEARCH_FIELDS = ['program_name', 'university', 'discipline'] # 关键词搜索匹配的字段
+SORT_FIELDS = FACET_FIELDS + ['program_name', 'international_fee']
+
+PROGRAMS_PAGE_SIZE = int(os.getenv("PROGRAMS_PAGE_SIZE", "10")) # 默认每页项目数量
+PROGRAMS_MAX_PAGE_SIZE = int(os.getenv("PROGRAMS_MAX_PAGE_SIZE", "100"))
+TEXT_MASK_CACHE_SIZE = 256 # 缓存的关键词匹配结果数量
+
+
+# numpy 2.0之前没有bitwise_count，用每字节的位数查找表统计
+_BYTE_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _pack(bits: np.ndarray) -> np.ndarray:
+    """把最后一维的布尔数组压缩为uint64位图（每个字64个项目），不足的位补0"""
+    packed = np.packbits(bits, axis=-1)
+    padding = [(0, 0)] * (packed.ndim - 1) + [(0, (-packed.shape[-1]) % 8)]
+    return np.ascontiguousarray(np.pad(packed, padding)).view(np.uint64)
+
+
+def _popcount(words: np.ndarray) -> np.ndarray:
+    """统计每一行位图中置位的数量"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    return _BYTE_POPCOUNT[words.view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+
+def _fee_lower(program: dict) -> Optional[float]:
+    fee = program.get('international_total_fee')
+    if not isinstance(fee, dict) or fee.get('fee_lower') is None:
+        return None
+    return float(fee['fee_lower'])
+
+
+class FacetIndex:
+    """项目数据的筛选与分面计数引擎
+
+    每个筛选字段的每个取值预先计算一个位图（每个项目一位，压缩为uint64），
+    一次查询只需对位图做按位与/或运算和位计数：同时得到筛选后的结果页，
+    以及每个筛选字段在排除自身筛选条件后各取值的项目数量。
+    """
+
+    def __init__(self, programs: List[dict]):
+        self.programs = programs
+        size = len(programs)
+        self.values: Dict[str, List[str]] = {}
+        self._bitmaps: Dict[str, np.ndarray] = {} # 字段 -> (取值数, 字数) 的uint64位图
+        self._positions: Dict[str, Dict[str, int]] = {}
+
+        for facet in FACET_FIELDS:
+            column = [program.get(facet) or '' for program in programs]
+            values = sorted(set(value for value in column if value))
+            positions = {value: i for i, value in enumerate(values)}
+            bitmap = np.zeros((len(values), size), dtype=bool)
+            for row, value in enumerate(column):
+                if value:
+                    bitmap[positions[value], row] = True
+            self._add_facet(facet, values, bitmap)
+
+        fees = np.array([np.nan if (fee := _fee_lower(program)) is None else fee for program in programs], dtype=np.float64)
+        fee_bitmap = np.zeros((len(FEE_RANGES), size), dtype=bool)
+        for i, fee_range in enumerate(FEE_RANGES):
+            lower, upper = (float(bound) for bound in fee_range.split('-'))
+            fee_bitmap[i] = (fees >= lower) & (fees < upper) # NaN的比较结果为False
+        self._add_facet('fee_range', list(FEE_RANGES), fee_bitmap)
+
+        self._haystacks = ['\x00'.join(str(program.get(field) or '').lower() for field in TEXT_SEARCH_FIELDS)
+                           for program in programs]
+        self._text_masks: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock() # 查询在线程中执行，保护匹配结果缓存
+        self._sort_keys = {field: self._sort_key(field) for field in SORT_FIELDS}
+        self._sort_orders: Dict[Tuple[str, bool], np.ndarray] = {}
+        self._all = _pack(np.ones(size, dtype=bool))
+
+    def _add_facet(self, facet: str, values: List[str], bitmap: np.ndarray):
+        self.values[facet] = values
+        self._bitmaps[facet] = _pack(bitmap)
+        self._positions[facet] = {value: i for i, value in enumerate(values)}
+
+    @property
+    def facets(self) -> List[str]:
+        return list(self.values)
+
+    def __len__(self) -> int:
+        return len(self.programs)
+
+    @classmethod
+    def from_file(cls, path: str = PROGRAM_DATA_PATH) -> "FacetIndex":
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def facet_mask(self, facet: str, selected: List[str]) -> Optional[np.ndarray]:
+        """选中取值的位图之并（同一字段内的多个取值为“或”关系），没有选中任何取值时返回None"""
+        if not selected:
+            return None
+        rows = [self._positions[facet][value] for value in selected if value in self._positions[facet]]
+        if not rows:
+            return np.zeros_like(self._all)
+        return np.bitwise_or.reduce(self._bitmaps[facet][rows], axis=0)
+
+    def text_mask(self, query: str) -> Optional[np.ndarray]:
+        """关键词（不区分大小写的子串）匹配位图，空查询返回None"""
+        if not query:
+            return None
+        query = query.lower()
+        with self._lock:
+            mask = self._text_masks.get(query)
+            if mask is not None:
+                self._text_masks.move_to_end(query)
+                return mask
+        mask = _pack(np.fromiter((query in haystack for haystack in self._haystacks), dtype=bool,
+                                 count=len(self._haystacks)))
+        with self._lock:
+            self._text_masks[query] = mask
+            while len(self._text_masks) > TEXT_MASK_CACHE_SIZE:
+                self._text_masks.popitem(last=False)
+        return mask
+
+    def _sort_key(self, field: str):
+        """每个项目的排序键，缺少该字段的项目为None"""
+        if field == 'international_fee':
+            return [_fee_lower(program) for program in self.programs]
+        return [str(program.get(field) or '').lower() or None for program in self.programs]
+
+    def _sort_order(self, field: str, descending: bool) -> np.ndarray:
+        """按字段排序后的行号；缺少该字段的项目在升序和降序中都排在最后"""
+        order = self._sort_orders.get((field, descending))
+        if order is None:
+            keys = self._sort_keys[field]
+            present = sorted((row for row, key in enumerate(keys) if key is not None),
+                             key=keys.__getitem__, reverse=descending)
+            missing = [row for row, key in enumerate(keys) if key is None]
+            order = np.array(present + missing, dtype=np.int64)
+            self._sort_orders[(field, descending)] = order
+        return order
+
+    def query(self, query: str = '', filters: Optional[Dict[str, List[str]]] = None, page: int = 1,
+              page_size: int = PROGRAMS_PAGE_SIZE, sort_field: Optional[str] = None,
+              sort_order: Optional[str] = None) -> Dict[str, object]:
+        """一次计算筛选结果页和所有字段的分面计数
+
+        Args:
+            query: 关键词，匹配项目名称、大学和学科
+            filters: 各筛选字段选中的取值，字段之间为“与”关系
+            page: 页码（从1开始）
+            page_size: 每页项目数量
+            sort_field: 排序字段，None表示按原始顺序
+            sort_order: ascend 或 descend
+
+        Returns:
+            {"total": 匹配数量, "page", "page_size", "items": 当前页的项目,
+             "facets": {字段: [{"value": 取值, "count": 排除该字段自身筛选条件后的项目数量}]}}
+        """
+        filters = filters or {}
+        base = self.text_mask(query)
+        if base is None:
+            base = self._all
+        masks = {facet: self.facet_mask(facet, filters.get(facet) or []) for facet in self.values}
+        active = {facet: mask for facet, mask in masks.items() if mask is not None}
+
+        matched = base.copy()
+        for mask in active.values():
+            matched &= mask
+
+        facets = {}
+        for facet, bitmap in self._bitmaps.items():
+            # 排除该字段自身的筛选条件，其他字段的条件照常生效
+            others = base.copy()
+            for other, mask in active.items():
+                if other != facet:
+                    others &= mask
+            counts = _popcount(bitmap & others)
+            facets[facet] = [{"value": value, "count": int(count)} for value, count in zip(self.values[facet], counts)]
+
+        matched = np.unpackbits(matched.view(np.uint8), count=len(self.programs)).astype(bool)
+        if sort_field in self._sort_keys and sort_order in ('ascend', 'descend'):
+            order = self._sort_order(sort_field, sort_order == 'descend')
+            rows = order[matched[order]]
+        else:
+            rows = np.flatnonzero(matched)
+
+        page_size = max(1, min(page_size, PROGRAMS_MAX_PAGE_SIZE))
+        page = max(1, page)
+        start = (page - 1) * page_size
+        return {
+            "total": int(rows.size),
+            "page": page,
+            "page_size": page_size,
+            "items": [self.programs[row] for row in rows[start:start + page_size]],
+            "facets": facets
+        }
+
+
+_facet_index: Optional[FacetIndex] = None
+_facet_index_mtime = None
+_facet_index_lock = threading.Lock() # 文件变化后同时到达的请求只构建一次索引
+
+
+def get_facet_index() -> FacetIndex:
+    """返回项目数据的筛选索引，项目数据文件在重新爬取后发生变化时重新构建
+
+    构建需要读取整个数据文件并生成所有位图，是阻塞调用，应在线程中运行。
+    """
+    global _facet_index, _facet_index_mtime
+    mtime = os.path.getmtime(PROGRAM_DATA_PATH)
+    if _facet_index is not None and mtime == _facet_index_mtime:
+        return _facet_index
+    with _facet_index_lock:
+        # 等待锁期间其他请求可能已经构建完成
+        mtime = os.path.getmtime(PROGRAM_DATA_PATH)
+        if _facet_index is None or mtime != _facet_index_mtime:
+            _facet_index = FacetIndex.from_file(PROGRAM_DATA_PATH)
+            _facet_index_mtime = mtime
+            print(f"Built facet index over {len(_facet_index)} programs.")
+        return _facet_index
+
+
+def query_programs(args: Dict[str, List[str]], page: int, page_size: int) -> Dict[str, object]:
+    """按请求参数查询项目分页和分面计数（第一次请求或数据文件变化后先构建索引），应在线程中运行
+
+    Args:
+        args: 请求的查询参数，每个参数名对应其全部取值
+        page: 页码
+        page_size: 每页项目数量
+    """
+    index = get_facet_index()
+
+    def first(name: str) -> Optional[str]:
+        values = args.get(name)
+        return values[0] if values else None
+
+    return index.query(
+        query=first('query') or '',
+        filters={facet: args.get(facet) or [] for facet in index.facets},
+        page=page,
+        page_size=page_size,
+        sort_field=first('sort_field'),
+        sort_order=first('sort_order')
+    )
@@ -0,0 +1,47 @@
+import os
+from typing import Optional
+import httpx
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+
+load_dotenv() # 加载 .env 文件中的环境变量
+
+# 从环境变量获取API配置，不在代码中硬编码
+DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY")
+DASHSCOPE_BASE_URL = os.getenv("DASHSCOPE_BASE_URL")
+LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "qwen-plus") # 默认使用qwen-plus但优先使用环境变量
+
+# 连接池配置：每个工作进程共享一个客户端，同时进行的流式请求数量受max_connections限制
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "500"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "100"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120")) # 单次请求的超时时间（秒），流式生成可能较慢
+
+_async_client: Optional[AsyncOpenAI] = None
+
+def get_async_llm_client() -> AsyncOpenAI:
+    """
+    返回进程内共享的AsyncOpenAI客户端（首次调用时创建）。
+    底层的httpx连接池保持长连接，所有请求复用TCP/TLS连接，必须在服务的事件循环中调用。
+    """
+    global _async_client
+    if _async_client is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=10.0),
+        )
+        _async_client = AsyncOpenAI(
+            api_key=DASHSCOPE_API_KEY,
+            base_url=DASHSCOPE_BASE_URL,
+            http_client=http_client,
+        )
+    return _async_client
+
+async def close_async_llm_client():
+    """关闭共享客户端及其连接池，在服务停止时调用"""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
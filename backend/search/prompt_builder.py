@@ -0,0 +1,137 @@
+import json
+import os
+import re
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+# 选项数量不超过该值的筛选字段完整放入固定前缀（系统提示），其余字段按查询裁剪
+PROMPT_FULL_FACET_LIMIT = int(os.getenv("PROMPT_FULL_FACET_LIMIT", "20"))
+# 需要裁剪的筛选字段每次只提供与查询最相似的前N个选项
+PROMPT_OPTION_TOP_N = int(os.getenv("PROMPT_OPTION_TOP_N", "10"))
+NGRAM_DIMENSION = 1024 # 默认编码器的哈希维度
+
+# 把文本列表编码为向量矩阵的函数，如嵌入模型的encode
+Encoder = Callable[[List[str]], np.ndarray]
+
+SYSTEM_PROMPT_RULES = """
+你是一个智能课程筛选助手。
+你的任务是理解用户的查询，模拟一个清晰的思考过程，然后输出一个JSON对象，指明要应用的筛选条件。
+
+输出规则：
+1. 你的思考过程会以文本行的形式逐步输出。请在思考的逻辑断点处使用换行符（\n）来分隔不同的思考步骤或段落。
+2. 在思考过程完全结束后，你必须另起一行（或确保清晰分离）输出一个特殊标记：<END_OF_THOUGHTS>
+3. 在这个特殊标记之后，紧接着输出一个有效的、单行的、紧凑的JSON对象，这是你整个回复的最后一部分。不得在JSON对象之后添加任何其他文本或换行符。
+4. JSON对象的格式必须是：{"filters": {"field_name1": ["value1", "value2"], "field_name2": ["value3"]} }。
+   - field_name 必须是可用筛选字段之一。
+   - value 必须是对应字段的合理值，且必须严格从提供的选项列表中选择，不要创造不存在的值。
+   - 如果某个筛选字段不适用，请不要在JSON中包含该字段。
+
+5. 非常重要：你只能使用系统提供的实际存在的筛选值选项。不要创建或推断不存在的选项值。
+
+请注意标记 <END_OF_THOUGHTS> 必须完整地出现在你的回答中，不要分割这个标记。
+"""
+
+_TOKEN_PATTERN = re.compile(r"[\u4e00-\u9fff]|[A-Za-z0-9]+|[^\sA-Za-z0-9\u4e00-\u9fff]")
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的token数量：每个汉字、每个英文单词或数字、每个标点各计一个"""
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+def hashed_ngram_encoder(texts: List[str], dimension: int = NGRAM_DIMENSION) -> np.ndarray:
+    """默认编码器：字符三元组哈希向量（归一化），不依赖嵌入模型"""
+    matrix = np.zeros((len(texts), dimension), dtype=np.float32)
+    for i, text in enumerate(texts):
+        padded = f" {text.lower()} "
+        for j in range(len(padded) - 2):
+            matrix[i, zlib.crc32(padded[j:j + 3].encode('utf-8')) % dimension] += 1.0
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class FilterPromptBuilder:
+    """构建AI筛选的提示
+
+    系统提示（输出规则 + 选项较少的筛选字段的完整选项）只在筛选选项变化时构建一次，
+    所有请求的前缀完全相同，可被服务端的提示缓存复用；
+    选项较多的筛选字段只在用户消息中列出与查询向量最相似的前top_n个选项。
+    """
+
+    def __init__(self, filters_info: Dict[str, List[str]], encoder: Optional[Encoder] = None,
+                 top_n: int = PROMPT_OPTION_TOP_N, full_facet_limit: int = PROMPT_FULL_FACET_LIMIT):
+        """构建固定前缀并编码需要裁剪的选项
+
+        Args:
+            filters_info: 各筛选字段的全部可用选项
+            encoder: 文本编码器，默认使用字符三元组哈希向量
+            top_n: 需要裁剪的字段每次提供的选项数量
+            full_facet_limit: 选项数量不超过该值的字段完整放入固定前缀
+        """
+        self.encoder = encoder or hashed_ngram_encoder
+        self.top_n = top_n
+        self.full_facets = {facet: values for facet, values in filters_info.items() if len(values) <= full_facet_limit}
+        self.pruned_facets = {facet: values for facet, values in filters_info.items() if len(values) > full_facet_limit}
+
+        catalogue = json.dumps(self.full_facets, ensure_ascii=False)
+        self.system_prompt = SYSTEM_PROMPT_RULES + f"""
+以下筛选字段的完整可用选项：
+{catalogue}
+"""
+        if self.pruned_facets:
+            self.system_prompt += f"""
+以下筛选字段的选项较多，每次查询只会在用户消息中列出与查询最相关的候选选项：{", ".join(self.pruned_facets)}
+"""
+        self._option_vectors = {facet: self.encoder(values) for facet, values in self.pruned_facets.items()}
+
+        # 与在用户消息中列出全部选项的提示对比token数量
+        self.prefix_tokens = estimate_tokens(self.system_prompt)
+        self.full_catalogue_tokens = estimate_tokens(SYSTEM_PROMPT_RULES) + estimate_tokens(
+            json.dumps(filters_info, ensure_ascii=False))
+
+    def candidate_options(self, query: str) -> Dict[str, List[str]]:
+        """为每个需要裁剪的筛选字段选出与查询最相似的前top_n个选项"""
+        if not self.pruned_facets:
+            return {}
+        query_vec = np.asarray(self.encoder([query])[0], dtype=np.float32)
+        candidates = {}
+        for facet, values in self.pruned_facets.items():
+            similarities = self._option_vectors[facet] @ query_vec
+            top = np.argsort(-similarities, kind="stable")[:self.top_n]
+            candidates[facet] = [values[i] for i in top]
+        return candidates
+
+    def build_messages(self, query: str) -> Tuple[List[Dict[str, str]], Dict[str, int]]:
+        """构建发送给LLM的消息
+
+        Returns:
+            (消息列表, token估算统计)
+        """
+        candidates = self.candidate_options(query)
+        candidates_section = ""
+        if candidates:
+            candidates_section = f"""
+以下筛选字段的候选选项（按与查询的相关度排序）：
+{json.dumps(candidates, ensure_ascii=False)}
+"""
+        user_prompt_content = f"""
+用户的查询是："{query}"。
+{candidates_section}
+你必须严格从提供的选项中进行选择。如果用户查询的意图在现有选项中找不到完全匹配，请选择最接近的选项或不应用该筛选字段。
+
+现在，开始你的思考过程，并在思考结束后严格按照上述规则输出特殊标记和JSON：
+"""
+        messages = [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": user_prompt_content}
+        ]
+        dynamic_tokens = estimate_tokens(user_prompt_content)
+        stats = {
+            "prefix_tokens": self.prefix_tokens,
+            "dynamic_tokens": dynamic_tokens,
+            "total_tokens": self.prefix_tokens + dynamic_tokens,
+            "full_catalogue_tokens": self.full_catalogue_tokens
+        }
+        return messages, stats
@@ -1,14 +1,39 @@
-from flask import Blueprint, Response, request, stream_with_context
+import asyncio
+from quart import Blueprint, Response, jsonify, request
 from backend.search.streaming_service import get_llm_response_stream
+from backend.search.facet_index import PROGRAMS_PAGE_SIZE, query_programs
+from backend.search.stream_cache import STREAM_CACHE_REPLAY
 
 search_bp = Blueprint('search_bp', __name__)
 
 @search_bp.route('/ai_stream_search', methods=['GET'])
-def ai_stream_search_route():
+async def ai_stream_search_route():
     query = request.args.get('query', '')
 
     if not query:
         return Response("Query parameter is missing", status=400)
 
-    # 使用真实的LLM流式服务
-    return Response(stream_with_context(get_llm_response_stream(query)), mimetype='text/event-stream') 
\ No newline at end of file
+    # 命中缓存时的返回方式（paced/final），默认由 STREAM_CACHE_REPLAY 配置
+    replay = request.args.get('replay', STREAM_CACHE_REPLAY)
+
+    # 使用真实的LLM流式服务，异步生成器在事件循环中运行，不占用工作线程
+    response = Response(get_llm_response_stream(query, replay), mimetype='text/event-stream')
+    response.timeout = None  # 流式响应的时长取决于LLM生成时间，不使用默认的响应超时
+    return response
+
+@search_bp.route('/programs', methods=['GET'])
+async def programs_route():
+    """筛选后的项目分页和各筛选字段的分面计数
+
+    筛选条件以重复的查询参数传递，如 ?discipline=Business&discipline=IT&fee_range=0-100000
+    """
+    try:
+        page = int(request.args.get('page', 1))
+        page_size = int(request.args.get('page_size', PROGRAMS_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "page and page_size must be integers"}), 400
+
+    # 索引构建（第一次请求或数据文件变化后）和位图计算都在线程中运行，不阻塞事件循环上的SSE流和其他请求
+    args = {name: request.args.getlist(name) for name in request.args}
+    result = await asyncio.to_thread(query_programs, args, page, page_size)
+    return jsonify(result)
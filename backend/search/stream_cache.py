@@ -0,0 +1,122 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from backend.search.stream_parser import MARKER, STREAM_END, filters_json_events, parse_sse_event, sse_event, to_sse
+
+# AI筛选流缓存配置
+STREAM_CACHE_SIZE = int(os.getenv("STREAM_CACHE_SIZE", "1024")) # 最多缓存的查询数量
+STREAM_CACHE_TTL = float(os.getenv("STREAM_CACHE_TTL", str(24 * 3600))) # 缓存有效期（秒），0表示不过期
+# 命中缓存时的返回方式：paced 按间隔重放思考过程（与实时流的前端体验一致），final 立即返回最终筛选条件
+STREAM_CACHE_REPLAY = os.getenv("STREAM_CACHE_REPLAY", "paced")
+STREAM_CACHE_REPLAY_INTERVAL = float(os.getenv("STREAM_CACHE_REPLAY_INTERVAL", "0.03")) # 重放思考片段的间隔（秒）
+
+
+class CachedFilterStream:
+    """一次完整的AI筛选响应：思考过程片段和最终的筛选条件JSON"""
+
+    def __init__(self, thoughts: List[str], filters_json: str):
+        self.thoughts = thoughts
+        self.filters_json = filters_json
+        self.created_at = time.monotonic()
+
+    async def replay(self, mode: str = STREAM_CACHE_REPLAY,
+                     interval: float = STREAM_CACHE_REPLAY_INTERVAL) -> AsyncIterator[str]:
+        """以SSE事件重放缓存的响应，事件顺序与实时流相同（包括逐字段的筛选条件事件）"""
+        if mode == "paced":
+            for thought in self.thoughts:
+                yield sse_event(thought)
+                await asyncio.sleep(interval)
+        yield sse_event(MARKER)
+        for event in filters_json_events(self.filters_json):
+            yield to_sse(event)
+        yield sse_event(STREAM_END)
+
+
+class FilterStreamCache:
+    """按（筛选选项版本, 规范化查询）缓存AI筛选流的LRU缓存（可选TTL）
+
+    筛选选项版本是AVAILABLE_FILTERS_INFO内容的哈希，重新爬取数据后版本变化，旧条目不再命中并被清除。
+    """
+
+    def __init__(self, max_size: int = STREAM_CACHE_SIZE, ttl: Optional[float] = STREAM_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl or None
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], CachedFilterStream]" = OrderedDict()
+
+    def get(self, version: str, query_key: str) -> Optional[CachedFilterStream]:
+        key = (version, query_key)
+        entry = self._entries.get(key)
+        if entry is not None and self.ttl is not None and time.monotonic() - entry.created_at >= self.ttl:
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, version: str, query_key: str, entry: CachedFilterStream) -> None:
+        self._entries[(version, query_key)] = entry
+        self._entries.move_to_end((version, query_key))
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate_except(self, version: str) -> None:
+        """清除不属于当前筛选选项版本的条目"""
+        for key in [key for key in self._entries if key[0] != version]:
+            del self._entries[key]
+
+    async def record(self, version: str, query_key: str, source: AsyncIterator[str]) -> AsyncIterator[str]:
+        """原样转发上游SSE事件，流正常结束且筛选条件JSON有效时写入缓存
+
+        只记录默认消息事件（思考文本、标记、原始JSON），具名的筛选条件事件在重放时由JSON重新生成。
+        """
+        thoughts = []
+        filters_json = None
+        marker_seen = False
+        failed = False
+        async for event in source:
+            yield event
+            name, data = parse_sse_event(event)
+            if name is not None:
+                continue
+            if data.startswith("Error:"):
+                failed = True
+            elif data == MARKER:
+                marker_seen = True
+            elif data == STREAM_END:
+                continue
+            elif marker_seen:
+                filters_json = data
+            else:
+                thoughts.append(data)
+
+        if failed or filters_json is None:
+            return
+        try:
+            parsed = json.loads(filters_json)
+        except json.JSONDecodeError:
+            return
+        if not isinstance(parsed, dict) or "filters" not in parsed:
+            return
+        self.put(version, query_key, CachedFilterStream(thoughts, filters_json))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, object]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
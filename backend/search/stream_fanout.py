@@ -0,0 +1,102 @@
+import asyncio
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询文本：小写并合并多余空白"""
+    return ' '.join(query.lower().split())
+
+
+class StreamBroadcast:
+    """把一个上游事件流广播给多个订阅者
+
+    上游异步生成器在独立的任务中运行，产生的事件全部保存在内存中，
+    中途加入的订阅者会先从头重放已有事件，再继续接收新事件。
+    订阅者断开连接不会中断上游流，其他订阅者仍能收到完整的响应。
+    """
+
+    def __init__(self, source: AsyncIterator[str], on_finish: Optional[Callable[["StreamBroadcast"], None]] = None):
+        self.events: List[str] = []
+        self.finished = False
+        self._source = source
+        self._on_finish = on_finish
+        self._changed = asyncio.Condition()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> "StreamBroadcast":
+        self._task = asyncio.get_running_loop().create_task(self._pump())
+        return self
+
+    async def _pump(self):
+        try:
+            async for event in self._source:
+                async with self._changed:
+                    self.events.append(event)
+                    self._changed.notify_all()
+        except Exception as e:
+            # 上游生成器自身已处理LLM错误，这里只兜底，保证订阅者能收到结束信号
+            print(f"Error in upstream stream: {e}")
+            self.events.append(f"data: Error: {e}\n\n")
+            self.events.append("data: <<STREAM_END>>\n\n")
+        finally:
+            self.finished = True
+            async with self._changed:
+                self._changed.notify_all()
+            if self._on_finish is not None:
+                self._on_finish(self)
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """从第一个事件开始依次返回所有事件，直到上游结束"""
+        position = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: position < len(self.events) or self.finished)
+                batch = self.events[position:]
+                finished = self.finished
+            position += len(batch)
+            for event in batch:
+                yield event
+            if finished and position >= len(self.events):
+                return
+
+
+class StreamCoalescer:
+    """合并相同键的并发流式请求：进行中的请求共享同一个上游流，结束后的请求重新发起"""
+
+    def __init__(self):
+        self._broadcasts: Dict[str, StreamBroadcast] = {}
+        self.upstream_streams = 0
+        self.subscribers = 0
+
+    def subscribe(self, key: str, source_factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """订阅键对应的事件流，没有进行中的上游流时用source_factory创建一个
+
+        必须在服务的事件循环中调用（同一事件循环内不需要加锁）。
+
+        Args:
+            key: 请求键，如规范化后的查询文本
+            source_factory: 创建上游异步事件生成器的函数
+
+        Returns:
+            异步事件迭代器（包含从上游流开始以来的全部事件）
+        """
+        broadcast = self._broadcasts.get(key)
+        if broadcast is None:
+            broadcast = StreamBroadcast(source_factory(), lambda finished: self._remove(key, finished))
+            self._broadcasts[key] = broadcast
+            self.upstream_streams += 1
+            broadcast.start()
+        self.subscribers += 1
+        return broadcast.subscribe()
+
+    def _remove(self, key: str, broadcast: StreamBroadcast) -> None:
+        if self._broadcasts.get(key) is broadcast:
+            del self._broadcasts[key]
+
+    def stats(self) -> Dict[str, int]:
+        """返回上游流数量和订阅者数量"""
+        return {
+            "in_flight": len(self._broadcasts),
+            "upstream_streams": self.upstream_streams,
+            "subscribers": self.subscribers
+        }
@@ -0,0 +1,228 @@
+import json
+from typing import Dict, List, Optional, Tuple
+
+MARKER = "<END_OF_THOUGHTS>"
+STREAM_END = "<<STREAM_END>>"
+
+# 解析器产生的事件：(类型, 内容)
+# thought: 思考文本片段；marker: 思考结束标记；
+# filter_partial: 某个筛选字段的值已完整输出，内容为 {"field": 字段名, "values": 值}；
+# filters_final: 整个JSON已完整输出，内容为解析后的对象；filters_json: 原始JSON文本（兼容旧前端）
+StreamEvent = Tuple[str, object]
+
+
+def sse_event(data: str, event: Optional[str] = None) -> str:
+    """格式化一个SSE事件，多行数据的每一行都加上data:前缀（浏览器会用换行符重新拼接）"""
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+def parse_sse_event(message: str) -> Tuple[Optional[str], str]:
+    """解析sse_event格式化的事件，返回 (事件名称, 数据)，默认消息事件的名称为None"""
+    event = None
+    data_lines = []
+    for line in message.rstrip("\n").split("\n"):
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            data_lines.append(line[len("data: "):])
+        elif line == "data":
+            data_lines.append("")
+    return event, "\n".join(data_lines)
+
+
+def to_sse(stream_event: StreamEvent) -> str:
+    """把解析器事件转换为SSE事件
+
+    思考文本、标记和原始JSON使用默认的消息事件（与旧前端的onmessage兼容），
+    filter_partial和filters_final使用具名事件，由前端通过addEventListener接收。
+    """
+    event_type, payload = stream_event
+    if event_type in ("filter_partial", "filters_final"):
+        return sse_event(json.dumps(payload, ensure_ascii=False), event_type)
+    return sse_event(payload)
+
+
+def filters_json_events(filters_json: str) -> List[StreamEvent]:
+    """由完整的筛选条件JSON文本生成标记之后的全部事件（用于重放缓存）"""
+    parser = IncrementalFilterParser()
+    events = parser.feed(filters_json)
+    if not parser.complete:
+        events.append(("filters_json", filters_json))
+    return events
+
+
+class MarkerMatcher:
+    """在流式文本中查找标记的滚动窗口匹配器
+
+    只保留可能是标记开头的末尾字符（最多len(marker)-1个），
+    其余文本立即返回，每个片段的处理量与片段长度成正比。
+    """
+
+    def __init__(self, marker: str = MARKER):
+        self.marker = marker
+        self.found = False
+        self._pending = ""
+
+    def feed(self, chunk: str) -> Tuple[str, Optional[str]]:
+        """处理一个文本片段
+
+        Returns:
+            (标记之前可以安全输出的文本, 标记之后的文本；尚未找到标记时为None)
+        """
+        if self.found:
+            return "", chunk
+        text = self._pending + chunk
+        position = text.find(self.marker)
+        if position != -1:
+            self.found = True
+            self._pending = ""
+            return text[:position], text[position + len(self.marker):]
+
+        keep = 0
+        for size in range(min(len(self.marker) - 1, len(text)), 0, -1):
+            if text.endswith(self.marker[:size]):
+                keep = size
+                break
+        self._pending = text[len(text) - keep:] if keep else ""
+        return text[:len(text) - keep], None
+
+    def flush(self) -> str:
+        """流结束时返回仍在等待匹配的文本"""
+        pending, self._pending = self._pending, ""
+        return pending
+
+
+class IncrementalFilterParser:
+    """增量解析 {"filters": {"字段": [值, ...], ...}} 格式的JSON
+
+    逐字符跟踪嵌套深度和字符串状态，filters对象中每个字段的值一结束就产生filter_partial事件，
+    顶层对象结束时产生filters_final事件。只缓存当前字段的字符，每个片段的处理量与片段长度成正比。
+    """
+
+    def __init__(self):
+        self.filters: Dict[str, object] = {}
+        self.complete = False
+        self._parts: List[str] = []
+        self._depth = 0
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._key: Optional[List[str]] = None # 正在读取的顶层键
+        self._last_key: Optional[str] = None
+        self._in_filters = False
+        self._field: Optional[List[str]] = None # 正在读取的筛选字段（"键": 值）
+
+    @property
+    def text(self) -> str:
+        """目前收到的全部JSON文本"""
+        return "".join(self._parts)
+
+    def feed(self, chunk: str) -> List[StreamEvent]:
+        """处理一个JSON文本片段，返回其中完成的事件"""
+        if self.complete:
+            return []
+        self._parts.append(chunk)
+        events = []
+        for char in chunk:
+            if self._field is not None:
+                self._field.append(char)
+            if self._in_string:
+                if self._key is not None:
+                    self._key.append(char)
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._key is not None:
+                        self._last_key = self._loads("".join(self._key))
+                        self._key = None
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._key = ['"']
+                elif self._depth == 2 and self._in_filters and self._field is None:
+                    self._field = ['"']
+            elif char in "{[":
+                self._depth += 1
+                self._started = True
+                if self._depth == 2:
+                    self._in_filters = char == "{" and self._last_key == "filters"
+            elif char in "}]":
+                if self._depth == 2 and self._field is not None:
+                    # 值为标量的字段在filters对象结束时完成
+                    self._emit_field(self._field[:-1], events)
+                self._depth -= 1
+                if self._depth == 2 and self._field is not None:
+                    self._emit_field(self._field, events)
+                elif self._depth == 1:
+                    self._in_filters = False
+                elif self._depth == 0 and self._started:
+                    self._finish(events)
+                    break
+            elif char == "," and self._depth == 2 and self._field is not None:
+                self._emit_field(self._field[:-1], events)
+        return events
+
+    def _emit_field(self, chars: List[str], events: List[StreamEvent]):
+        self._field = None
+        field = self._loads("{" + "".join(chars) + "}")
+        if not isinstance(field, dict) or len(field) != 1:
+            return
+        (name, values), = field.items()
+        self.filters[name] = values
+        events.append(("filter_partial", {"field": name, "values": values}))
+
+    def _finish(self, events: List[StreamEvent]):
+        self.complete = True
+        filters_json = self.text.strip()
+        parsed = self._loads(filters_json)
+        if isinstance(parsed, dict):
+            events.append(("filters_final", parsed))
+        events.append(("filters_json", filters_json))
+
+    @staticmethod
+    def _loads(text: str):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            return None
+
+
+class FilterStreamParser:
+    """把LLM输出的文本片段解析为类型化事件：思考文本、标记、逐字段的筛选条件和最终筛选条件"""
+
+    def __init__(self, marker: str = MARKER):
+        self.matcher = MarkerMatcher(marker)
+        self.filter_parser = IncrementalFilterParser()
+
+    @property
+    def marker_found(self) -> bool:
+        return self.matcher.found
+
+    def feed(self, chunk: str) -> List[StreamEvent]:
+        """处理一个LLM输出片段，返回可以立即发送的事件"""
+        if self.matcher.found:
+            return self.filter_parser.feed(chunk)
+        thought, after_marker = self.matcher.feed(chunk)
+        events = [("thought", thought)] if thought else []
+        if after_marker is not None:
+            events.append(("marker", self.matcher.marker))
+            events.extend(self.filter_parser.feed(after_marker))
+        return events
+
+    def finish(self) -> List[StreamEvent]:
+        """流结束时返回剩余的事件：未匹配的思考文本，或未能完整解析的JSON文本"""
+        if not self.matcher.found:
+            pending = self.matcher.flush()
+            return [("thought", pending)] if pending else []
+        if not self.filter_parser.complete:
+            filters_json = self.filter_parser.text.strip()
+            if filters_json:
+                return [("filters_json", filters_json)]
+        return []
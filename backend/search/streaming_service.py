@@ -1,24 +1,29 @@
+import asyncio
 import os
 import json
-from openai import OpenAI # 使用 OpenAI 库
-from dotenv import load_dotenv
-
-load_dotenv() # 加载 .env 文件中的环境变量
-
-# 从环境变量获取API配置，不在代码中硬编码
-DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY")
-DASHSCOPE_BASE_URL = os.getenv("DASHSCOPE_BASE_URL")
-LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "qwen-plus") # 默认使用qwen-plus但优先使用环境变量
+import hashlib
+from openai import APIError
+from backend.search.llm_client import DASHSCOPE_API_KEY, DASHSCOPE_BASE_URL, LLM_MODEL_NAME, get_async_llm_client
+from backend.search.stream_fanout import StreamCoalescer, normalize_query
+from backend.search.stream_cache import FilterStreamCache, STREAM_CACHE_REPLAY
+from backend.search.prompt_builder import Encoder, FilterPromptBuilder
+from backend.search.stream_parser import STREAM_END, FilterStreamParser, sse_event, to_sse
 
 # 假设SIM_programs.json在backend目录下
 PROGRAM_DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'SIM_programs.json')
 
 AVAILABLE_FILTERS_INFO = {}
+FILTERS_VERSION = "" # AVAILABLE_FILTERS_INFO内容的哈希，用作AI筛选流缓存的版本
+_program_data_mtime = None # 加载时项目数据文件的修改时间，重新爬取后文件变化会触发重新加载
+_option_encoder = None # 裁剪筛选选项使用的文本编码器，None表示使用默认的字符三元组编码
+prompt_builder = None # 当前筛选选项对应的提示构建器
+_reload_lock = asyncio.Lock() # 保证文件变化后只重新加载一次筛选选项
 
 def load_program_data_for_llm():
     """加载项目数据并提取各筛选字段的唯一值，供LLM参考"""
-    global AVAILABLE_FILTERS_INFO
+    global AVAILABLE_FILTERS_INFO, FILTERS_VERSION, _program_data_mtime, prompt_builder
     try:
+        _program_data_mtime = os.path.getmtime(PROGRAM_DATA_PATH)
         with open(PROGRAM_DATA_PATH, 'r', encoding='utf-8') as f:
             data = json.load(f)
         AVAILABLE_FILTERS_INFO['discipline'] = sorted(list(set(p.get('discipline', '') for p in data if p.get('discipline'))))
@@ -27,7 +32,11 @@ def load_program_data_for_llm():
         AVAILABLE_FILTERS_INFO['academic_level'] = sorted(list(set(p.get('academic_level', '') for p in data if p.get('academic_level'))))
         AVAILABLE_FILTERS_INFO['programme_type'] = sorted(list(set(p.get('programme_type', '') for p in data if p.get('programme_type'))))
         AVAILABLE_FILTERS_INFO['fee_range'] = ["0-100000", "100000-150000", "150000-200000", "200000-999999999"]
-        print("Successfully loaded filter options for LLM.")
+        options = json.dumps(AVAILABLE_FILTERS_INFO, ensure_ascii=False, sort_keys=True)
+        FILTERS_VERSION = hashlib.sha256(options.encode('utf-8')).hexdigest()[:16]
+        # 固定的提示前缀和选项向量只在筛选选项变化时构建一次
+        prompt_builder = FilterPromptBuilder(AVAILABLE_FILTERS_INFO, _option_encoder)
+        print(f"Successfully loaded filter options for LLM (version {FILTERS_VERSION}).")
         return True
     except Exception as e:
         print(f"Error loading program data for LLM: {e}")
@@ -36,7 +45,65 @@ def load_program_data_for_llm():
 # 应用启动时加载一次数据
 load_program_data_for_llm()
 
-def get_llm_response_stream(query: str):
+def set_option_encoder(encoder: Encoder):
+    """设置裁剪筛选选项使用的文本编码器（如已加载的嵌入模型），并重新构建提示构建器"""
+    global _option_encoder, prompt_builder
+    _option_encoder = encoder
+    if AVAILABLE_FILTERS_INFO:
+        prompt_builder = FilterPromptBuilder(AVAILABLE_FILTERS_INFO, encoder)
+
+def _program_data_changed() -> bool:
+    """项目数据文件的修改时间是否与加载时不同"""
+    try:
+        return os.path.getmtime(PROGRAM_DATA_PATH) != _program_data_mtime
+    except OSError:
+        return False
+
+async def reload_filter_options_if_changed():
+    """项目数据文件在重新爬取后发生变化时，重新加载筛选选项并清除旧版本的缓存
+
+    重新加载需要读取数据文件并编码所有筛选选项，在线程中运行，不阻塞事件循环；
+    文件变化后同时到达的请求中只有一个执行重新加载，其余请求等待它完成后使用新的选项。
+    """
+    if not _program_data_changed():
+        return
+    async with _reload_lock:
+        # 等待锁期间其他请求可能已经完成了重新加载
+        if not _program_data_changed():
+            return
+        print("Program data changed, reloading filter options for LLM.")
+        await asyncio.to_thread(load_program_data_for_llm)
+        filter_stream_cache.invalidate_except(FILTERS_VERSION)
+
+# 相同查询的并发流式请求共享同一个上游LLM流
+llm_stream_coalescer = StreamCoalescer()
+# 完整的AI筛选响应按（筛选选项版本, 规范化查询）缓存
+filter_stream_cache = FilterStreamCache()
+
+async def get_llm_response_stream(query: str, replay: str = STREAM_CACHE_REPLAY):
+    """
+    获取查询的流式响应。
+    缓存中有当前筛选选项版本下相同（规范化后）查询的响应时，直接重放缓存；
+    相同查询正在进行中时，不再发起新的LLM调用，而是订阅进行中的流，并从头重放已经产生的事件。
+    query: 用户输入的搜索查询。
+    replay: 命中缓存时的返回方式，paced 按间隔重放思考过程，final 立即返回最终筛选条件。
+    """
+    await reload_filter_options_if_changed()
+    version = FILTERS_VERSION
+    query_key = normalize_query(query)
+
+    cached = filter_stream_cache.get(version, query_key)
+    if cached is not None:
+        print(f"Serving cached filter stream for query '{query}' (version {version}).")
+        async for event in cached.replay(replay):
+            yield event
+        return
+
+    source_factory = lambda: filter_stream_cache.record(version, query_key, _stream_llm_response(query))
+    async for event in llm_stream_coalescer.subscribe(f"{version}:{query_key}", source_factory):
+        yield event
+
+async def _stream_llm_response(query: str):
     """
     与LLM交互，获取流式响应。
     query: 用户输入的搜索查询。
@@ -53,157 +120,56 @@ def get_llm_response_stream(query: str):
         yield "data: <<STREAM_END>>\n\n"
         return
 
-    client = OpenAI(
-        api_key=DASHSCOPE_API_KEY,
-        base_url=DASHSCOPE_BASE_URL,
-    )
-
-    # 为每个筛选字段准备完整的选项列表的JSON字符串
-    filter_options_json = {}
-    for key in AVAILABLE_FILTERS_INFO:
-        filter_options_json[key] = AVAILABLE_FILTERS_INFO[key]
-    
-    filter_options_str = json.dumps(filter_options_json, ensure_ascii=False)
-
-    system_prompt_content = f"""
-你是一个智能课程筛选助手。
-你的任务是理解用户的查询，模拟一个清晰的思考过程，然后输出一个JSON对象，指明要应用的筛选条件。
-
-输出规则：
-1. 你的思考过程会以文本行的形式逐步输出。请在思考的逻辑断点处使用换行符（\n）来分隔不同的思考步骤或段落。
-2. 在思考过程完全结束后，你必须另起一行（或确保清晰分离）输出一个特殊标记：<END_OF_THOUGHTS>
-3. 在这个特殊标记之后，紧接着输出一个有效的、单行的、紧凑的JSON对象，这是你整个回复的最后一部分。不得在JSON对象之后添加任何其他文本或换行符。
-4. JSON对象的格式必须是：{{"filters": {{"field_name1": ["value1", "value2"], "field_name2": ["value3"]}} }}。
-   - field_name 必须是下面提供的可用筛选字段之一。
-   - value 必须是对应字段的合理值，且必须严格从提供的选项列表中选择，不要创造不存在的值。
-   - 如果某个筛选字段不适用，请不要在JSON中包含该字段。
-
-5. 非常重要：你只能使用系统提供的实际存在的筛选值选项。不要创建或推断不存在的选项值。
-
-请注意标记 <END_OF_THOUGHTS> 必须完整地出现在你的回答中，不要分割这个标记。
-"""
-
-    user_prompt_content = f"""
-用户的查询是："{query}"。
-
-以下是完整的筛选字段及其所有可用选项：
-{filter_options_str}
-
-你必须严格从这些选项中进行选择。如果用户查询的意图在现有选项中找不到完全匹配，请选择最接近的选项或不应用该筛选字段。
-
-现在，开始你的思考过程，并在思考结束后严格按照上述规则输出特殊标记和JSON：
-"""
-    
-    messages = [
-        {"role": "system", "content": system_prompt_content},
-        {"role": "user", "content": user_prompt_content}
-    ]
-    print(f"Sending prompt to LLM for query '{query}':\nSystem: {system_prompt_content}\nUser: {user_prompt_content}\n")
-
-    # For handling marker detection across chunks
-    thinking_buffer = ""
-    thinking_process_ended = False
-    json_buffer = ""
-    MARKER = "<END_OF_THOUGHTS>"
+    # 所有请求共享同一个异步客户端和连接池
+    client = get_async_llm_client()
+
+    # 固定前缀（输出规则和完整选项）+ 按查询裁剪后的候选选项
+    # 裁剪选项需要编码查询，在线程中运行，不阻塞事件循环上的其他流
+    messages, token_stats = await asyncio.to_thread(prompt_builder.build_messages, query)
+    print(f"Sending prompt to LLM for query '{query}':\nUser: {messages[1]['content']}\n")
+    print(f"Prompt tokens (estimated) for query '{query}': prefix {token_stats['prefix_tokens']}, "
+          f"dynamic {token_stats['dynamic_tokens']}, total {token_stats['total_tokens']} "
+          f"(all options inline: {token_stats['full_catalogue_tokens']})")
+
+    # 思考文本、标记和筛选JSON的增量解析，每个片段的处理量与片段长度成正比
+    parser = FilterStreamParser()
+    chunk_count = 0
 
     try:
-        stream = client.chat.completions.create(
+        stream = await client.chat.completions.create(
             model=LLM_MODEL_NAME,
             messages=messages,
             stream=True,
+            stream_options={"include_usage": True},
             temperature=0.3, 
         )
         
-        for chunk in stream:
+        async for chunk in stream:
+            if chunk.usage:
+                # 最后一个块包含实际的token用量，cached_tokens为命中服务端提示缓存的部分
+                details = getattr(chunk.usage, "prompt_tokens_details", None)
+                cached_tokens = getattr(details, "cached_tokens", None) if details else None
+                print(f"<<<LLM_USAGE>>>: prompt {chunk.usage.prompt_tokens}, completion {chunk.usage.completion_tokens}, "
+                      f"cached {cached_tokens}")
+
             if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
-                content = chunk.choices[0].delta.content
-                print(f"<<<LLM_CHUNK_RAW>>>: ---{content}---")
-
-                if not thinking_process_ended:
-                    # Add new content to buffer for marker detection
-                    thinking_buffer += content
-                    
-                    # Check for marker in buffer
-                    marker_pos = thinking_buffer.find(MARKER)
-                    
-                    if marker_pos != -1:
-                        thinking_process_ended = True
-                        
-                        # Part before the marker is thinking process
-                        before_marker = thinking_buffer[:marker_pos]
-                        if before_marker:
-                            print(f"<<<SSE_YIELDING (thinking/buffer)>>>: ---{before_marker}---")
-                            yield f"data: {before_marker}\n\n"
-                        
-                        # Yield the marker itself as a special signal
-                        print(f"<<<SSE_YIELDING (marker)>>>: ---{MARKER}---")
-                        yield f"data: {MARKER}\n\n"
-                        
-                        # Part after the marker in buffer is start of JSON
-                        after_marker = thinking_buffer[marker_pos + len(MARKER):]
-                        if after_marker: 
-                            json_buffer += after_marker
-                            print(f"<<<JSON_BUFFER_INIT>>>: ---{json_buffer}---")
-                        
-                        # Clear thinking buffer since we've processed it
-                        thinking_buffer = ""
-                    else:
-                        # No marker yet, check if buffer is getting large
-                        # Keep last 20 chars in case marker starts but not complete
-                        if len(thinking_buffer) > 100: 
-                            to_yield = thinking_buffer[:-20]  # Keep last 20 chars in buffer
-                            print(f"<<<SSE_YIELDING (thinking/partial)>>>: ---{to_yield}---")
-                            yield f"data: {to_yield}\n\n"
-                            thinking_buffer = thinking_buffer[-20:]  # Keep potential start of marker
-                else:
-                    # Thinking process ended, accumulate JSON
-                    json_buffer += content
-                    print(f"<<<JSON_BUFFER_APPEND>>>: ---{json_buffer}---")
-            
-            elif chunk.choices and chunk.choices[0].finish_reason == "stop":
-                print("<<<LLM_FINISH_REASON>>>: stop")
-                break 
-        
-        # After all chunks are processed, yield any remaining content in thinking buffer
-        if not thinking_process_ended and thinking_buffer:
-            print(f"<<<SSE_YIELDING (thinking/final)>>>: ---{thinking_buffer}---")
-            yield f"data: {thinking_buffer}\n\n"
-        
-        # Send JSON if marker was found
-        if thinking_process_ended and json_buffer.strip():
-            final_json_payload = json_buffer.strip()
-            print(f"<<<SSE_YIELDING (json_payload)>>>: ---{final_json_payload}---")
-            yield f"data: {final_json_payload}\n\n"
-        elif thinking_process_ended and not json_buffer.strip():
-            print("<<<WARNING>>>: Thinking process ended (marker found) but JSON buffer is empty.")
-        elif not thinking_process_ended:
-            # If we processed all chunks and never found the marker
-            # Do one last check on the entire buffer just in case
-            marker_pos = thinking_buffer.find(MARKER)
-            if marker_pos != -1:
-                print("<<<INFO>>>: Found marker in final buffer check.")
-                # Similar processing as in main loop
-                before_marker = thinking_buffer[:marker_pos]
-                after_marker = thinking_buffer[marker_pos + len(MARKER):]
-                
-                if before_marker:
-                    print(f"<<<SSE_YIELDING (thinking/last-buffer)>>>: ---{before_marker}---")
-                    yield f"data: {before_marker}\n\n"
-                
-                print(f"<<<SSE_YIELDING (marker/last)>>>: ---{MARKER}---")
-                yield f"data: {MARKER}\n\n"
-                
-                if after_marker:
-                    json_buffer = after_marker.strip() 
-                    print(f"<<<SSE_YIELDING (json_payload/last)>>>: ---{json_buffer}---")
-                    yield f"data: {json_buffer}\n\n"
-            else:
-                print("<<<WARNING>>>: Stream ended but <END_OF_THOUGHTS> marker was not found.")
+                chunk_count += 1
+                for event in parser.feed(chunk.choices[0].delta.content):
+                    yield to_sse(event)
 
-        yield "data: <<STREAM_END>>\n\n"
-        print("<<<SSE_YIELDING (stream_end_signal)>>>: ---<<STREAM_END>>---")
+        for event in parser.finish():
+            yield to_sse(event)
+
+        if not parser.marker_found:
+            print("<<<WARNING>>>: Stream ended but <END_OF_THOUGHTS> marker was not found.")
+        elif not parser.filter_parser.complete:
+            print("<<<WARNING>>>: Thinking process ended (marker found) but JSON is empty or incomplete.")
+        print(f"<<<LLM_STREAM_DONE>>>: query '{query}', {chunk_count} chunks, "
+              f"filters {json.dumps(parser.filter_parser.filters, ensure_ascii=False)}")
+
+        yield sse_event(STREAM_END)
 
-    except OpenAI.APIError as e:
+    except APIError as e:
         error_message = f"OpenAI API Error: {str(e)}"
         print(error_message)
         yield f"data: Error: {error_message}\n\n"
@@ -0,0 +1,224 @@
+"""预分叉多工作进程服务
+
+父进程加载一次嵌入模型和只读索引（嵌入矩阵以mmap方式映射快照文件），创建监听套接字后fork出多个工作进程。
+工作进程以写时复制的方式共享父进程的模型权重和索引内存，各自运行一个Hypercorn事件循环，从同一个套接字接受连接。
+
+    python -m backend.serve --workers 4 --bind 0.0.0.0:5000
+
+信号：SIGTERM/SIGINT 停止所有工作进程后退出；SIGHUP 重新加载模型和索引（/api/init 同步数据之后由工作进程发送），
+先启动新一代工作进程，再停止旧的工作进程（旧进程处理完进行中的请求后退出）。
+异常退出的工作进程会被自动重新创建；启动后很快就退出的进程按指数退避重新创建，
+当前一代连续 SERVE_MAX_QUICK_FAILURES 次快速失败（如缺少依赖、绑定失败）时停止服务。
+"""
+import argparse
+import asyncio
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", str(os.cpu_count() or 1)))
+SERVE_BIND = os.getenv("SERVE_BIND", "0.0.0.0:5000")
+# 每个工作进程的推理线程数（PyTorch或ONNX Runtime），默认按CPU核数平均分配，避免多个进程的线程互相争抢
+SERVE_ENCODER_THREADS = int(os.getenv("SERVE_ENCODER_THREADS", "0"))
+SERVE_BACKLOG = 2048
+# 工作进程的重启退避：运行不到 SERVE_MIN_UPTIME 秒就退出算一次快速失败，
+# 第n次连续快速失败后等待 SERVE_RESTART_BACKOFF × 2^(n-1) 秒（不超过 SERVE_MAX_RESTART_BACKOFF）再重新创建
+SERVE_MIN_UPTIME = float(os.getenv("SERVE_MIN_UPTIME", "10"))
+SERVE_RESTART_BACKOFF = float(os.getenv("SERVE_RESTART_BACKOFF", "0.5"))
+SERVE_MAX_RESTART_BACKOFF = float(os.getenv("SERVE_MAX_RESTART_BACKOFF", "30"))
+SERVE_MAX_QUICK_FAILURES = int(os.getenv("SERVE_MAX_QUICK_FAILURES", "5"))
+
+
+def create_listening_socket(bind: str) -> socket.socket:
+    """创建所有工作进程共享的监听套接字"""
+    host, port = bind.rsplit(':', 1)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, int(port)))
+    sock.listen(SERVE_BACKLOG)
+    sock.set_inheritable(True)
+    return sock
+
+
+def build_app(preload: bool = True):
+    """创建应用，并在父进程中预加载嵌入模型和只读索引"""
+    from backend.app import create_app
+    app = create_app()
+    if preload:
+        try:
+            app.extensions["search_services"].preload()
+        except Exception as e:
+            # 预加载失败时由每个工作进程自行加载（并在失败时保持未就绪）
+            print(f"Error preloading search services: {e}")
+    # 把父进程已有的对象移出垃圾回收的跟踪，工作进程的垃圾回收不会写入这些对象所在的内存页
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def run_worker(app, sock: socket.socket, encoder_threads: int) -> None:
+    """工作进程：在继承的监听套接字上运行Hypercorn"""
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+
+    # 不继承父进程的信号处理函数，停止信号由事件循环处理
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    if encoder_threads > 0:
+        from encoder_backend import set_encoder_threads
+        set_encoder_threads(encoder_threads)
+    # /api/init 同步数据后通知父进程重新加载所有工作进程，而不是只重新加载处理请求的进程
+    app.extensions["search_services"].reload_parent = os.getppid()
+
+    config = Config()
+    config.bind = [f"fd://{sock.fileno()}"]
+    config.accesslog = None
+
+    async def main():
+        shutdown = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, shutdown.set)
+        await serve(app, config, shutdown_trigger=shutdown.wait)
+
+    asyncio.run(main())
+
+
+class PreforkServer:
+    """父进程：管理一代工作进程，负责重新创建退出的进程、重新加载和停止"""
+
+    def __init__(self, sock: socket.socket, workers: int, encoder_threads: int, preload: bool = True):
+        self.sock = sock
+        self.workers = workers
+        self.encoder_threads = encoder_threads
+        self.preload = preload
+        self.app = None
+        self.children = {} # pid -> 所属的代
+        self.started_at = {} # pid -> 启动时间
+        self.generation = 0
+        self.stopping = False
+        self.reload_requested = False
+        self.quick_failures = 0 # 当前一代连续快速失败的次数
+        self.restart_at = [] # 等待退避结束后重新创建工作进程的时间
+        self.exit_code = 0
+
+    def spawn(self) -> int:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.app, self.sock, self.encoder_threads)
+            except BaseException as e:
+                print(f"Worker {os.getpid()} failed: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = self.generation
+        self.started_at[pid] = time.monotonic()
+        return pid
+
+    def start_generation(self) -> None:
+        """加载模型和索引并启动一代新的工作进程"""
+        self.generation += 1
+        self.quick_failures = 0
+        self.restart_at = []
+        self.app = build_app(self.preload)
+        pids = [self.spawn() for _ in range(self.workers)]
+        print(f"Started {self.workers} workers (generation {self.generation}): {pids}")
+
+    def signal_children(self, signum: int, generation=None) -> None:
+        for pid, child_generation in list(self.children.items()):
+            if generation is None or child_generation == generation:
+                try:
+                    os.kill(pid, signum)
+                except ProcessLookupError:
+                    pass
+
+    def handle_stop(self, signum, frame) -> None:
+        self.stopping = True
+        self.restart_at = []
+        self.signal_children(signal.SIGTERM)
+
+    def handle_reload(self, signum, frame) -> None:
+        self.reload_requested = True
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+        self.start_generation()
+
+        while self.children or self.restart_at:
+            if self.reload_requested and not self.stopping:
+                self.reload_requested = False
+                old_generation = self.generation
+                gc.unfreeze()
+                self.start_generation()
+                self.signal_children(signal.SIGTERM, old_generation)
+
+            now = time.monotonic()
+            if self.restart_at and not self.stopping:
+                due = [at for at in self.restart_at if at <= now]
+                self.restart_at = [at for at in self.restart_at if at > now]
+                for _ in due:
+                    self.spawn()
+
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid == 0:
+                time.sleep(0.2)
+                continue
+
+            generation = self.children.pop(pid, None)
+            started_at = self.started_at.pop(pid, now)
+            if not self.stopping and generation == self.generation:
+                self.schedule_restart(pid, status, time.monotonic() - started_at)
+        return self.exit_code
+
+    def schedule_restart(self, pid: int, status: int, uptime: float) -> None:
+        """安排重新创建退出的工作进程：快速失败时指数退避，连续快速失败过多时停止服务"""
+        if uptime < SERVE_MIN_UPTIME:
+            self.quick_failures += 1
+        else:
+            self.quick_failures = 0
+        if self.quick_failures >= SERVE_MAX_QUICK_FAILURES:
+            print(f"Worker {pid} exited with status {status} after {uptime:.1f}s; "
+                  f"{self.quick_failures} consecutive quick failures, stopping the server.")
+            self.exit_code = 1
+            self.handle_stop(signal.SIGTERM, None)
+            return
+        delay = 0.0
+        if self.quick_failures:
+            delay = min(SERVE_MAX_RESTART_BACKOFF, SERVE_RESTART_BACKOFF * 2 ** (self.quick_failures - 1))
+        print(f"Worker {pid} exited with status {status} after {uptime:.1f}s, restarting in {delay:.1f}s.")
+        self.restart_at.append(time.monotonic() + delay)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="预分叉多工作进程服务")
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS, help="工作进程数量")
+    parser.add_argument("--bind", default=SERVE_BIND, help="监听地址 host:port")
+    parser.add_argument("--encoder-threads", type=int, default=SERVE_ENCODER_THREADS,
+                        help="每个工作进程的推理线程数，0表示CPU核数/工作进程数")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="不在父进程中预加载，每个工作进程各自加载模型（用于对比内存占用）")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        sys.exit("预分叉模式需要支持fork的操作系统")
+
+    workers = max(1, args.workers)
+    encoder_threads = args.encoder_threads or max(1, (os.cpu_count() or 1) // workers)
+    sock = create_listening_socket(args.bind)
+    print(f"Listening on {args.bind} with {workers} workers ({encoder_threads} encoder threads each).")
+    sys.exit(PreforkServer(sock, workers, encoder_threads, preload=not args.no_preload).run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# 嵌入模块使用平铺导入（如 from vector_embedding import ...），与 backend/app.py 一样把所在目录加入模块搜索路径
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (os.path.dirname(BACKEND_DIR), os.path.join(BACKEND_DIR, 'embedding')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
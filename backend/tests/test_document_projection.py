@@ -0,0 +1,18 @@
+from document_projection import DISPLAY_PROJECTION, display_projection, parse_fields, text_projection
+
+
+def test_vector_subpaths_are_never_projected():
+    assert parse_fields("field_embeddings.program_name,embedding,embedding.0") is None
+    assert display_projection(["program_name", "field_embeddings.university"]) == {"program_name": 1}
+    assert text_projection(["field_embeddings.program_name"]) == {"_id": 1}
+
+
+def test_overlapping_and_invalid_paths_are_dropped():
+    assert parse_fields("fees.total, fees,university,university,a..b,$where,fees.") == ["fees", "university"]
+
+
+def test_default_projection_hides_internal_fields():
+    assert display_projection() == DISPLAY_PROJECTION
+    for field in ("embedding", "field_embeddings", "program_key", "content_hash", "document_hash"):
+        assert DISPLAY_PROJECTION[field] == 0
+    assert parse_fields("program_key,content_hash") is None
@@ -0,0 +1,47 @@
+import json
+import pytest
+from encoder_backend import EXPORT_META_FILE, ONNX_INT8_MODEL_FILE, TOKENIZER_FILE, OnnxEncoder, encoder_key
+from query_cache import QueryEmbeddingCache
+
+pytest.importorskip("onnxruntime")
+tokenizers = pytest.importorskip("tokenizers")
+
+
+@pytest.fixture
+def export_dir(tmp_path):
+    """只包含分词器和占位模型文件的导出目录（推理会话在第一次编码时才创建）"""
+    tokenizer = tokenizers.Tokenizer(tokenizers.models.WordLevel({"[PAD]": 0, "[UNK]": 1}, unk_token="[UNK]"))
+    tokenizer.save(str(tmp_path / TOKENIZER_FILE))
+    (tmp_path / ONNX_INT8_MODEL_FILE).write_bytes(b"")
+    return tmp_path
+
+
+def write_meta(export_dir, model_name):
+    (export_dir / EXPORT_META_FILE).write_text(json.dumps({"model_name": model_name}), encoding="utf-8")
+
+
+def test_onnx_encoder_accepts_the_exported_model(export_dir):
+    write_meta(export_dir, "BAAI/bge-base-en-v1.5")
+    encoder = OnnxEncoder("BAAI/bge-base-en-v1.5", str(export_dir), quantized=True)
+    assert encoder.model_name == "BAAI/bge-base-en-v1.5"
+
+
+@pytest.mark.parametrize("exported", ["BAAI/bge-small-en-v1.5", None])
+def test_onnx_encoder_rejects_another_or_unknown_model(export_dir, exported):
+    if exported is not None:
+        write_meta(export_dir, exported)
+    with pytest.raises(ValueError, match="export_onnx.py --model BAAI/bge-base-en-v1.5"):
+        OnnxEncoder("BAAI/bge-base-en-v1.5", str(export_dir), quantized=True)
+
+
+def test_query_cache_is_cleared_when_backend_or_quantization_changes():
+    cache = QueryEmbeddingCache()
+    keys = [encoder_key("m", "torch", use_fp16=True), encoder_key("m", "onnx", quantized=True),
+            encoder_key("m", "onnx", quantized=False)]
+    assert len(set(keys)) == 3
+    for key in keys:
+        cache.bind_model(key)
+        assert cache.get("query") is None
+        cache.get_or_encode("query", lambda text: [1.0, 0.0])
+    cache.bind_model(keys[-1])
+    assert cache.get("query") is not None
@@ -0,0 +1,51 @@
+import json
+import threading
+import pytest
+from backend.search import facet_index
+from backend.search.facet_index import FacetIndex
+
+PROGRAMS = [
+    {"program_name": "Accounting", "international_total_fee": {"fee_lower": 120000}},
+    {"program_name": "", "international_total_fee": {}},
+    {"program_name": "Business", "international_total_fee": {"fee_lower": 80000}},
+    {"program_name": "Computing", "international_total_fee": {"fee_lower": 150000}},
+]
+
+
+@pytest.mark.parametrize("sort_order, expected", [
+    ("ascend", ["Business", "Accounting", "Computing", ""]),
+    ("descend", ["Computing", "Accounting", "Business", ""]),
+])
+def test_missing_fees_sort_last_in_both_directions(sort_order, expected):
+    result = FacetIndex(PROGRAMS).query(sort_field="international_fee", sort_order=sort_order)
+    assert [item["program_name"] for item in result["items"]] == expected
+
+
+def test_missing_names_sort_last():
+    result = FacetIndex(PROGRAMS).query(sort_field="program_name", sort_order="descend")
+    assert [item["program_name"] for item in result["items"]] == ["Computing", "Business", "Accounting", ""]
+
+
+def test_concurrent_requests_build_the_index_once(tmp_path, monkeypatch):
+    data_path = tmp_path / "SIM_programs.json"
+    data_path.write_text(json.dumps(PROGRAMS), encoding="utf-8")
+    monkeypatch.setattr(facet_index, "PROGRAM_DATA_PATH", str(data_path))
+    monkeypatch.setattr(facet_index, "_facet_index", None)
+    builds = []
+    from_file = FacetIndex.from_file.__func__
+
+    def counting_from_file(cls, path):
+        builds.append(path)
+        return from_file(cls, path)
+
+    monkeypatch.setattr(FacetIndex, "from_file", classmethod(counting_from_file))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(facet_index.query_programs({}, 1, 10)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(builds) == 1
+    assert all(result["total"] == len(PROGRAMS) for result in results)
@@ -0,0 +1,41 @@
+import asyncio
+import threading
+import time
+from backend.search import streaming_service
+
+
+def test_changed_program_data_reloads_once_off_the_event_loop(tmp_path, monkeypatch):
+    data_path = tmp_path / "SIM_programs.json"
+    data_path.write_text("[]", encoding="utf-8")
+    loads = []
+
+    def slow_load():
+        loads.append(threading.current_thread())
+        time.sleep(0.1)
+        streaming_service._program_data_mtime = data_path.stat().st_mtime
+        return True
+
+    monkeypatch.setattr(streaming_service, "PROGRAM_DATA_PATH", str(data_path))
+    monkeypatch.setattr(streaming_service, "_program_data_mtime", None)
+    monkeypatch.setattr(streaming_service, "_reload_lock", asyncio.Lock())
+    monkeypatch.setattr(streaming_service, "load_program_data_for_llm", slow_load)
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            # 重新加载期间事件循环继续运行其他协程
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticking = asyncio.create_task(ticker())
+        await asyncio.gather(*[streaming_service.reload_filter_options_if_changed() for _ in range(8)])
+        ticking.cancel()
+        return ticks
+
+    ticks = asyncio.run(main())
+    assert len(loads) == 1
+    assert loads[0] is not threading.main_thread()
+    assert ticks > 3
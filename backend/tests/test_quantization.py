@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+from quantization import Int8VectorIndex, PQVectorIndex
+from vector_index import ExactVectorIndex
+
+
+def resident_index(count=64, dimension=16):
+    return ExactVectorIndex(list(range(count)), np.random.default_rng(0).standard_normal((count, dimension)))
+
+
+@pytest.mark.parametrize("index_class", [Int8VectorIndex, PQVectorIndex])
+def test_quantized_index_requires_a_snapshot_base(index_class):
+    with pytest.raises(ValueError, match="嵌入快照"):
+        index_class.build(resident_index())
+
+
+def test_quantized_index_builds_over_a_snapshot_base():
+    base = resident_index()
+    base.snapshot_version = "v1"
+    index = Int8VectorIndex.build(base)
+    ids, _ = index.search(base.matrix[3], top_k=1)
+    assert list(ids) == [3]
@@ -0,0 +1,163 @@
+"""并发搜索请求在事件循环中交错执行：编码和MongoDB读取期间不阻塞其他请求
+
+使用较慢的假编码器和假异步集合（底层为mongomock）模拟模型推理和数据库往返，
+N个并发搜索的总耗时应远小于逐个执行的 N × 单次延迟。
+"""
+import asyncio
+import time
+import mongomock
+import numpy as np
+import pytest
+from batch_encoder import MicroBatchEncoder
+from benchmark_llm_scoring import synthetic_documents
+from bm25_index import BM25Index
+from llm_weight_search import LLMDynamicWeightSearch
+from query_cache import QueryEmbeddingCache
+from search_executor import create_search_executor
+from vector_embedding import DEFAULT_FIELD_WEIGHTS, VectorEmbedding
+from vector_index import ExactVectorIndex
+
+DOCUMENTS = 200
+DIMENSION = 32
+ENCODE_DELAY = 0.05 # 假编码器每次（批量）编码的耗时
+READ_DELAY = 0.05 # 假集合每次查询的往返耗时
+CONCURRENT_CALLS = 16
+
+
+class Concurrency:
+    """记录同时处于某个阶段的调用数量"""
+
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+
+    def __enter__(self):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+
+    def __exit__(self, *exc):
+        self.active -= 1
+
+
+class SlowEncoder:
+    """每次调用耗时固定的编码器，按文本生成确定的向量"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, texts):
+        self.calls += 1
+        time.sleep(ENCODE_DELAY)
+        vectors = [np.random.default_rng(abs(hash(text)) % 2 ** 32).standard_normal(DIMENSION) for text in texts]
+        return np.asarray(vectors, dtype=np.float32)
+
+
+class SlowCursor:
+    def __init__(self, collection, cursor):
+        self.collection = collection
+        self.cursor = cursor
+
+    def limit(self, count):
+        self.cursor = self.cursor.limit(count)
+        return self
+
+    async def to_list(self, length=None):
+        with self.collection.readers:
+            await asyncio.sleep(READ_DELAY)
+            return list(self.cursor)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in await self.to_list():
+            yield doc
+
+
+class SlowAsyncCollection:
+    """模拟PyMongo异步集合：每次查询等待固定的往返时间，并记录同时进行的查询数量"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.readers = Concurrency()
+
+    def find(self, *args, **kwargs):
+        return SlowCursor(self, self.collection.find(*args, **kwargs))
+
+
+class FixedWeightCache:
+    """总是命中的权重缓存，搜索不调用LLM"""
+
+    def get(self, *args, **kwargs):
+        return dict(DEFAULT_FIELD_WEIGHTS)
+
+
+@pytest.fixture
+def services():
+    documents, embeddings = synthetic_documents(DOCUMENTS, DIMENSION)
+    collection = mongomock.MongoClient().db.programs
+    collection.insert_many([dict(doc) for doc in documents])
+    ids = [doc["_id"] for doc in documents]
+    encoder = SlowEncoder()
+    executor = create_search_executor(4)
+
+    processor = VectorEmbedding.__new__(VectorEmbedding)
+    processor.model = encoder
+    processor.query_cache = QueryEmbeddingCache()
+    processor.query_encoder = MicroBatchEncoder(encoder.encode)
+    processor.collection = collection
+    processor.async_collection = SlowAsyncCollection(collection)
+    processor.executor = executor
+    processor.vector_index = ExactVectorIndex(ids, embeddings)
+    processor.ann_index = None
+    processor.keyword_index = BM25Index(ids, documents, DEFAULT_FIELD_WEIGHTS)
+    processor.atlas_search_available = False
+
+    llm_search = LLMDynamicWeightSearch(
+        encoder, collection, api_key="test", vector_index=processor.vector_index,
+        query_cache=processor.query_cache, keyword_index=processor.keyword_index,
+        weight_cache=FixedWeightCache(), query_encoder=processor.query_encoder,
+        async_collection=processor.async_collection, executor=executor
+    )
+    yield processor, llm_search, encoder
+    processor.query_encoder.close()
+    executor.shutdown(wait=True)
+
+
+def run_concurrently(search):
+    """并发执行CONCURRENT_CALLS次搜索（每次使用不同的查询），返回 (总耗时, 同时进行的最大调用数, 结果)"""
+    calls = Concurrency()
+
+    async def one(index):
+        with calls:
+            return await search(f"business analytics {index}")
+
+    async def main():
+        start = time.perf_counter()
+        results = await asyncio.gather(*[one(i) for i in range(CONCURRENT_CALLS)])
+        return time.perf_counter() - start, results
+
+    elapsed, results = asyncio.run(main())
+    return elapsed, calls.max_active, results
+
+
+@pytest.mark.parametrize("method", ["vector", "keyword", "llm"])
+def test_concurrent_searches_overlap(services, method):
+    processor, llm_search, encoder = services
+    search, per_call = {
+        "vector": (lambda query: processor.query_similar_documents_async(query, top_k=5), ENCODE_DELAY + READ_DELAY),
+        "keyword": (lambda query: processor.keyword_search_async(query, top_k=5), READ_DELAY),
+        # LLM搜索：编码一次，召回不读取集合（有倒排索引），最后取回展示字段
+        "llm": (lambda query: llm_search.search(query, top_k=5), ENCODE_DELAY + READ_DELAY),
+    }[method]
+
+    elapsed, max_calls, results = run_concurrently(search)
+
+    assert all(len(result) == 5 for result in results)
+    assert max_calls > 1
+    assert processor.async_collection.readers.max_active > 1
+    # 逐个执行至少需要 N × 单次延迟；交错执行时只比单次延迟多出少量排队时间
+    assert elapsed < CONCURRENT_CALLS * per_call / 4
+    if method != "keyword":
+        # 并发查询合并为少数几次批量编码
+        assert encoder.calls < CONCURRENT_CALLS
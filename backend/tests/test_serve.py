@@ -0,0 +1,38 @@
+import os
+import signal
+import socket
+import time
+import pytest
+from backend import serve
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="预分叉模式需要fork")
+
+
+@pytest.fixture
+def restore_signals():
+    handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP)}
+    yield
+    for signum, handler in handlers.items():
+        signal.signal(signum, handler)
+
+
+def test_workers_failing_at_startup_back_off_then_stop_the_server(monkeypatch, restore_signals):
+    def failing_worker(app, sock, encoder_threads):
+        raise ImportError("No module named 'hypercorn'")
+
+    monkeypatch.setattr(serve, "build_app", lambda preload: None)
+    monkeypatch.setattr(serve, "run_worker", failing_worker)
+    monkeypatch.setattr(serve, "SERVE_RESTART_BACKOFF", 0.1)
+    monkeypatch.setattr(serve, "SERVE_MAX_QUICK_FAILURES", 4)
+    spawned = []
+    server = serve.PreforkServer(socket.socket(), workers=1, encoder_threads=1)
+    spawn = server.spawn
+    monkeypatch.setattr(server, "spawn", lambda: spawned.append(time.monotonic()) or spawn())
+
+    start = time.monotonic()
+    assert server.run() == 1
+    # 第一次启动加3次退避后的重启（0.1、0.2、0.4秒），第4次快速失败后停止
+    assert len(spawned) == 4
+    gaps = [later - earlier for earlier, later in zip(spawned, spawned[1:])]
+    assert gaps[0] >= 0.1 and gaps[1] >= 0.2 and gaps[2] >= 0.4
+    assert time.monotonic() - start < 10
@@ -0,0 +1,59 @@
+import asyncio
+import pytest
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    async def main():
+        flight = SingleFlight()
+        calls = 0
+
+        async def upstream():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "weights"
+
+        results = await asyncio.gather(*[flight.do("q", upstream) for _ in range(5)])
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(main())
+    assert calls == 1
+    assert results == ["weights"] * 5
+    assert flight.stats() == {"in_flight": 0, "executed": 1, "coalesced": 4}
+
+
+@pytest.mark.parametrize("cancelled", [0, 1])
+def test_cancelled_caller_does_not_cancel_others(cancelled):
+    """取消第一个发起调用的请求（0）或某个合并等待的请求（1），其他调用者仍得到结果"""
+    async def main():
+        flight = SingleFlight()
+
+        async def upstream():
+            await asyncio.sleep(0.05)
+            return "weights"
+
+        tasks = [asyncio.create_task(flight.do("q", upstream)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        tasks[cancelled].cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return flight, results
+
+    flight, results = asyncio.run(main())
+    assert isinstance(results[cancelled], asyncio.CancelledError)
+    assert [result for i, result in enumerate(results) if i != cancelled] == ["weights", "weights"]
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_upstream_error_reaches_every_caller():
+    async def main():
+        flight = SingleFlight()
+
+        async def upstream():
+            await asyncio.sleep(0.01)
+            raise ValueError("llm failed")
+
+        return await asyncio.gather(*[flight.do("q", upstream) for _ in range(3)], return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
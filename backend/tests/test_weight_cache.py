@@ -0,0 +1,41 @@
+import numpy as np
+from weight_cache import LLMWeightCache
+
+WEIGHTS = {"program_name": 3.0}
+
+
+def vector(seed):
+    return np.random.default_rng(seed).standard_normal(16).astype(np.float32)
+
+
+def test_hits_in_one_worker_keep_other_workers_semantic_matrix(tmp_path):
+    path = str(tmp_path / "weights.sqlite3")
+    writer = LLMWeightCache(path, touch_interval=0)
+    reader = LLMWeightCache(path)
+    writer.put("business analytics", "llm", WEIGHTS, vector(0), "encoder")
+    writer.put("computer science", "llm", WEIGHTS, vector(1), "encoder")
+
+    assert reader.get("unrelated", "llm", vector(2), "encoder") is None
+    matrix = reader._semantic_entries[("encoder", "llm")][1]
+
+    # 另一个工作进程的命中（并立即写回最近使用时间）不会使语义层重新加载
+    assert writer.get("business analytics", "llm", vector(0), "encoder") == WEIGHTS
+    assert reader.get("unrelated", "llm", vector(2), "encoder") is None
+    assert reader._semantic_entries[("encoder", "llm")][1] is matrix
+
+    # 新增条目后重新加载
+    writer.put("nursing diploma", "llm", WEIGHTS, vector(3), "encoder")
+    assert reader.get("unrelated", "llm", vector(2), "encoder") is None
+    assert len(reader._semantic_entries[("encoder", "llm")][0]) == 3
+
+
+def test_batched_touches_still_drive_lru_eviction(tmp_path):
+    cache = LLMWeightCache(str(tmp_path / "weights.sqlite3"), max_size=2, touch_interval=3600)
+    cache.put("first", "llm", WEIGHTS)
+    cache.put("second", "llm", WEIGHTS)
+    assert cache.get("first", "llm") == WEIGHTS
+    cache.put("third", "llm", WEIGHTS)
+
+    assert cache.get("first", "llm") == WEIGHTS
+    assert cache.get("second", "llm") is None
+    assert len(cache) == 2
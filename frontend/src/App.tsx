@@ -30,6 +30,21 @@ interface FilterOptions {
   feeRanges: { text: string; value: string }[];
 }
 
+// 服务端筛选接口返回的分面计数
+interface FacetCount {
+  value: string;
+  count: number;
+}
+
+// 服务端筛选接口的返回结果：当前页的项目和各筛选字段的分面计数
+interface ProgramsPage {
+  total: number;
+  page: number;
+  page_size: number;
+  items: ProgramData[];
+  facets: Record<keyof FilterState, FacetCount[]>;
+}
+
 // 排序状态接口
 interface SortState {
   field: string | null;
@@ -173,6 +188,51 @@ class FilterService {
     });
   }
 
+  // 向服务端请求筛选后的一页数据和各筛选字段的分面计数
+  static async fetchProgramsPage(
+    searchText: string,
+    filterState: FilterState,
+    page: number,
+    pageSize: number,
+    sortField: string | null,
+    sortOrder: 'ascend' | 'descend' | null
+  ): Promise<ProgramsPage> {
+    const params = new URLSearchParams();
+    if (searchText) {
+      params.append('query', searchText);
+    }
+    (Object.keys(filterState) as (keyof FilterState)[]).forEach(key => {
+      filterState[key].forEach(value => params.append(key, value));
+    });
+    params.append('page', String(page));
+    params.append('page_size', String(pageSize));
+    if (sortField && sortOrder) {
+      params.append('sort_field', sortField);
+      params.append('sort_order', sortOrder);
+    }
+
+    const response = await fetch(`http://localhost:5000/api/programs?${params.toString()}`);
+    if (!response.ok) {
+      throw new Error(`API错误: ${response.status}`);
+    }
+    return response.json();
+  }
+
+  // 由服务端的分面计数生成筛选选项（计数已排除各字段自身的筛选条件）
+  static buildFilterOptionsFromFacets(facets: ProgramsPage['facets']): FilterOptions {
+    const toOptions = (counts: FacetCount[], label: (value: string) => string = value => value) =>
+      counts.map(({ value, count }) => ({ text: `${label(value)} (${count})`, value }));
+
+    return {
+      disciplines: toOptions(facets.discipline),
+      subDisciplines: toOptions(facets.sub_discipline),
+      universities: toOptions(facets.university),
+      academicLevels: toOptions(facets.academic_level),
+      programmeTypes: toOptions(facets.programme_type),
+      feeRanges: toOptions(facets.fee_range, value => FEE_LABELS[value] || value)
+    };
+  }
+
   // 计算排除特定筛选条件后的数据集
   static calculateFilteredDataExcluding(
     data: ProgramData[],
@@ -536,7 +596,9 @@ const generateColumns = (
 
 const App: React.FC = () => {
   const [loading, setLoading] = useState<boolean>(true);
-  const [data, setData] = useState<ProgramData[]>([]);
+  const [vectorResults, setVectorResults] = useState<ProgramData[]>([]);
+  const [totalCount, setTotalCount] = useState<number>(0);
+  const [facetOptions, setFacetOptions] = useState<FilterOptions | null>(null);
   const [filteredData, setFilteredData] = useState<ProgramData[]>([]);
   const [searchText, setSearchText] = useState<string>('');
   const [selectedProgram, setSelectedProgram] = useState<ProgramData | null>(null);
@@ -570,21 +632,6 @@ const App: React.FC = () => {
     pageSize: 10,
   });
 
-  // 加载数据
-  useEffect(() => {
-    fetch('/SIM_programs.json')
-      .then(response => response.json())
-      .then(data => {
-        setData(data);
-        setFilteredData(data);
-        setLoading(false);
-      })
-      .catch(error => {
-        console.error('Error fetching data:', error);
-        setLoading(false);
-      });
-  }, []);
-
   // 处理筛选条件变化，仅当变化时重置页码
   useEffect(() => {
     // 将当前筛选条件序列化为字符串，便于比较
@@ -607,79 +654,71 @@ const App: React.FC = () => {
     prevSearchTextRef.current = searchText;
   }, [filteredInfo, searchText, pagination.current]);
   
-  // 处理数据过滤和排序
+  // 处理数据过滤和排序：关键词/AI搜索模式由服务端筛选并分页，语义搜索模式在返回的结果集上筛选
   useEffect(() => {
     console.log("===== 数据筛选 useEffect 触发 =====");
-    console.log("触发原因: searchText, filteredInfo, sortInfo, isLLMSearch 或 isAIStreaming 变化");
     console.log(`isAIStreaming: ${isAIStreaming}`);
     console.log(`isLLMSearch: ${isLLMSearch}`);
     console.log(`筛选条件:`, JSON.stringify(filteredInfo, null, 2));
     console.log(`搜索文本: "${searchText}"`);
     
     // 流式处理进行中时不应用筛选（因为数据还在生成中）
-    if (!isAIStreaming) {
-      console.log("应用筛选逻辑");
-
-      // 如果是LLM搜索模式，并且AI返回了具体的筛选条件 (filteredInfo 不是初始状态),
-      // 则不使用searchText进行关键词过滤，因为AI的筛选条件已经包含了用户的意图。
-      // 否则，使用searchText进行关键词过滤 (适用于普通搜索，或LLM未返回有效筛选条件的情况)。
-      const keywordFilterText = (isLLMSearch && JSON.stringify(filteredInfo) !== JSON.stringify(INITIAL_FILTER_STATE))
-                               ? '' 
-                               : searchText;
-      
-      if (isLLMSearch && JSON.stringify(filteredInfo) !== JSON.stringify(INITIAL_FILTER_STATE)) {
-        console.log("LLM搜索模式且有AI筛选条件，关键词搜索将使用空字符串。");
-      } else {
-        console.log(`将使用关键词: "${keywordFilterText}" 进行过滤。`);
-      }
+    if (isAIStreaming) {
+      console.log("流式处理进行中，跳过筛选逻辑");
+      return;
+    }
 
-      // 使用筛选服务应用所有筛选条件
-      let result = FilterService.applyFilters(data, keywordFilterText, filteredInfo);
-      
-      // 应用排序
+    if (isVectorSearch) {
+      let result = FilterService.applyFilters(vectorResults, '', filteredInfo);
       if (sortInfo.field && sortInfo.order) {
-        console.log(`应用排序: ${sortInfo.field} ${sortInfo.order}`);
         result = FilterService.applySorter(result, sortInfo.field, sortInfo.order);
       }
-      
-      // 更新筛选后的数据
-      console.log(`筛选后数据数量: ${result.length}`);
       setFilteredData(result);
-    } else {
-      console.log("流式处理进行中，跳过筛选逻辑");
+      return;
     }
-    console.log("====================================");
-  }, [data, searchText, filteredInfo, sortInfo, isAIStreaming, isLLMSearch]);
 
-  // 生成动态筛选器选项，基于当前筛选结果
-  const filterOptions = useMemo(() => {
-    console.log("===== filterOptions useMemo 触发 =====");
-    console.log(`当前筛选结果数量: ${filteredData.length}`);
-    
-    // 始终显示所有可用选项，无论是否有筛选结果
-    // 这确保了无论是AI筛选还是手动筛选，筛选菜单中始终显示所有可用选项
-    const showAllOptions = true;
-    console.log(`是否显示全部选项: ${showAllOptions}`);
-    
-    const options = FilterService.generateFilterOptions(
-      data, 
-      searchText, 
+    // 如果是LLM搜索模式，并且AI返回了具体的筛选条件 (filteredInfo 不是初始状态),
+    // 则不使用searchText进行关键词过滤，因为AI的筛选条件已经包含了用户的意图。
+    const keywordFilterText = (isLLMSearch && JSON.stringify(filteredInfo) !== JSON.stringify(INITIAL_FILTER_STATE))
+                             ? '' 
+                             : searchText;
+
+    // 忽略过期的响应，只应用最后一次请求的结果
+    let cancelled = false;
+    FilterService.fetchProgramsPage(
+      keywordFilterText,
       filteredInfo,
-      showAllOptions, 
-      data // 传入原始数据，用于生成所有可用选项
-    );
-    
-    console.log("生成的筛选选项数量:");
-    console.log(`- 学科: ${options.disciplines.length}`);
-    console.log(`- 子学科: ${options.subDisciplines.length}`);
-    console.log(`- 大学: ${options.universities.length}`);
-    console.log(`- 学术等级: ${options.academicLevels.length}`);
-    console.log(`- 项目类型: ${options.programmeTypes.length}`);
-    console.log(`- 费用范围: ${options.feeRanges.length}`);
-    console.log("====================================");
-    
-    return options;
-  }, [data, searchText, filteredInfo]);
+      pagination.current || 1,
+      pagination.pageSize || 10,
+      sortInfo.field,
+      sortInfo.order
+    )
+      .then(page => {
+        if (cancelled) return;
+        console.log(`服务端筛选结果: ${page.total}条记录，当前页${page.items.length}条`);
+        setFilteredData(page.items);
+        setTotalCount(page.total);
+        setFacetOptions(FilterService.buildFilterOptionsFromFacets(page.facets));
+      })
+      .catch(error => {
+        if (cancelled) return;
+        console.error('Error fetching programs:', error);
+        setSearchError(error instanceof Error ? error.message : String(error));
+      })
+      .finally(() => {
+        if (!cancelled) setLoading(false);
+      });
+
+    return () => {
+      cancelled = true;
+    };
+  }, [searchText, filteredInfo, sortInfo, pagination.current, pagination.pageSize, isAIStreaming, isLLMSearch, isVectorSearch, vectorResults]);
+
+  // 筛选器选项来自服务端的分面计数（包含所有取值，计数排除各字段自身的筛选条件）
+  const filterOptions = useMemo(
+    () => facetOptions || FilterService.getAllAvailableOptions(vectorResults),
+    [facetOptions, vectorResults]
+  );
   
   // 处理搜索
   const handleSearch = async (value: string, useVectorSearch: boolean = false, useLLMSearch: boolean = false) => {
@@ -691,10 +730,7 @@ const App: React.FC = () => {
       setSearchWeights(null);
       setAiThinkingProcess('');
       setSearchError(null);
-      // 重置为初始数据
-      if (data.length > 0) {
-        setFilteredData(data);
-      }
+      // 清空搜索文本后由服务端重新返回初始数据
       return;
     }
 
@@ -727,7 +763,8 @@ const App: React.FC = () => {
 
         if (streamData === "<<STREAM_END>>") {
           console.log(">>> FRONTEND Received <<STREAM_END>>. Final JSON buffer:", currentJsonBuffer, "End of thoughts received:", endOfThoughtsReceived, "JSON instruction received:", receivedJsonInstruction);
-          if (endOfThoughtsReceived && currentJsonBuffer.trim()) {
+          // 已通过filters_final事件应用筛选条件时不再重复解析最终JSON
+          if (!receivedJsonInstruction && endOfThoughtsReceived && currentJsonBuffer.trim()) {
             try {
               const parsedInstruction = JSON.parse(currentJsonBuffer.trim());
               console.log(">>> FRONTEND Parsed Instruction from final buffer:", parsedInstruction);
@@ -787,6 +824,38 @@ const App: React.FC = () => {
         }
       };
 
+      // 某个筛选字段的值一输出完整就立即应用，不必等待模型结束
+      eventSource.addEventListener('filter_partial', (event) => {
+        try {
+          const { field, values } = JSON.parse((event as MessageEvent).data);
+          if (Object.prototype.hasOwnProperty.call(INITIAL_FILTER_STATE, field) && Array.isArray(values)) {
+            console.log(`>>> FRONTEND Applying partial AI filter for field: ${field}`, values);
+            setFilteredInfo(prev => ({ ...prev, [field]: values }));
+          }
+        } catch (e) {
+          console.error(">>> FRONTEND Failed to parse filter_partial event:", e);
+        }
+      });
+
+      eventSource.addEventListener('filters_final', (event) => {
+        try {
+          const parsedInstruction = JSON.parse((event as MessageEvent).data);
+          if (parsedInstruction && parsedInstruction.filters) {
+            const aiFilters: Partial<FilterState> = {};
+            for (const key in parsedInstruction.filters) {
+              if (Object.prototype.hasOwnProperty.call(INITIAL_FILTER_STATE, key)) {
+                aiFilters[key as keyof FilterState] = parsedInstruction.filters[key];
+              }
+            }
+            setFilteredInfo({ ...INITIAL_FILTER_STATE, ...aiFilters });
+            receivedJsonInstruction = true;
+            console.log(">>> FRONTEND Applied final AI filters:", Object.keys(aiFilters).join(', '));
+          }
+        } catch (e) {
+          console.error(">>> FRONTEND Failed to parse filters_final event:", e);
+        }
+      });
+
       eventSource.onerror = (err) => {
         console.error("EventSource failed:", err);
         setSearchError("与AI服务连接失败。");
@@ -816,6 +885,7 @@ const App: React.FC = () => {
         
         // 更新搜索结果 - 在向量搜索模式下，API直接返回筛选后的结果集
         const vectorResults = data.results;
+        setVectorResults(vectorResults);
         
         // 保存权重信息（仅用于LLM搜索）
         if (useLLMSearch && data.weights) {
@@ -889,7 +959,9 @@ const App: React.FC = () => {
     
     // 处理排序
     if (sorter && 'field' in sorter) {
-      const { field, order } = sorter;
+      // 没有dataIndex的列（如国际生费用）以列的key作为排序字段
+      const { order } = sorter;
+      const field = sorter.field || sorter.columnKey;
       console.log(`更新排序: field=${field}, order=${order}`);
       setSortInfo({
         field: order ? field : null,
@@ -928,6 +1000,9 @@ const App: React.FC = () => {
     console.log("===============================");
   };
 
+  // 语义搜索模式在客户端分页，其余模式由服务端分页
+  const resultCount = isVectorSearch ? filteredData.length : totalCount;
+
   // 生成表格列
   const columns = useMemo(() => 
     generateColumns(filterOptions, filteredInfo, handleViewDetails),
@@ -987,13 +1062,13 @@ const App: React.FC = () => {
           ) : (
             <>
               <div style={{ marginBottom: 16 }}>
-                找到 {filteredData.length} 个项目
+                找到 {resultCount} 个项目
                 {isVectorSearch && <Tag color="blue" style={{ marginLeft: 8 }}>语义搜索</Tag>}
                 {isLLMSearch && !isAIStreaming && <Tag color="purple" style={{ marginLeft: 8 }}>智能搜索 (AI推荐)</Tag>}
                 {isLLMSearch && isAIStreaming && <Tag color="gold" style={{ marginLeft: 8 }}>AI 智能分析中...</Tag>}
               </div>
               
-              {filteredData.length === 0 && !loading && !searchLoading && Object.values(filteredInfo).some(arr => arr.length > 0) && (
+              {resultCount === 0 && !loading && !searchLoading && Object.values(filteredInfo).some(arr => arr.length > 0) && (
                 <div style={{ marginBottom: 16, padding: '16px', backgroundColor: '#fffbe6', border: '1px solid #ffe58f', borderRadius: '4px' }}>
                   <Typography.Text strong>
                     没有找到符合所有筛选条件的项目。
@@ -1021,7 +1096,7 @@ const App: React.FC = () => {
                 pagination={{
                   current: pagination.current,
                   pageSize: pagination.pageSize,
-                  total: filteredData.length,
+                  total: resultCount,
                   showSizeChanger: true,
                   showTotal: (total) => `共 ${total} 条记录`
                 }}